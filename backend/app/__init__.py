@@ -3,6 +3,7 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 import os
+import threading
 
 # Load environment variables
 load_dotenv()
@@ -19,7 +20,7 @@ def create_app():
  # Initialize extensions
     CORS(app, origins=["http://localhost:5173", "http://localhost:5175", "http://localhost:3000"], 
          supports_credentials=True, 
-         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+         methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
          allow_headers=["Content-Type", "Authorization"])
 
     JWTManager(app)
@@ -28,13 +29,57 @@ def create_app():
     from app.routes.auth import auth_bp
     from app.routes.upload import upload_bp
     from app.routes.medications import medications_bp
+    from app.routes.health_insights import health_insights_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(upload_bp, url_prefix='/api/upload')
     app.register_blueprint(medications_bp, url_prefix='/api/medications')
+    app.register_blueprint(health_insights_bp, url_prefix='/api/health-insights')
     
     @app.route('/api/health')
     def health_check():
         return {'status': 'healthy', 'message': 'Flask server is running'}
     
+    @app.route('/api/health/supabase')
+    def supabase_health():
+        # Retry, hedge and circuit breaker counters for Supabase calls
+        from app.services.supabase_service import supabase_resilience
+        return supabase_resilience.metrics()
+    
+    @app.route('/api/health/cache')
+    def shared_cache_health():
+        # Host-wide counters of the memory-mapped cache shared by all workers
+        from app.utils.shared_cache import get_shared_cache
+        cache = get_shared_cache()
+        return cache.stats() if cache else {'enabled': False}
+    
+    @app.route('/api/health/openai')
+    def openai_health():
+        # Slot usage, timeouts and rejections of the shared OpenAI client
+        from app.services.llm_client import get_llm_client
+        if not os.getenv('OPENAI_API_KEY'):
+            return {'enabled': False}
+        return get_llm_client().stats()
+    
+    @app.route('/api/health/reminders')
+    def reminders_health():
+        from app.services.reminder_scheduler import get_reminder_scheduler
+        if os.getenv('REMINDERS_ENABLED', 'false').lower() != 'true':
+            return {'enabled': False}
+        return get_reminder_scheduler().stats()
+    
+    # A medication index journal from an older extractor is rebuilt in the background
+    from app.routes.medications import rebuild_stale_medication_index
+    threading.Thread(target=rebuild_stale_medication_index, name='medication-index-rebuild', daemon=True).start()
+    
+    # One pooled OpenAI client per worker, created before the first request needs it
+    if os.getenv('OPENAI_API_KEY'):
+        from app.services.llm_client import get_llm_client
+        get_llm_client()
+    
+    # Server-side dose reminders; one worker per host schedules, the others stand by
+    if os.getenv('REMINDERS_ENABLED', 'false').lower() == 'true':
+        from app.services.reminder_scheduler import get_reminder_scheduler
+        get_reminder_scheduler().start()
+    
     return app
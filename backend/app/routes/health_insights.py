@@ -1,17 +1,330 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 import openai
 import os
+import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+from app.services.health_insights_service import document_fingerprint, compact_document, estimate_tokens, JsonArrayStream
+from app.services.insight_rules import rule_based_insights
+from app.services.llm_client import get_llm_client, LLMBusyError
+from app.services.model_router import get_model_router
+from app.services.supabase_service import SupabaseService
+from app.services.insight_batch import InsightBatchJob, submit_batch_job, get_batch_snapshot, get_openai_rate_limiter
+from app.utils.shared_cache import get_shared_cache
 
 # Load environment variables
 load_dotenv()
 
 health_insights_bp = Blueprint('health_insights', __name__)
+supabase_service = SupabaseService()
 
 # Configure OpenAI
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+# Generated responses are cached per document fingerprint in the shared result
+# cache; bump the version when prompts change so old answers are not served
+RESPONSE_CACHE_VERSION = 3
+RESPONSE_CACHE_TTL = int(os.getenv('INSIGHTS_CACHE_TTL_SECONDS', 24 * 3600))
+_cache_counters = {'insights': {'hits': 0, 'misses': 0}, 'recommendations': {'hits': 0, 'misses': 0}}
+_cache_counters_lock = threading.Lock()
+
+# Documents are embedded in prompts as compact JSON within this token budget
+PROMPT_DOCUMENT_MAX_TOKENS = int(os.getenv('INSIGHTS_PROMPT_MAX_TOKENS', 1500))
+_prompt_counters = {'prompts': 0, 'original_tokens': 0, 'tokens': 0, 'saved_tokens': 0, 'truncated': 0}
+_prompt_counters_lock = threading.Lock()
+
+# Size of the prompt text around the document, for rate limiting by tokens;
+# the model and answer length limit come from the document's routing tier
+PROMPT_TEMPLATE_TOKENS = 600
+
+# Batch generation (POST /batch-insights)
+BATCH_MAX_DOCUMENTS = int(os.getenv('INSIGHTS_BATCH_MAX_DOCUMENTS', 500))
+BATCH_CONCURRENCY = int(os.getenv('INSIGHTS_BATCH_CONCURRENCY', 4))
+
+# Generate insights right after an upload is stored (upload_pdf), so the first
+# view reads them instead of waiting for the model
+PRECOMPUTE_INSIGHTS = os.getenv('PRECOMPUTE_INSIGHTS', 'false').lower() == 'true'
+_precompute_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='insights-precompute')
+_precompute_counters = {'queued': 0, 'stored': 0, 'skipped': 0, 'failed': 0}
+
+# Keep proxies from buffering streamed insights
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# Runs the generations of /get-health-summary side by side; LLM slots are
+# still bounded by the shared client
+_generation_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('OPENAI_MAX_CONCURRENCY', 8)),
+    thread_name_prefix='health-summary'
+)
+
+def _response_cache_key(kind, data):
+    return f"health-insights:{kind}:v{RESPONSE_CACHE_VERSION}:{document_fingerprint(data)}"
+
+def _cached_response(kind, key):
+    """
+    Cached response data for key, or None; counts the hit or miss for kind
+    """
+    cache = get_shared_cache()
+    cached = cache.get(key) if cache is not None else None
+    with _cache_counters_lock:
+        _cache_counters[kind]['hits' if cached is not None else 'misses'] += 1
+    return cached
+
+def _store_response(key, response_data):
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.set(key, response_data, ttl=RESPONSE_CACHE_TTL)
+
+def _insights_request(data, tier):
+    """
+    chat.completions.create arguments asking for insights on one document,
+    with the model and answer length of its routing tier
+    """
+    # Create a prompt for OpenAI to generate health insights
+    prompt = f"""
+    Based on the following medical document data, generate 5-7 health insights that are specifically designed for the PATIENT to understand their health information.
+    
+    Document Data:
+    {_document_text(data)}
+    
+    Please provide insights in the following JSON format:
+    {{
+        "insights": [
+            {{
+                "title": "Brief Phrase Title",
+                "description": "1-2 sentences explaining what this means for YOU as a patient"
+            }}
+        ]
+    }}
+    
+    IMPORTANT GUIDELINES:
+    
+    TITLES:
+    - Use simple, brief phrases (2-4 words max)
+    - NO words like "recommendations", "suggestions", "advice"
+    - Use plain language, not medical jargon
+    - Examples: "Blood Pressure Elevated", "New Medication Added", "Allergy Alert"
+    
+    DESCRIPTIONS:
+    - Keep to 1-2 sentences maximum
+    - Use simple, clear language
+    - Write directly TO the patient using "you" and "your"
+    - Explain what this information means for THEIR health
+    - Avoid overly technical medical terms
+    - Focus on what the patient needs to know about their own health
+    
+    PATIENT-FOCUSED APPROACH:
+    - Write as if explaining to a friend or family member
+    - Use "you" and "your" language
+    - Explain why this information matters to the patient personally
+    - Focus on what the patient should understand about their health
+    - Avoid clinical/medical perspective - think patient perspective
+    
+    Focus on:
+    - What your vital signs tell you about your health
+    - How medication changes affect you personally
+    - What allergies or safety concerns mean for you
+    - What your symptoms or findings indicate about your health
+    - What you should know or do next
+    """
+    
+    return dict(
+        model=tier['model'],
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a medical AI assistant that creates simple, clear health insights specifically for PATIENTS. Write directly TO the patient using 'you' and 'your' language. Always use plain language, avoid medical jargon, and keep titles brief (2-4 words) and descriptions concise (1-2 sentences). Never use words like 'recommendations' or 'suggestions' in titles. Think like you're explaining health information to a friend or family member."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        max_tokens=tier['max_tokens'],
+        temperature=0.2
+    )
+
+def _parse_insights(ai_response, data):
+    """
+    Insights data from the model's answer, or fallback insights if it is not
+    the expected JSON
+
+    Returns:
+        tuple: (insights data, source) where source is 'model', 'rules' when
+               the document rules answered, or 'placeholder' when no rule applied
+    """
+    # Try to parse the JSON response from AI
+    try:
+        import json
+        insights_data = json.loads(ai_response)
+        source = 'model'
+        
+        # Validate the structure
+        if 'insights' not in insights_data or not isinstance(insights_data['insights'], list):
+            # If AI didn't return proper JSON, create a fallback response
+            insights_data, source = _fallback_insights(data)
+    except json.JSONDecodeError:
+        # If JSON parsing fails, create a fallback response
+        insights_data, source = _fallback_insights(data)
+    return insights_data, source
+
+def _fallback_insights(data):
+    """
+    Rule-based insights for the document, or a generic placeholder if no
+    rule applies
+
+    Returns:
+        tuple: (insights data, 'rules' or 'placeholder')
+    """
+    insights = rule_based_insights(data)
+    if insights:
+        return {"insights": insights}, 'rules'
+    return {
+        "insights": [
+            {
+                "title": "Document Analysis Complete",
+                "description": "AI analysis completed. Please review the generated insights below."
+            }
+        ]
+    }, 'placeholder'
+
+def _rules_response(data, reason):
+    """
+    Response body answering from the document rules alone, or None if no
+    rule applies
+    """
+    insights = rule_based_insights(data)
+    if not insights:
+        return None
+    print(f"Health insights answered from document rules ({reason})")
+    return {
+        'success': True,
+        'message': 'Health insights generated from document rules',
+        'data': {'insights': insights},
+        'source': 'rules',
+        'fallback_reason': reason,
+        'cached': False
+    }
+
+def _rules_fallback(data, reason):
+    """
+    get-health-insights answer for when the model is unavailable (rate
+    limited, busy or timed out), or None to report the error instead
+    """
+    fallback = _rules_response(data, reason)
+    return (jsonify(fallback), 200) if fallback is not None else None
+
+def _rules_stream_fallback(data, reason):
+    """
+    Streaming counterpart of _rules_fallback
+    """
+    fallback = _rules_response(data, reason)
+    if fallback is None:
+        return None
+    return Response(_replay(fallback), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+def _unavailable_reason(error):
+    """
+    fallback_reason for an error meaning the model is unavailable right now
+    (rate limited, busy or timed out), or None for any other error
+    """
+    if isinstance(error, openai.RateLimitError):
+        return 'rate_limited'
+    if isinstance(error, LLMBusyError):
+        return 'busy'
+    if isinstance(error, openai.APITimeoutError):
+        return 'timeout'
+    return None
+
+def _replay(body):
+    """
+    Events of an already complete answer (cached or rule-based)
+    """
+    for insight in body['data']['insights']:
+        yield _sse('insight', insight)
+    yield _sse('done', body)
+
+def _document_text(data):
+    """
+    The document as it goes into a prompt; counts the tokens saved
+    """
+    compact = compact_document(data, max_tokens=PROMPT_DOCUMENT_MAX_TOKENS)
+    with _prompt_counters_lock:
+        _prompt_counters['prompts'] += 1
+        for field in ('original_tokens', 'tokens', 'saved_tokens'):
+            _prompt_counters[field] += compact[field]
+        _prompt_counters['truncated'] += bool(compact['dropped'])
+    print(f"Prompt document: ~{compact['tokens']} tokens (saved ~{compact['saved_tokens']})"
+          + (f", dropped {', '.join(compact['dropped'])}" if compact['dropped'] else ''))
+    return compact['text']
+
+def _route(data):
+    """
+    The model routing tier for a document
+    """
+    tier = get_model_router().route(data)
+    print(f"Routing to {tier['name']} tier ({tier['model']}, {tier['max_tokens']} tokens), "
+          f"complexity {tier['complexity']['score']}")
+    return tier
+
+def _routed_chat(tier, chat_request):
+    """
+    get_llm_client().chat(**chat_request), recording latency, tokens and
+    cost under the routing tier
+    """
+    started = time.monotonic()
+    try:
+        response = get_llm_client().chat(**chat_request)
+    except Exception:
+        get_model_router().record(tier, time.monotonic() - started, error=True)
+        raise
+    usage = response.usage
+    get_model_router().record(
+        tier, time.monotonic() - started,
+        prompt_tokens=usage.prompt_tokens if usage else 0,
+        completion_tokens=usage.completion_tokens if usage else 0,
+        # A hedge that won was streamed, so its usage is estimated
+        estimated=getattr(response, 'usage_estimated', False)
+    )
+    return response
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def _generate_insights(data):
+    """
+    Insights for one document from OpenAI
+
+    Args:
+        data (dict): Parsed document data
+
+    Returns:
+        tuple: (response data, whether the model produced it rather than a fallback)
+    """
+    # Call OpenAI API
+    print("Calling OpenAI API...")
+    print(f"OpenAI API Key set: {'Yes' if os.getenv('OPENAI_API_KEY') else 'No'}")
+    
+    tier = _route(data)
+    response = _routed_chat(tier, _insights_request(data, tier))
+    
+    print("OpenAI API call successful")
+    # Extract the response content
+    insights_data, source = _parse_insights(response.choices[0].message.content, data)
+    
+    # Return the insights
+    response_data = {
+        'success': True,
+        'message': 'Health insights generated successfully',
+        'data': insights_data,
+        'source': source
+    }
+    return response_data, source == 'model'
+
 @health_insights_bp.route('/get-health-insights', methods=['POST'])
 def get_health_insights():
     """
@@ -32,124 +345,279 @@ def get_health_insights():
         if not isinstance(data, dict):
             return jsonify({'error': 'Invalid data format. Expected JSON object'}), 400
         
-        # Create a prompt for OpenAI to generate health insights
-        prompt = f"""
-        Based on the following medical document data, generate 5-7 health insights that are specifically designed for the PATIENT to understand their health information.
-        
-        Document Data:
-        {data}
-        
-        Please provide insights in the following JSON format:
-        {{
-            "insights": [
-                {{
-                    "title": "Brief Phrase Title",
-                    "description": "1-2 sentences explaining what this means for YOU as a patient"
-                }}
-            ]
-        }}
-        
-        IMPORTANT GUIDELINES:
-        
-        TITLES:
-        - Use simple, brief phrases (2-4 words max)
-        - NO words like "recommendations", "suggestions", "advice"
-        - Use plain language, not medical jargon
-        - Examples: "Blood Pressure Elevated", "New Medication Added", "Allergy Alert"
-        
-        DESCRIPTIONS:
-        - Keep to 1-2 sentences maximum
-        - Use simple, clear language
-        - Write directly TO the patient using "you" and "your"
-        - Explain what this information means for THEIR health
-        - Avoid overly technical medical terms
-        - Focus on what the patient needs to know about their own health
-        
-        PATIENT-FOCUSED APPROACH:
-        - Write as if explaining to a friend or family member
-        - Use "you" and "your" language
-        - Explain why this information matters to the patient personally
-        - Focus on what the patient should understand about their health
-        - Avoid clinical/medical perspective - think patient perspective
-        
-        Focus on:
-        - What your vital signs tell you about your health
-        - How medication changes affect you personally
-        - What allergies or safety concerns mean for you
-        - What your symptoms or findings indicate about your health
-        - What you should know or do next
-        """
-        
-        # Call OpenAI API
-        print("Calling OpenAI API...")
-        print(f"OpenAI API Key set: {'Yes' if os.getenv('OPENAI_API_KEY') else 'No'}")
-        
-        client = openai.OpenAI()
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a medical AI assistant that creates simple, clear health insights specifically for PATIENTS. Write directly TO the patient using 'you' and 'your' language. Always use plain language, avoid medical jargon, and keep titles brief (2-4 words) and descriptions concise (1-2 sentences). Never use words like 'recommendations' or 'suggestions' in titles. Think like you're explaining health information to a friend or family member."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            max_tokens=800,
-            temperature=0.2
-        )
+        # Same clinical content as an earlier request: answer from the cache
+        cache_key = _response_cache_key('insights', data)
+        cached = _cached_response('insights', cache_key)
+        if cached is not None:
+            print("Health insights served from cache")
+            return jsonify(dict(cached, cached=True)), 200
         
-        print("OpenAI API call successful")
-        # Extract the response content
-        ai_response = response.choices[0].message.content
+        response_data, generated = _generate_insights(data)
         
-        # Try to parse the JSON response from AI
-        try:
-            import json
-            insights_data = json.loads(ai_response)
-            
-            # Validate the structure
-            if 'insights' not in insights_data or not isinstance(insights_data['insights'], list):
-                # If AI didn't return proper JSON, create a fallback response
-                insights_data = {
-                    "insights": [
-                        {
-                            "title": "Document Analysis Complete",
-                            "description": "AI analysis completed. Please review the generated insights below."
-                        }
-                    ]
-                }
-        except json.JSONDecodeError:
-            # If JSON parsing fails, create a fallback response
-            insights_data = {
-                "insights": [
-                    {
-                        "title": "Document Analysis Complete",
-                        "description": "AI analysis completed. Please review the generated insights below."
-                    }
-                ]
-            }
+        # Placeholders are not cached so the next view retries the model
+        if generated:
+            _store_response(cache_key, response_data)
         
-        # Return the insights
-        response_data = {
-            'success': True,
-            'message': 'Health insights generated successfully',
-            'data': insights_data
-        }
+        return jsonify(dict(response_data, cached=False)), 200
         
-        return jsonify(response_data), 200
+    except openai.AuthenticationError:
+        return jsonify({'error': 'OpenAI API authentication failed. Please check your API key.'}), 500
+    except openai.RateLimitError:
+        return (_rules_fallback(data, 'rate_limited')
+                or (jsonify({'error': 'OpenAI API rate limit exceeded. Please try again later.'}), 429))
+    except LLMBusyError:
+        return (_rules_fallback(data, 'busy')
+                or (jsonify({'error': 'Too many health insight requests in progress. Please try again shortly.'}), 503))
+    except openai.APITimeoutError:
+        return (_rules_fallback(data, 'timeout')
+                or (jsonify({'error': 'OpenAI API request timed out. Please try again.'}), 504))
+    except openai.APIError as e:
+        return jsonify({'error': f'OpenAI API error: {str(e)}'}), 500
+    except Exception as e:
+        logging.error(f"Error generating health insights: {str(e)}")
+        return jsonify({'error': f'Failed to generate health insights: {str(e)}'}), 500
+
+@health_insights_bp.route('/get-health-insights/stream', methods=['POST'])
+def stream_health_insights():
+    """
+    Server-sent events version of get-health-insights: a `preview` event with
+    the rule-based insights first, an `insight` event for each insight as
+    soon as the model has finished writing it, then `done` with the same body
+    get-health-insights returns, or `error`. Failures before the model starts
+    answering are returned as plain JSON errors, or answered from the rules
+    when the model is rate limited, busy or timed out. A timeout after model
+    insights were sent ends with `error` rather than rule insights, so the
+    insights already on the page are not replaced.
+    """
+    try:
+        print("Health insights stream endpoint called")
+        
+        # Get the request data
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        # Validate that we have the required document data
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Invalid data format. Expected JSON object'}), 400
+        
+        cache_key = _response_cache_key('insights', data)
+        cached = _cached_response('insights', cache_key)
+        if cached is not None:
+            print("Health insights served from cache")
+            return Response(_replay(dict(cached, cached=True)), mimetype='text/event-stream', headers=SSE_HEADERS)
+        
+        print("Calling OpenAI API (streaming)...")
+        tier = _route(data)
+        insights_request = _insights_request(data, tier)
+        started = time.monotonic()
+        try:
+            stream = get_llm_client().stream_chat(**insights_request)
+        except Exception:
+            get_model_router().record(tier, time.monotonic() - started, error=True)
+            raise
         
     except openai.AuthenticationError:
         return jsonify({'error': 'OpenAI API authentication failed. Please check your API key.'}), 500
     except openai.RateLimitError:
-        return jsonify({'error': 'OpenAI API rate limit exceeded. Please try again later.'}), 429
+        return (_rules_stream_fallback(data, 'rate_limited')
+                or (jsonify({'error': 'OpenAI API rate limit exceeded. Please try again later.'}), 429))
+    except LLMBusyError:
+        return (_rules_stream_fallback(data, 'busy')
+                or (jsonify({'error': 'Too many health insight requests in progress. Please try again shortly.'}), 503))
+    except openai.APITimeoutError:
+        return (_rules_stream_fallback(data, 'timeout')
+                or (jsonify({'error': 'OpenAI API request timed out. Please try again.'}), 504))
     except openai.APIError as e:
         return jsonify({'error': f'OpenAI API error: {str(e)}'}), 500
     except Exception as e:
         logging.error(f"Error generating health insights: {str(e)}")
         return jsonify({'error': f'Failed to generate health insights: {str(e)}'}), 500
+    
+    def events():
+        # Instant first paint; the model's insights replace it as they arrive
+        yield _sse('preview', {'insights': rule_based_insights(data)})
+        
+        reader = JsonArrayStream('insights')
+        parts = []
+        emitted = 0
+        try:
+            for delta in stream:
+                parts.append(delta)
+                for insight in reader.feed(delta):
+                    emitted += 1
+                    yield _sse('insight', insight)
+        except openai.APITimeoutError:
+            get_model_router().record(tier, time.monotonic() - started, error=True)
+            fallback = _rules_response(data, 'timeout') if not emitted else None
+            if fallback is not None:
+                yield from _replay(fallback)
+            else:
+                yield _sse('error', {'error': 'OpenAI API request timed out. Please try again.', 'status': 504})
+            return
+        except Exception as e:
+            get_model_router().record(tier, time.monotonic() - started, error=True)
+            logging.error(f"Error streaming health insights: {str(e)}")
+            yield _sse('error', {'error': f'Failed to generate health insights: {str(e)}', 'status': 500})
+            return
+        
+        print(f"OpenAI stream complete ({emitted} insights streamed)")
+        # Streams carry no usage, so tokens are estimated from the text
+        get_model_router().record(
+            tier, time.monotonic() - started,
+            prompt_tokens=sum(estimate_tokens(message['content']) for message in insights_request['messages']),
+            completion_tokens=estimate_tokens(''.join(parts)),
+            estimated=True
+        )
+        insights_data, source = _parse_insights(''.join(parts), data)
+        generated = source == 'model'
+        if not generated and not emitted:
+            for insight in insights_data['insights']:
+                yield _sse('insight', insight)
+        
+        response_data = {
+            'success': True,
+            'message': 'Health insights generated successfully',
+            'data': insights_data,
+            'source': source
+        }
+        # Placeholders are not cached so the next view retries the model
+        if generated:
+            _store_response(cache_key, response_data)
+        yield _sse('done', dict(response_data, cached=False))
+    
+    response = Response(events(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    # Frees the OpenAI call slot even if the client disconnects mid-stream
+    response.call_on_close(stream.close)
+    return response
+
+def _fallback_recommendations():
+    """
+    Generic recommendation used when the model gives none
+    """
+    return {
+        "recommendations": [
+            {
+                "title": "Follow Up",
+                "description": "Schedule a follow-up appointment with your doctor to discuss your health progress.",
+                "priority": "medium"
+            }
+        ]
+    }
+
+def _generate_recommendations(data):
+    """
+    Recommendations for one document from OpenAI
+
+    Args:
+        data (dict): Parsed document data
+
+    Returns:
+        tuple: (response data, whether the model produced it rather than a fallback)
+    """
+    # Create a prompt for OpenAI to generate health recommendations
+    prompt = f"""
+    Based on the following medical document data, generate 3-5 actionable health recommendations that the PATIENT can implement to improve their health.
+    
+    Document Data:
+    {_document_text(data)}
+    
+    Please provide recommendations in the following JSON format:
+    {{
+        "recommendations": [
+            {{
+                "title": "Action Title",
+                "description": "1-2 sentences explaining what to do and why it helps",
+                "priority": "high/medium/low"
+            }}
+        ]
+    }}
+    
+    IMPORTANT GUIDELINES:
+    
+    TITLES:
+    - Use action-oriented phrases (2-4 words max)
+    - Focus on what the patient can DO
+    - Use plain language, not medical jargon
+    - Examples: "Take Medication", "Monitor Blood Pressure", "Follow Up Appointment"
+    
+    DESCRIPTIONS:
+    - Keep to 1-2 sentences maximum
+    - Use simple, clear language
+    - Write directly TO the patient using "you" and "your"
+    - Explain WHAT to do and WHY it's important
+    - Make it actionable and specific
+    
+    PRIORITY LEVELS:
+    - "high": Critical actions that need immediate attention
+    - "medium": Important actions that should be done soon
+    - "low": Helpful actions that can be done when convenient
+    
+    RECOMMENDATION TYPES:
+    - Medication adherence and timing
+    - Lifestyle changes (diet, exercise, sleep)
+    - Monitoring and tracking (symptoms, vitals)
+    - Follow-up appointments and tests
+    - Safety precautions and warning signs
+    - Preventive measures
+    
+    Focus on:
+    - What actions you should take based on your health data
+    - How to manage your medications effectively
+    - What lifestyle changes would benefit you most
+    - When to seek medical attention
+    - How to monitor your health progress
+    """
+    
+    # Call OpenAI API
+    print("Calling OpenAI API for recommendations...")
+    print(f"OpenAI API Key set: {'Yes' if os.getenv('OPENAI_API_KEY') else 'No'}")
+    
+    tier = _route(data)
+    response = _routed_chat(tier, dict(
+        model=tier['model'],
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a medical AI assistant that creates actionable health recommendations specifically for PATIENTS. Focus on what patients can DO to improve their health. Write directly TO the patient using 'you' and 'your' language. Always use plain language, avoid medical jargon, and keep titles brief (2-4 words) and descriptions concise (1-2 sentences). Make recommendations specific and actionable."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        max_tokens=tier['max_tokens'],
+        temperature=0.2
+    ))
+    
+    print("OpenAI API call successful for recommendations")
+    # Extract the response content
+    ai_response = response.choices[0].message.content
+    
+    # Try to parse the JSON response from AI
+    try:
+        import json
+        recommendations_data = json.loads(ai_response)
+        generated = True
+        
+        # Validate the structure
+        if 'recommendations' not in recommendations_data or not isinstance(recommendations_data['recommendations'], list):
+            generated = False
+            # If AI didn't return proper JSON, create a fallback response
+            recommendations_data = _fallback_recommendations()
+    except json.JSONDecodeError:
+        # If JSON parsing fails, create a fallback response
+        generated = False
+        recommendations_data = _fallback_recommendations()
+    
+    # Return the recommendations
+    response_data = {
+        'success': True,
+        'message': 'Health recommendations generated successfully',
+        'data': recommendations_data
+    }
+    return response_data, generated
 
 @health_insights_bp.route('/get-health-recommendations', methods=['POST'])
 def get_health_recommendations():
@@ -171,132 +639,295 @@ def get_health_recommendations():
         if not isinstance(data, dict):
             return jsonify({'error': 'Invalid data format. Expected JSON object'}), 400
         
-        # Create a prompt for OpenAI to generate health recommendations
-        prompt = f"""
-        Based on the following medical document data, generate 3-5 actionable health recommendations that the PATIENT can implement to improve their health.
-        
-        Document Data:
-        {data}
-        
-        Please provide recommendations in the following JSON format:
-        {{
-            "recommendations": [
-                {{
-                    "title": "Action Title",
-                    "description": "1-2 sentences explaining what to do and why it helps",
-                    "priority": "high/medium/low"
-                }}
-            ]
-        }}
-        
-        IMPORTANT GUIDELINES:
-        
-        TITLES:
-        - Use action-oriented phrases (2-4 words max)
-        - Focus on what the patient can DO
-        - Use plain language, not medical jargon
-        - Examples: "Take Medication", "Monitor Blood Pressure", "Follow Up Appointment"
-        
-        DESCRIPTIONS:
-        - Keep to 1-2 sentences maximum
-        - Use simple, clear language
-        - Write directly TO the patient using "you" and "your"
-        - Explain WHAT to do and WHY it's important
-        - Make it actionable and specific
-        
-        PRIORITY LEVELS:
-        - "high": Critical actions that need immediate attention
-        - "medium": Important actions that should be done soon
-        - "low": Helpful actions that can be done when convenient
-        
-        RECOMMENDATION TYPES:
-        - Medication adherence and timing
-        - Lifestyle changes (diet, exercise, sleep)
-        - Monitoring and tracking (symptoms, vitals)
-        - Follow-up appointments and tests
-        - Safety precautions and warning signs
-        - Preventive measures
-        
-        Focus on:
-        - What actions you should take based on your health data
-        - How to manage your medications effectively
-        - What lifestyle changes would benefit you most
-        - When to seek medical attention
-        - How to monitor your health progress
-        """
-        
-        # Call OpenAI API
-        print("Calling OpenAI API for recommendations...")
-        print(f"OpenAI API Key set: {'Yes' if os.getenv('OPENAI_API_KEY') else 'No'}")
-        
-        client = openai.OpenAI()
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a medical AI assistant that creates actionable health recommendations specifically for PATIENTS. Focus on what patients can DO to improve their health. Write directly TO the patient using 'you' and 'your' language. Always use plain language, avoid medical jargon, and keep titles brief (2-4 words) and descriptions concise (1-2 sentences). Make recommendations specific and actionable."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            max_tokens=800,
-            temperature=0.2
-        )
+        # Same clinical content as an earlier request: answer from the cache
+        cache_key = _response_cache_key('recommendations', data)
+        cached = _cached_response('recommendations', cache_key)
+        if cached is not None:
+            print("Health recommendations served from cache")
+            return jsonify(dict(cached, cached=True)), 200
+        
+        response_data, generated = _generate_recommendations(data)
         
-        print("OpenAI API call successful for recommendations")
-        # Extract the response content
-        ai_response = response.choices[0].message.content
+        # Placeholders are not cached so the next view retries the model
+        if generated:
+            _store_response(cache_key, response_data)
         
-        # Try to parse the JSON response from AI
+        return jsonify(dict(response_data, cached=False)), 200
+        
+    except openai.AuthenticationError:
+        return jsonify({'error': 'OpenAI API authentication failed. Please check your API key.'}), 500
+    except openai.RateLimitError:
+        return jsonify({'error': 'OpenAI API rate limit exceeded. Please try again later.'}), 429
+    except LLMBusyError:
+        return jsonify({'error': 'Too many health insight requests in progress. Please try again shortly.'}), 503
+    except openai.APITimeoutError:
+        return jsonify({'error': 'OpenAI API request timed out. Please try again.'}), 504
+    except openai.APIError as e:
+        return jsonify({'error': f'OpenAI API error: {str(e)}'}), 500
+    except Exception as e:
+        logging.error(f"Error generating health recommendations: {str(e)}")
+        return jsonify({'error': f'Failed to generate health recommendations: {str(e)}'}), 500
+
+def _generate_summary(data, fallback=False):
+    """
+    Insights and recommendations for one document, each from the response
+    cache or generated concurrently with the other
+
+    Args:
+        data (dict): Parsed document data
+        fallback (bool): When the model is rate limited, busy or timed out and
+            the document rules apply, answer the failed halves from the rules
+            (insights) and the generic placeholder (recommendations) instead
+            of raising
+
+    Returns:
+        dict: For 'insights' and 'recommendations': data (response data),
+              cached, generated (False for fallback placeholders) and
+              fallback_reason (None unless answered without the model)
+    """
+    results = {}
+    pending = {}
+    for kind, generate in (('insights', _generate_insights), ('recommendations', _generate_recommendations)):
+        cache_key = _response_cache_key(kind, data)
+        cached = _cached_response(kind, cache_key)
+        if cached is not None:
+            results[kind] = {'data': cached, 'cached': True, 'generated': True, 'fallback_reason': None}
+        else:
+            pending[kind] = (cache_key, _generation_pool.submit(generate, data))
+    
+    # Keep whichever generation succeeded before reporting the other's error
+    error = None
+    unavailable = {}
+    for kind, (cache_key, future) in pending.items():
         try:
-            import json
-            recommendations_data = json.loads(ai_response)
-            
-            # Validate the structure
-            if 'recommendations' not in recommendations_data or not isinstance(recommendations_data['recommendations'], list):
-                # If AI didn't return proper JSON, create a fallback response
-                recommendations_data = {
-                    "recommendations": [
-                        {
-                            "title": "Follow Up",
-                            "description": "Schedule a follow-up appointment with your doctor to discuss your health progress.",
-                            "priority": "medium"
-                        }
-                    ]
+            response_data, generated = future.result()
+        except Exception as e:
+            error = error or e
+            unavailable[kind] = _unavailable_reason(e)
+            continue
+        if generated:
+            _store_response(cache_key, response_data)
+        results[kind] = {'data': response_data, 'cached': False, 'generated': generated, 'fallback_reason': None}
+    
+    if error is not None:
+        if not fallback or None in unavailable.values() or not rule_based_insights(data):
+            raise error
+        for kind, reason in unavailable.items():
+            if kind == 'insights':
+                response_data = _rules_response(data, reason)
+            else:
+                print(f"Health recommendations answered with the placeholder ({reason})")
+                response_data = {
+                    'success': True,
+                    'message': 'Health recommendations generated successfully',
+                    'data': _fallback_recommendations(),
+                    'source': 'placeholder'
                 }
-        except json.JSONDecodeError:
-            # If JSON parsing fails, create a fallback response
-            recommendations_data = {
-                "recommendations": [
-                    {
-                        "title": "Follow Up",
-                        "description": "Schedule a follow-up appointment with your doctor to discuss your health progress.",
-                        "priority": "medium"
-                    }
-                ]
-            }
+            results[kind] = {'data': response_data, 'cached': False, 'generated': False, 'fallback_reason': reason}
+    
+    print(f"Health summary ready ({len(pending)} generated, {2 - len(pending)} cached)")
+    return results
+
+def precompute_health_summary(result_id, data):
+    """
+    Generate insights and recommendations for a stored OCR result in the
+    background and store them on its information row (and in the response
+    cache, so the insight endpoints answer from it too)
+    
+    Args:
+        result_id (int): ID of the information row
+        data (dict): The row's parsed document data
+        
+    Returns:
+        Future: Resolves to True once stored
+    """
+    with _cache_counters_lock:
+        _precompute_counters['queued'] += 1
+    return _precompute_pool.submit(_precompute_health_summary, result_id, data)
+
+def _precompute_health_summary(result_id, data):
+    outcome = 'failed'
+    try:
+        results = _generate_summary(data)
+        if not all(result['generated'] for result in results.values()):
+            # Fallback placeholders are not worth storing; the page will retry
+            outcome = 'skipped'
+            return False
+        stored = _stored_insights(data, results)
+        store_result = supabase_service.store_insights(result_id, stored)
+        if not store_result['success']:
+            logging.error(f"Failed to store precomputed insights for {result_id}: {store_result['error']}")
+            return False
+        print(f"Precomputed insights stored for OCR result {result_id}")
+        outcome = 'stored'
+        return True
+    except Exception as e:
+        logging.error(f"Error precomputing insights for OCR result {result_id}: {str(e)}")
+        return False
+    finally:
+        with _cache_counters_lock:
+            _precompute_counters[outcome] += 1
+
+def _stored_insights(data, results):
+    return {
+        'insights': results['insights']['data']['data']['insights'],
+        'recommendations': results['recommendations']['data']['data']['recommendations'],
+        'fingerprint': document_fingerprint(data),
+        'version': RESPONSE_CACHE_VERSION,
+        'generated_at': datetime.now(timezone.utc).isoformat()
+    }
+
+@health_insights_bp.route('/get-health-summary', methods=['POST'])
+def get_health_summary():
+    """
+    Generate health insights and recommendations for one document in a single
+    request; both OpenAI calls run concurrently, so the wait is that of the
+    slower one. Like get-health-insights, halves failed by a rate-limited,
+    busy or timed-out model are answered without it when the rules apply.
+    """
+    try:
+        print("Health summary endpoint called")
+        
+        # Get the request data
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
         
-        # Return the recommendations
+        # Validate that we have the required document data
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Invalid data format. Expected JSON object'}), 400
+        
+        results = _generate_summary(data, fallback=True)
         response_data = {
             'success': True,
-            'message': 'Health recommendations generated successfully',
-            'data': recommendations_data
+            'message': 'Health summary generated successfully',
+            'data': {
+                'insights': results['insights']['data']['data']['insights'],
+                'recommendations': results['recommendations']['data']['data']['recommendations']
+            },
+            'cached': {kind: result['cached'] for kind, result in results.items()}
         }
-        
+        fallback_reasons = {kind: result['fallback_reason'] for kind, result in results.items()
+                            if result['fallback_reason'] is not None}
+        if fallback_reasons:
+            response_data['fallback_reason'] = fallback_reasons
         return jsonify(response_data), 200
         
     except openai.AuthenticationError:
         return jsonify({'error': 'OpenAI API authentication failed. Please check your API key.'}), 500
     except openai.RateLimitError:
         return jsonify({'error': 'OpenAI API rate limit exceeded. Please try again later.'}), 429
+    except LLMBusyError:
+        return jsonify({'error': 'Too many health insight requests in progress. Please try again shortly.'}), 503
+    except openai.APITimeoutError:
+        return jsonify({'error': 'OpenAI API request timed out. Please try again.'}), 504
     except openai.APIError as e:
         return jsonify({'error': f'OpenAI API error: {str(e)}'}), 500
     except Exception as e:
-        logging.error(f"Error generating health recommendations: {str(e)}")
-        return jsonify({'error': f'Failed to generate health recommendations: {str(e)}'}), 500
+        logging.error(f"Error generating health summary: {str(e)}")
+        return jsonify({'error': f'Failed to generate health summary: {str(e)}'}), 500
+
+@health_insights_bp.route('/batch-insights', methods=['POST'])
+def start_batch_insights():
+    """
+    Start generating insights (or recommendations) for many documents in the
+    background, paced to the OpenAI request and token quotas
+
+    Body: {"documents": [...], "kind": "insights" | "recommendations"}
+    """
+    try:
+        payload = request.get_json()
+        if not payload or not isinstance(payload, dict):
+            return jsonify({'error': 'No data provided'}), 400
+        
+        documents = payload.get('documents')
+        kind = payload.get('kind', 'insights')
+        if not isinstance(documents, list) or not documents:
+            return jsonify({'error': 'documents must be a non-empty list'}), 400
+        if len(documents) > BATCH_MAX_DOCUMENTS:
+            return jsonify({'error': f'At most {BATCH_MAX_DOCUMENTS} documents per batch'}), 400
+        if not all(isinstance(document, dict) and document for document in documents):
+            return jsonify({'error': 'Invalid data format. Every document must be a JSON object'}), 400
+        if kind not in ('insights', 'recommendations'):
+            return jsonify({'error': 'kind must be insights or recommendations'}), 400
+        
+        generate_answer = _generate_insights if kind == 'insights' else _generate_recommendations
+        
+        def lookup(document):
+            return _cached_response(kind, _response_cache_key(kind, document))
+        
+        def generate(document):
+            response_data, generated = generate_answer(document)
+            if generated:
+                _store_response(_response_cache_key(kind, document), response_data)
+            return response_data, generated
+        
+        def estimate_tokens(document):
+            document_tokens = compact_document(document, max_tokens=PROMPT_DOCUMENT_MAX_TOKENS)['tokens']
+            return PROMPT_TEMPLATE_TOKENS + document_tokens + get_model_router().route(document)['max_tokens']
+        
+        job = submit_batch_job(InsightBatchJob(
+            documents, lookup, generate, estimate_tokens, get_openai_rate_limiter(),
+            kind=kind, concurrency=BATCH_CONCURRENCY, cache=get_shared_cache()
+        ))
+        print(f"Batch {job.id} started: {len(documents)} documents ({kind})")
+        
+        return jsonify(dict(
+            job.snapshot(include_results=False),
+            status_url=f"{request.script_root}{request.path}/{job.id}"
+        )), 202
+        
+    except Exception as e:
+        logging.error(f"Error starting insight batch: {str(e)}")
+        return jsonify({'error': f'Failed to start insight batch: {str(e)}'}), 500
+
+@health_insights_bp.route('/batch-insights/<job_id>', methods=['GET'])
+def get_batch_insights(job_id):
+    """
+    Progress of a batch and the answers generated so far; pass
+    results=false for progress only
+    """
+    include_results = request.args.get('results', 'true').lower() != 'false'
+    snapshot = get_batch_snapshot(job_id, include_results)
+    if snapshot is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(dict(snapshot, rate_limiter=get_openai_rate_limiter().stats())), 200
+
+@health_insights_bp.route('/stored/<int:result_id>', methods=['GET'])
+def get_stored_insights(result_id):
+    """
+    Insights and recommendations stored on an OCR result at upload time.
+    status is ready, pending (not generated yet) or stale (the document or
+    the prompts changed since; regenerate with get-health-summary).
+    """
+    try:
+        result = supabase_service.get_insights(result_id)
+        if not result['success']:
+            return jsonify({'error': result['error']}), 500
+        row = result['data']
+        if row is None:
+            return jsonify({'error': f'No result found with ID {result_id}'}), 404
+        
+        stored = row.get('insights')
+        if not stored:
+            return jsonify({'success': True, 'status': 'pending', 'data': None}), 200
+        
+        current = (stored.get('version') == RESPONSE_CACHE_VERSION
+                   and stored.get('fingerprint') == document_fingerprint(row.get('info') or {}))
+        return jsonify({
+            'success': True,
+            'status': 'ready' if current else 'stale',
+            'data': {
+                'insights': stored.get('insights', []),
+                'recommendations': stored.get('recommendations', [])
+            },
+            'generated_at': stored.get('generated_at')
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error reading stored insights: {str(e)}")
+        return jsonify({'error': f'Failed to read stored insights: {str(e)}'}), 500
 
 @health_insights_bp.route('/health', methods=['GET'])
 def health_check():
@@ -304,3 +935,43 @@ def health_check():
     Health check endpoint for health insights service
     """
     return jsonify({'status': 'healthy', 'service': 'Health Insights'}), 200
+
+@health_insights_bp.route('/cache', methods=['GET'])
+def cache_stats():
+    """
+    Response cache hit rates per endpoint (this worker) and shared cache totals (host)
+    """
+    with _cache_counters_lock:
+        endpoints = {
+            kind: dict(counts, hit_rate=round(counts['hits'] / max(counts['hits'] + counts['misses'], 1), 4))
+            for kind, counts in _cache_counters.items()
+        }
+        precompute = dict(_precompute_counters, enabled=PRECOMPUTE_INSIGHTS)
+    cache = get_shared_cache()
+    return jsonify({
+        'enabled': cache is not None,
+        'ttl_seconds': RESPONSE_CACHE_TTL,
+        'endpoints': endpoints,
+        'precompute': precompute,
+        'shared_cache': cache.stats() if cache is not None else None
+    }), 200
+
+@health_insights_bp.route('/prompts', methods=['GET'])
+def prompt_stats():
+    """
+    Estimated prompt document tokens before and after compaction (this worker)
+    """
+    with _prompt_counters_lock:
+        counters = dict(_prompt_counters)
+    return jsonify(dict(
+        counters,
+        max_document_tokens=PROMPT_DOCUMENT_MAX_TOKENS,
+        saved_ratio=round(counters['saved_tokens'] / max(counters['original_tokens'], 1), 4)
+    )), 200
+
+@health_insights_bp.route('/routing', methods=['GET'])
+def routing_stats():
+    """
+    Calls, latency percentiles, tokens and cost per model routing tier (this worker)
+    """
+    return jsonify(get_model_router().stats()), 200
@@ -1,38 +1,152 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.services.medications_service import MedicationsService
 from app.services.supabase_service import SupabaseService
+from app.services.dose_timeline import DoseTimeline
+from app.services.medication_timeline import MedicationTimeline, parse_timestamp
+from app.utils.shared_cache import get_shared_cache
 import logging
 
 medications_bp = Blueprint('medications', __name__)
 medications_service = MedicationsService()
 supabase_service = SupabaseService()
 
+# Page size when (re)building the medication index from Supabase
+INDEX_REBUILD_PAGE_SIZE = 1000
+
+# Bump when the .ics output changes so clients and the shared cache see new ETags
+ICS_FEED_VERSION = 3
+# Generated feeds are kept in the shared cache under their ETag
+ICS_CACHE_TTL = 24 * 3600
+
+# Per-user structures derived from the index, rebuilt only when the user's rows change
+PER_USER_CACHE_SIZE = 10000
+MAX_NEXT_DOSES = 100
+_dose_timelines = {}
+_medication_timelines = {}
+
+def _load_medication_rows():
+    """
+    Every information row that lists medications, paged newest first by id
+    (keyset paging, so rows inserted meanwhile do not shift the pages)
+    """
+    rows = []
+    while True:
+        page = supabase_service.get_medication_records(
+            limit=INDEX_REBUILD_PAGE_SIZE, before_id=rows[-1]['id'] if rows else None
+        )
+        if not page['success']:
+            raise RuntimeError(page['error'])
+        rows.extend(page['data'])
+        if page['count'] < INDEX_REBUILD_PAGE_SIZE:
+            return rows
+
+def _rebuild_medication_index(if_unbuilt=False):
+    """
+    Rebuild the medication index from every information row that lists
+    medications. With if_unbuilt=True nothing is loaded if another worker
+    built the index meanwhile (count is then None).
+    """
+    try:
+        count = supabase_service.medication_index.rebuild(_load_medication_rows, if_unbuilt=if_unbuilt)
+    except RuntimeError as e:
+        return {'success': False, 'error': str(e)}
+    return {'success': True, 'count': count}
+
+def rebuild_stale_medication_index():
+    """
+    Rebuild the medication index if its journal was written by an older
+    extractor (see INDEX_VERSION), so it does not serve stale names and timing
+    """
+    if not supabase_service.medication_index.is_stale():
+        return
+    result = _rebuild_medication_index(if_unbuilt=True)
+    if not result['success']:
+        logging.error(f"Could not rebuild stale medication index: {result.get('error')}")
+    elif result['count'] is not None:
+        logging.info(f"Rebuilt stale medication index from {result['count']} rows")
+
+def _ensure_medication_index():
+    """
+    The medication index, built from Supabase on first use (by one worker; the
+    others wait for it). Returns None if it cannot be built.
+    """
+    index = supabase_service.medication_index
+    if not index.is_built() and not _rebuild_medication_index(if_unbuilt=True)['success']:
+        return None
+    return index
+
+def _indexed_medications(email=None):
+    """
+    Medications from the 100 most recent rows that list any (for one email if
+    given), read from the incrementally maintained index and merged across
+    documents so each medication appears once with its latest status. Returns
+    None if the index cannot be built.
+    """
+    index = _ensure_medication_index()
+    if index is None:
+        return None
+    return medications_service.merge_medications(index.medications(email=email, limit=100))
+
+def _per_user(cache, index, email, build):
+    """
+    build(index, email), reused from cache until the index fingerprint for
+    email changes
+    """
+    key = email or ''
+    fingerprint = index.fingerprint(email)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    
+    value = build(index, email)
+    cache.pop(key, None)
+    if len(cache) >= PER_USER_CACHE_SIZE:
+        # Drop the least recently rebuilt entry
+        cache.pop(next(iter(cache)), None)
+    cache[key] = (fingerprint, value)
+    return value
+
+def _dose_timeline(index, email=None):
+    """
+    The DoseTimeline of the active medications _indexed_medications returns
+    """
+    def build(index, email):
+        medications = medications_service.merge_medications(index.medications(email=email, limit=100))
+        return DoseTimeline([med for med in medications if med['status'] == 'active'])
+    return _per_user(_dose_timelines, index, email, build)
+
+def _medication_timeline(index, email):
+    """
+    The MedicationTimeline of every indexed row for email
+    """
+    def build(index, email):
+        return MedicationTimeline(index.records_for(email), medications_service)
+    return _per_user(_medication_timelines, index, email, build)
+
+def _stream_and_cache(lines, cache, key):
+    """
+    Yield lines as they are generated and store the whole feed once complete
+    """
+    chunks = []
+    for line in lines:
+        chunks.append(line)
+        yield line
+    if cache is not None:
+        cache.set(key, ''.join(chunks), ttl=ICS_CACHE_TTL)
+
 @medications_bp.route('/extract', methods=['GET'])
 def extract_medications():
     """
     Extract medications from all OCR results in the information table
     """
     try:
-        # Get all OCR results from Supabase
-        ocr_results = supabase_service.get_ocr_results()
+        # Read from the medication index instead of re-extracting every OCR result
+        all_medications = _indexed_medications()
         
-        if not ocr_results['success']:
+        if all_medications is None:
             return jsonify({'error': 'Failed to fetch OCR results'}), 500
         
-        all_medications = []
-        
-        # Extract medications from each OCR result
-        for result in ocr_results['data']:
-            if result.get('info') and isinstance(result['info'], dict):
-                medications = medications_service.extract_medications_from_ocr(result['info'])
-                if medications:
-                    # Add source information
-                    for med in medications:
-                        med['source_ocr_id'] = result['id']
-                        med['source_date'] = result.get('created_at')
-                    
-                    all_medications.extend(medications)
-        
         # Create summary
         summary = medications_service.get_medications_summary(all_medications)
         
@@ -56,22 +170,14 @@ def create_calendar_events():
         data = request.get_json()
         start_date = data.get('start_date')  # Optional: YYYY-MM-DD
         duration_days = data.get('duration_days', 7)  # Default 7 days
+        recurring = bool(data.get('recurring', False))  # One RRULE event per dose time
         
-        # Get all OCR results and extract medications
-        ocr_results = supabase_service.get_ocr_results()
+        # Get medications from the index
+        all_medications = _indexed_medications()
         
-        if not ocr_results['success']:
+        if all_medications is None:
             return jsonify({'error': 'Failed to fetch OCR results'}), 500
         
-        all_medications = []
-        
-        # Extract medications from each OCR result
-        for result in ocr_results['data']:
-            if result.get('info') and isinstance(result['info'], dict):
-                medications = medications_service.extract_medications_from_ocr(result['info'])
-                if medications:
-                    all_medications.extend(medications)
-        
         if not all_medications:
             return jsonify({'error': 'No medications found in OCR data'}), 404
         
@@ -79,7 +185,8 @@ def create_calendar_events():
         calendar_events = medications_service.create_calendar_events(
             all_medications, 
             start_date, 
-            duration_days
+            duration_days,
+            recurring=recurring
         )
         
         # Return the events that would be created
@@ -89,6 +196,7 @@ def create_calendar_events():
             'success': True,
             'message': f'Created {len(calendar_events)} calendar events for {len(all_medications)} medications',
             'events': calendar_events,
+            'recurring': recurring,
             'medications': all_medications,
             'summary': medications_service.get_medications_summary(all_medications),
             'instructions': 'Use the frontend Google Calendar integration to add these events to your calendar'
@@ -98,27 +206,159 @@ def create_calendar_events():
         logging.error(f"Error creating calendar events: {e}")
         return jsonify({'error': str(e)}), 500
 
+@medications_bp.route('/calendar-feed', methods=['POST'])
+@jwt_required()
+def create_calendar_feed():
+    """
+    Issue the logged-in user a new calendar feed URL; the previous URL stops working
+    """
+    try:
+        result = supabase_service.issue_calendar_feed_token(get_jwt_identity())
+        if not result['success']:
+            return jsonify({'error': result['error']}), 404 if result['error'] == 'User not found' else 500
+        
+        return jsonify({
+            'success': True,
+            'url': url_for('medications.medications_ical_feed', token=result['token'], _external=True)
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error creating calendar feed: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@medications_bp.route('/calendar.ics', methods=['GET'])
+def medications_ical_feed():
+    """
+    iCalendar subscription feed of a user's active medications, addressed by
+    the secret token from POST /calendar-feed (calendar clients cannot send
+    a JWT)
+    
+    The ETag is a fingerprint of the user's indexed rows, so calendar clients
+    polling with If-None-Match get a 304 without the feed being regenerated.
+    """
+    try:
+        token = request.args.get('token')
+        if not token:
+            return jsonify({'error': 'token is required'}), 400
+        
+        user = supabase_service.get_user_by_calendar_token(token)
+        if not user['success']:
+            if user['error'] == 'Unknown calendar feed':
+                return jsonify({'error': user['error']}), 404
+            return jsonify({'error': user['error']}), 500
+        email = user['data']['email']
+        
+        index = _ensure_medication_index()
+        if index is None:
+            return jsonify({'error': 'Failed to fetch OCR results'}), 500
+        
+        etag = f"ics{ICS_FEED_VERSION}-{index.fingerprint(email)}"
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            cache = get_shared_cache()
+            cache_key = f"medications:ics:{email}:{etag}"
+            feed = cache.get(cache_key) if cache is not None else None
+            if feed is None:
+                medications = medications_service.merge_medications(index.medications(email=email, limit=100))
+                feed = _stream_and_cache(medications_service.iter_ical_feed(medications), cache, cache_key)
+            response = Response(feed, mimetype='text/calendar')
+            response.headers['Content-Disposition'] = 'inline; filename="medications.ics"'
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+        
+    except Exception as e:
+        logging.error(f"Error generating medications calendar feed: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@medications_bp.route('/next-doses', methods=['GET'])
+def get_next_doses():
+    """
+    Next n upcoming doses of active medications (optionally for one email)
+    """
+    try:
+        email = request.args.get('email')
+        try:
+            n = int(request.args.get('n', 5))
+        except ValueError:
+            return jsonify({'error': 'n must be an integer'}), 400
+        if not 1 <= n <= MAX_NEXT_DOSES:
+            return jsonify({'error': f'n must be between 1 and {MAX_NEXT_DOSES}'}), 400
+        
+        index = _ensure_medication_index()
+        if index is None:
+            return jsonify({'error': 'Failed to fetch OCR results'}), 500
+        
+        next_doses = _dose_timeline(index, email).next_doses(n=n)
+        
+        return jsonify({
+            'success': True,
+            'next_doses': next_doses,
+            'count': len(next_doses)
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error getting next doses: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@medications_bp.route('/history', methods=['GET'])
+@jwt_required()
+def get_medication_history():
+    """
+    The logged-in user's medication history as intervals: all of it, those
+    active on ?date=YYYY-MM-DD, or those overlapping ?start=...&end=...
+    (end exclusive)
+    """
+    try:
+        user = supabase_service.get_user_by_id(get_jwt_identity())
+        if not user['success']:
+            return jsonify({'error': user['error']}), 404
+        email = user['data']['email']
+        
+        date = request.args.get('date')
+        start = request.args.get('start')
+        end = request.args.get('end')
+        if date and parse_timestamp(date) is None:
+            return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+        if (start or end) and (parse_timestamp(start) is None or parse_timestamp(end) is None):
+            return jsonify({'error': 'start and end must both be ISO dates or timestamps'}), 400
+        
+        index = _ensure_medication_index()
+        if index is None:
+            return jsonify({'error': 'Failed to fetch OCR results'}), 500
+        
+        timeline = _medication_timeline(index, email)
+        if date:
+            medications = timeline.active_on(date)
+        elif start:
+            medications = timeline.active_between(parse_timestamp(start), parse_timestamp(end))
+        else:
+            medications = timeline.history()
+        
+        return jsonify({
+            'success': True,
+            'medications': medications,
+            'count': len(medications)
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error getting medication history: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @medications_bp.route('/summary', methods=['GET'])
 def get_medications_summary():
     """
     Get a summary of all medications found in OCR data
     """
     try:
-        # Get all OCR results and extract medications
-        ocr_results = supabase_service.get_ocr_results()
+        # Get medications from the index
+        all_medications = _indexed_medications()
         
-        if not ocr_results['success']:
+        if all_medications is None:
             return jsonify({'error': 'Failed to fetch OCR results'}), 500
         
-        all_medications = []
-        
-        # Extract medications from each OCR result
-        for result in ocr_results['data']:
-            if result.get('info') and isinstance(result['info'], dict):
-                medications = medications_service.extract_medications_from_ocr(result['info'])
-                if medications:
-                    all_medications.extend(medications)
-        
         # Create summary
         summary = medications_service.get_medications_summary(all_medications)
         
@@ -131,3 +371,24 @@ def get_medications_summary():
     except Exception as e:
         logging.error(f"Error getting medications summary: {e}")
         return jsonify({'error': str(e)}), 500
+
+
+@medications_bp.route('/index/rebuild', methods=['POST'])
+def rebuild_medication_index():
+    """
+    Rebuild the medication index from Supabase, e.g. after rows were changed outside this API
+    """
+    try:
+        result = _rebuild_medication_index()
+        
+        if not result['success']:
+            return jsonify({'error': 'Failed to fetch OCR results'}), 500
+        
+        return jsonify({
+            'success': True,
+            'message': f"Indexed medications from {result['count']} OCR results"
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Error rebuilding medication index: {e}")
+        return jsonify({'error': str(e)}), 500
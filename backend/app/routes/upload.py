@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
 import os
 import logging
 # from ..services.ocr_service import OCRService  # Comment out complex OCR
@@ -18,6 +19,18 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _uploader_email(supabase_service):
+    """
+    Email of the logged-in uploader, or None for anonymous uploads. Rows need
+    it to show up in per-user medications, calendar feeds and reminders.
+    """
+    verify_jwt_in_request(optional=True)
+    user_id = get_jwt_identity()
+    if not user_id:
+        return None
+    user = supabase_service.get_user_by_id(user_id)
+    return user['data']['email'] if user['success'] else None
+
 @upload_bp.route('/upload-pdf', methods=['POST'])
 def upload_pdf():
     """
@@ -76,11 +89,22 @@ def upload_pdf():
         # Store result in Supabase
         print("Storing OCR result in Supabase...")
         supabase_service = SupabaseService()
-        supabase_result = supabase_service.store_ocr_result(result)
+        email = _uploader_email(supabase_service)
+        print(f"Uploader email: {email}")
+        supabase_result = supabase_service.store_ocr_result(result, email=email)
         
+        insights_precompute = None
         if supabase_result['success']:
             print("OCR result stored in Supabase successfully")
             print(f"Stored with ID: {supabase_result['data'].get('id')}")
+            
+            # Optionally generate insights now, so the insights page only reads them
+            from app.routes.health_insights import precompute_health_summary, PRECOMPUTE_INSIGHTS
+            precompute = request.form.get('precompute_insights', str(PRECOMPUTE_INSIGHTS))
+            if precompute.lower() == 'true':
+                precompute_health_summary(supabase_result['data']['id'], result)
+                insights_precompute = 'queued'
+                print("Insight precompute queued")
         else:
             print(f"Warning: Failed to store in Supabase: {supabase_result['error']}")
         
@@ -91,7 +115,8 @@ def upload_pdf():
             'data': result,
             'supabase_stored': supabase_result['success'],
             'supabase_id': supabase_result['data'].get('id') if supabase_result['success'] else None,
-            'supabase_error': supabase_result.get('error') if not supabase_result['success'] else None
+            'supabase_error': supabase_result.get('error') if not supabase_result['success'] else None,
+            'insights_precompute': insights_precompute
         }
         print("Returning success response")
         return jsonify(response_data), 200
@@ -175,3 +200,91 @@ def delete_ocr_result(result_id):
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Failed to delete OCR result: {str(e)}'}), 500
+
+def _bulk_filters(data):
+    """
+    Read the ids / email / start_date / end_date filters of a bulk request body
+    """
+    return {
+        'ids': data.get('ids'),
+        'email': data.get('email'),
+        'start_date': data.get('start_date'),
+        'end_date': data.get('end_date')
+    }
+
+@upload_bp.route('/ocr-results', methods=['DELETE'])
+def delete_ocr_results():
+    """
+    Delete many OCR results in one request, by ID list and/or email and date range
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        filters = _bulk_filters(data)
+        print(f"Bulk deleting OCR results - Filters: {filters}")
+        
+        # Initialize Supabase service
+        supabase_service = SupabaseService()
+        result = supabase_service.delete_ocr_results(**filters)
+        
+        if result['success']:
+            print(f"Successfully deleted {result['deleted']} OCR results")
+            return jsonify({
+                'success': True,
+                'deleted': result['deleted'],
+                'ids': result['ids'],
+                'message': result['message']
+            }), 200
+        else:
+            print(f"Failed to bulk delete OCR results: {result['error']}")
+            return jsonify({
+                'success': False,
+                'error': result['error']
+            }), 400
+            
+    except Exception as e:
+        print(f"EXCEPTION in delete_ocr_results: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Failed to delete OCR results: {str(e)}'}), 500
+
+@upload_bp.route('/ocr-results', methods=['PATCH'])
+def update_ocr_results():
+    """
+    Patch the info of many OCR results in one request.
+    Body: {"updates": [{"id": 1, "info": {...}}, ...]} for per-row patches, or
+    {"info": {...}} together with ids / email / start_date / end_date.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        filters = _bulk_filters(data)
+        print(f"Bulk updating OCR results - Filters: {filters}")
+        
+        # Initialize Supabase service
+        supabase_service = SupabaseService()
+        result = supabase_service.update_ocr_results(
+            updates=data.get('updates'),
+            info_patch=data.get('info'),
+            **filters
+        )
+        
+        if result['success']:
+            print(f"Successfully updated {result['updated']} OCR results")
+            return jsonify({
+                'success': True,
+                'updated': result['updated'],
+                'ids': result['ids'],
+                'missing_ids': result['missing_ids'],
+                'message': result['message']
+            }), 200
+        else:
+            print(f"Failed to bulk update OCR results: {result['error']}")
+            return jsonify({
+                'success': False,
+                'error': result['error']
+            }), 400
+            
+    except Exception as e:
+        print(f"EXCEPTION in update_ocr_results: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Failed to update OCR results: {str(e)}'}), 500
@@ -0,0 +1,642 @@
+import asyncio
+import os
+import logging
+import secrets
+from postgrest import AsyncPostgrestClient
+from dotenv import load_dotenv
+from app.services.medication_index import get_medication_index
+from app.services.supabase_service import (
+    verify_password_hash, calendar_token_hash, has_row_filter, apply_row_filters, patch_rpc_params,
+    MEDICATIONS_PATH, MEDICATION_LIST_PATHS
+)
+
+# Load environment variables
+load_dotenv()
+
+class AsyncSupabaseService:
+    """
+    Asyncio variant of SupabaseService.
+
+    Talks to the Supabase REST (PostgREST) endpoint through an httpx.AsyncClient
+    and exposes the same methods and result dicts as SupabaseService, but as
+    coroutines. Independent queries can be awaited together, e.g.
+
+        async with AsyncSupabaseService() as service:
+            user, results = await asyncio.gather(
+                service.get_user_by_id(user_id),
+                service.get_ocr_results(email=email)
+            )
+
+    The underlying connection pool is bound to the event loop it was first used
+    on, so create one instance per loop (per request in async Flask views, which
+    run each request in its own loop; once at startup under an ASGI server).
+    """
+
+    def __init__(self, timeout=10, client=None, medication_index=None):
+        self.supabase_url = os.getenv('SUPABASE_URL')
+        self.supabase_key = os.getenv('SUPABASE_ANON_KEY')
+        # Kept in step with every write to the information table
+        self.medication_index = medication_index or get_medication_index()
+
+        if client is not None:
+            # Pre-built client, e.g. LocalPostgrest().async_client() in test_supabase_service.py
+            self.client = client
+        elif not self.supabase_url or not self.supabase_key:
+            logging.error("Missing Supabase environment variables")
+            self.client = None
+        else:
+            try:
+                self.client = AsyncPostgrestClient(
+                    f"{self.supabase_url}/rest/v1",
+                    headers={
+                        'apiKey': self.supabase_key,
+                        'Authorization': f"Bearer {self.supabase_key}"
+                    },
+                    timeout=timeout
+                )
+                logging.info("Async Supabase client initialized successfully")
+            except Exception as e:
+                logging.error(f"Failed to initialize async Supabase client: {e}")
+                self.client = None
+
+    async def _update_medication_index(self, update, *args):
+        """
+        Apply a change to the medication index; a failure here must not fail the write.
+        The index takes a file lock and writes its journal, so this runs in a
+        worker thread instead of blocking the event loop.
+        """
+        try:
+            await asyncio.to_thread(update, *args)
+        except Exception as e:
+            logging.error(f"Failed to update medication index: {e}")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """
+        Close the underlying HTTP connections
+        """
+        if self.client:
+            await self.client.aclose()
+
+    async def store_ocr_result(self, ocr_data, email=None):
+        """
+        Store OCR result in the information table
+
+        Args:
+            ocr_data (dict): The OCR result data
+            email (str, optional): User's email
+
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            insert_data = {
+                'info': ocr_data,
+                'email': email
+            }
+
+            result = await self.client.table('information').insert(insert_data).execute()
+
+            if result.data:
+                logging.info(f"OCR result stored successfully with ID: {result.data[0].get('id')}")
+                await self._update_medication_index(self.medication_index.put, result.data[0])
+                return {
+                    'success': True,
+                    'data': result.data[0],
+                    'message': 'OCR result stored successfully'
+                }
+            else:
+                logging.error("No data returned from Supabase insert")
+                return {
+                    'success': False,
+                    'error': 'No data returned from insert operation'
+                }
+
+        except Exception as e:
+            error_msg = str(e)
+            logging.error(f"Error storing OCR result in Supabase: {error_msg}")
+
+            # Handle common RLS errors
+            if "row-level security policy" in error_msg:
+                return {
+                    'success': False,
+                    'error': 'Row Level Security (RLS) is enabled on the table. Please check Supabase RLS policies or disable RLS for the information table.',
+                    'details': error_msg
+                }
+
+            return {
+                'success': False,
+                'error': error_msg
+            }
+
+    async def get_ocr_results(self, email=None, limit=100):
+        """
+        Retrieve OCR results from the information table
+
+        Args:
+            email (str, optional): Filter by email
+            limit (int): Maximum number of results to return
+
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            query = self.client.table('information').select('*').order('id', desc=True).limit(limit)
+
+            if email:
+                query = query.eq('email', email)
+
+            result = await query.execute()
+
+            if result.data is not None:
+                logging.info(f"Retrieved {len(result.data)} OCR results")
+                return {
+                    'success': True,
+                    'data': result.data,
+                    'count': len(result.data)
+                }
+            else:
+                logging.error("No data returned from Supabase query")
+                return {
+                    'success': False,
+                    'error': 'No data returned from query'
+                }
+
+        except Exception as e:
+            logging.error(f"Error retrieving OCR results from Supabase: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    async def store_insights(self, result_id, insights):
+        """
+        Store generated insights and recommendations on an information row
+        (insights column)
+
+        Args:
+            result_id (int): ID of the OCR result
+            insights (dict): Insights, recommendations and the fingerprint of
+                             the document they were generated from
+
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            query = self.client.table('information').update({'insights': insights}).eq('id', result_id)
+            query.params = query.params.add('select', 'id')
+            result = await query.execute()
+
+            if result.data:
+                logging.info(f"Insights stored for OCR result {result_id}")
+                return {
+                    'success': True,
+                    'message': f'Insights stored for OCR result {result_id}'
+                }
+            else:
+                logging.error(f"No result found with ID {result_id}")
+                return {
+                    'success': False,
+                    'error': f'No result found with ID {result_id}'
+                }
+
+        except Exception as e:
+            logging.error(f"Error storing insights for OCR result {result_id}: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    async def get_insights(self, result_id):
+        """
+        Retrieve an information row's document and stored insights
+
+        Args:
+            result_id (int): ID of the OCR result
+
+        Returns:
+            dict: Result of the operation; data has id, info and insights
+                  (None until generated), or is None if the row does not exist
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            result = await self.client.table('information').select('id', 'info', 'insights').eq('id', result_id).execute()
+            rows = result.data or []
+            return {
+                'success': True,
+                'data': rows[0] if rows else None
+            }
+
+        except Exception as e:
+            logging.error(f"Error retrieving insights for OCR result {result_id}: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    async def get_medication_records(self, email=None, limit=100, offset=0, before_id=None):
+        """
+        Retrieve only the information rows that list medications, projected
+        down to their medications sub-object (see SupabaseService)
+
+        Args:
+            email (str, optional): Filter by email
+            limit (int): Maximum number of matching rows to return
+            offset (int): Number of matching rows to skip (for paging)
+            before_id (int, optional): Only rows with a lower id (keyset paging,
+                                       stable while rows are inserted)
+
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            query = self.client.table('information').select(
+                'id', 'email', 'created_at', f'medications:{MEDICATIONS_PATH}'
+            )
+            query.params = query.params.add(
+                'or', '(' + ','.join(f'{path}.neq.[]' for path in MEDICATION_LIST_PATHS) + ')'
+            )
+            query = query.order('id', desc=True).limit(limit)
+            if offset:
+                query.params = query.params.add('offset', offset)
+            if before_id is not None:
+                query = query.lt('id', before_id)
+
+            if email:
+                query = query.eq('email', email)
+
+            result = await query.execute()
+
+            if result.data is not None:
+                logging.info(f"Retrieved {len(result.data)} information rows with medications")
+                return {
+                    'success': True,
+                    'data': result.data,
+                    'count': len(result.data)
+                }
+            else:
+                logging.error("No data returned from Supabase query")
+                return {
+                    'success': False,
+                    'error': 'No data returned from query'
+                }
+
+        except Exception as e:
+            logging.error(f"Error retrieving medication records from Supabase: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    async def delete_ocr_result(self, result_id):
+        """
+        Delete an OCR result by ID
+
+        Args:
+            result_id (int): ID of the result to delete
+
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            result = await self.client.table('information').delete().eq('id', result_id).execute()
+
+            if result.data:
+                logging.info(f"OCR result {result_id} deleted successfully")
+                await self._update_medication_index(self.medication_index.remove, [result_id])
+                return {
+                    'success': True,
+                    'message': f'OCR result {result_id} deleted successfully'
+                }
+            else:
+                logging.error(f"No result found with ID {result_id}")
+                return {
+                    'success': False,
+                    'error': f'No result found with ID {result_id}'
+                }
+
+        except Exception as e:
+            logging.error(f"Error deleting OCR result {result_id}: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    async def delete_ocr_results(self, ids=None, email=None, start_date=None, end_date=None):
+        """
+        Delete every OCR result matching the given filters in one request
+
+        Args:
+            ids (list, optional): IDs of the results to delete
+            email (str, optional): Only delete results for this email
+            start_date (str, optional): Created on or after this date (YYYY-MM-DD)
+            end_date (str, optional): Created on or before this date (YYYY-MM-DD)
+
+        Returns:
+            dict: Result of the operation with the deleted count and IDs
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            if not has_row_filter(ids, email, start_date, end_date):
+                return {
+                    'success': False,
+                    'error': 'At least one of ids, email, start_date or end_date is required'
+                }
+
+            query = apply_row_filters(self.client.table('information').delete(),
+                                      ids, email, start_date, end_date)
+            query.params = query.params.add('select', 'id')
+            result = await query.execute()
+
+            deleted_ids = [row['id'] for row in result.data or []]
+            logging.info(f"Deleted {len(deleted_ids)} OCR results")
+            await self._update_medication_index(self.medication_index.remove, deleted_ids)
+            return {
+                'success': True,
+                'deleted': len(deleted_ids),
+                'ids': deleted_ids,
+                'message': f'Deleted {len(deleted_ids)} OCR results'
+            }
+
+        except Exception as e:
+            logging.error(f"Error bulk deleting OCR results: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    async def update_ocr_results(self, updates=None, info_patch=None, ids=None, email=None,
+                                 start_date=None, end_date=None):
+        """
+        Patch the info of many OCR results in one request, merged in Postgres
+        by patch_ocr_info (see SupabaseService.update_ocr_results)
+
+        Returns:
+            dict: Result of the operation with the updated count and IDs
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            params = patch_rpc_params(updates, info_patch, ids, email, start_date, end_date)
+            if params is None:
+                return {
+                    'success': False,
+                    'error': 'Provide updates, or info together with ids, email, start_date or end_date'
+                }
+
+            # AsyncPostgrestClient.rpc is itself a coroutine returning the builder
+            query = await self.client.rpc('patch_ocr_info', params)
+            query.params = query.params.add('select', 'id,email,created_at,info')
+            rows = (await query.execute()).data or []
+
+            updated_ids = [row['id'] for row in rows]
+            for row in rows:
+                await self._update_medication_index(self.medication_index.put, row)
+            missing_ids = sorted({patch['id'] for patch in params['patches']} - set(updated_ids)) if updates else []
+            logging.info(f"Updated {len(updated_ids)} OCR results")
+            return {
+                'success': True,
+                'updated': len(updated_ids),
+                'ids': updated_ids,
+                'missing_ids': missing_ids,
+                'message': f'Updated {len(updated_ids)} OCR results'
+            }
+
+        except Exception as e:
+            logging.error(f"Error bulk updating OCR results: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    # User Authentication Methods
+    async def authenticate_user(self, email, password):
+        """
+        Authenticate user with email and password
+
+        Args:
+            email (str): User's email
+            password (str): User's password
+
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            result = await self.client.table('users').select('*').eq('email', email).execute()
+
+            if not result.data:
+                return {
+                    'success': False,
+                    'error': 'Invalid credentials'
+                }
+
+            user = result.data[0]
+
+            if not self.verify_password(password, user['password_hash']):
+                return {
+                    'success': False,
+                    'error': 'Invalid credentials'
+                }
+
+            return {
+                'success': True,
+                'data': self._public_user(user)
+            }
+
+        except Exception as e:
+            logging.error(f"Error authenticating user: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    async def get_user_by_id(self, user_id):
+        """
+        Get user by ID
+
+        Args:
+            user_id (str): User's ID
+
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            result = await self.client.table('users').select('*').eq('id', user_id).execute()
+
+            if not result.data:
+                return {
+                    'success': False,
+                    'error': 'User not found'
+                }
+
+            return {
+                'success': True,
+                'data': self._public_user(result.data[0])
+            }
+
+        except Exception as e:
+            logging.error(f"Error getting user by ID: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    async def issue_calendar_feed_token(self, user_id):
+        """
+        Create a new random calendar feed token for a user, replacing the
+        previous one (see SupabaseService.issue_calendar_feed_token)
+
+        Args:
+            user_id (str): User's ID
+
+        Returns:
+            dict: Result of the operation; token is only returned here
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            token = secrets.token_urlsafe(32)
+            query = self.client.table('users').update(
+                {'calendar_feed_token_hash': calendar_token_hash(token)}
+            ).eq('id', user_id)
+            query.params = query.params.add('select', 'id')
+            result = await query.execute()
+
+            if not result.data:
+                return {
+                    'success': False,
+                    'error': 'User not found'
+                }
+
+            return {
+                'success': True,
+                'token': token
+            }
+
+        except Exception as e:
+            logging.error(f"Error issuing calendar feed token: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    async def get_user_by_calendar_token(self, token):
+        """
+        Get the user a calendar feed token was issued to
+
+        Args:
+            token (str): Token from issue_calendar_feed_token
+
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+
+        try:
+            result = await self.client.table('users').select('id', 'email').eq(
+                'calendar_feed_token_hash', calendar_token_hash(token)
+            ).execute()
+
+            if not result.data:
+                return {
+                    'success': False,
+                    'error': 'Unknown calendar feed'
+                }
+
+            return {
+                'success': True,
+                'data': result.data[0]
+            }
+
+        except Exception as e:
+            logging.error(f"Error getting user by calendar feed token: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    def verify_password(self, password, hashed_password):
+        """
+        Verify password against hashed password (CPU only, no I/O)
+        """
+        return verify_password_hash(password, hashed_password)
+
+    def _public_user(self, user):
+        """
+        Return user fields without the password hash
+        """
+        return {
+            'id': user['id'],
+            'email': user['email'],
+            'username': user['username'],
+            'created_at': user.get('created_at')
+        }
@@ -0,0 +1,69 @@
+import bisect
+from datetime import datetime, timedelta
+from itertools import chain, count, islice
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+class DoseTimeline:
+    """
+    Sorted daily dose timeline of a set of active medications.
+
+    Built once from the medications' HH:MM times (stable order on ties, the
+    medication order), then answers "next n doses after now" with a binary
+    search into the day and a lazy walk into the following days, without
+    re-parsing or re-sorting anything per query. Doses of a medication taken
+    on certain weekdays only are skipped on the other days.
+    """
+
+    def __init__(self, medications):
+        doses = []
+        for med in medications:
+            weekdays = frozenset(med['weekdays']) if med.get('weekdays') else None
+            for time_str in med['times']:
+                hour, minute = (int(part) for part in time_str.split(':'))
+                doses.append((hour * 3600 + minute * 60, med['name'], f"{hour:02d}:{minute:02d}", weekdays))
+        doses.sort(key=lambda dose: dose[0])
+        self.seconds = [dose[0] for dose in doses]
+        self.doses = doses
+
+    def __len__(self):
+        return len(self.doses)
+
+    def next_doses(self, now=None, n=5):
+        """
+        The next n doses strictly after now, wrapping into following days
+
+        Args:
+            now (datetime): Reference time (defaults to datetime.now())
+            n (int): Number of doses to return
+
+        Returns:
+            list: Dicts with medication, time (HH:MM), date and datetime
+        """
+        if not self.doses or n <= 0:
+            return []
+        now = now or datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = bisect.bisect_right(self.seconds, (now - midnight).total_seconds())
+
+        # Rest of today, then every following day; both are already in time
+        # order and today's doses all come first, so they just chain
+        doses = self.doses
+        weekday = now.weekday()
+        today = (doses[i][:3] for i in range(start, len(doses))
+                 if doses[i][3] is None or weekday in doses[i][3])
+        following = ((day * SECONDS_PER_DAY + seconds, name, time_str)
+                     for day in count(1) for seconds, name, time_str, weekdays in doses
+                     if weekdays is None or (weekday + day) % 7 in weekdays)
+
+        result = []
+        for seconds, name, time_str in islice(chain(today, following), n):
+            dose_time = midnight + timedelta(seconds=seconds)
+            result.append({
+                'medication': name,
+                'time': time_str,
+                'date': dose_time.date().isoformat(),
+                'datetime': dose_time.isoformat()
+            })
+        return result
@@ -0,0 +1,152 @@
+import csv
+import logging
+import os
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+
+DEFAULT_VOCABULARY_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'drug_vocabulary.csv')
+
+
+def normalize_drug_text(text):
+    """
+    Lowercase and collapse punctuation/whitespace runs to single spaces, so
+    "Amoxicillin-Clavulanate  875mg" matches the vocabulary entry
+    "amoxicillin clavulanate"
+    """
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', str(text).lower()).split())
+
+
+class DrugMatcher:
+    """
+    Aho-Corasick automaton over a drug-name vocabulary.
+
+    Each vocabulary entry maps a (normalized) drug name to its default timing
+    slots (morning/afternoon/evening/bedtime). The automaton is compiled once,
+    then finds every vocabulary name occurring in a text in a single pass over
+    its characters, independent of vocabulary size.
+    """
+
+    def __init__(self, schedules):
+        self.schedules = {}
+        # Trie transitions, failure links and the patterns ending at each node
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for name, timing in schedules.items():
+            pattern = normalize_drug_text(name)
+            if pattern:
+                self.schedules[pattern] = list(timing)
+                self._add(pattern)
+        self._link()
+
+        # Memoized per normalized name; medication names repeat across documents
+        self._schedule_cache = lru_cache(maxsize=4096)(self._schedule_for_normalized)
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Load a name,timing CSV where timing is a |-separated list of slots
+        """
+        schedules = {}
+        with open(path, newline='') as vocabulary:
+            for row in csv.DictReader(vocabulary):
+                if row.get('name') and row.get('timing'):
+                    schedules[row['name']] = [slot.strip() for slot in row['timing'].split('|') if slot.strip()]
+        return cls(schedules)
+
+    def _add(self, pattern):
+        node = 0
+        for char in pattern:
+            if char not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][char] = len(self._goto) - 1
+            node = self._goto[node][char]
+        self._output[node].append(pattern)
+
+    def _link(self):
+        """
+        Breadth-first construction of failure links; each node also inherits
+        the outputs of its failure target so matches ending there are reported
+        """
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def _scan(self, normalized):
+        """
+        Yield (start, end, pattern) for every vocabulary occurrence
+        """
+        node = 0
+        for index, char in enumerate(normalized):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for pattern in self._output[node]:
+                yield index + 1 - len(pattern), index + 1, pattern
+
+    def find_all(self, text):
+        """
+        Vocabulary names found as whole words in text, longest match first at
+        overlapping positions, in order of appearance
+        """
+        normalized = normalize_drug_text(text)
+        matches = [
+            (start, end, pattern) for start, end, pattern in self._scan(normalized)
+            if (start == 0 or normalized[start - 1] == ' ') and (end == len(normalized) or normalized[end] == ' ')
+        ]
+        matches.sort(key=lambda match: (match[0], -(match[1] - match[0])))
+
+        found = []
+        covered_until = 0
+        for start, end, pattern in matches:
+            if start >= covered_until:
+                found.append(pattern)
+                covered_until = end
+        return found
+
+    def schedule_for(self, med_name):
+        """
+        Default timing slots for a medication name, or None if no vocabulary
+        name occurs in it. Substrings count ("multivitamin" contains
+        "vitamin"); the longest occurring name wins.
+        """
+        return self._schedule_cache(normalize_drug_text(med_name))
+
+    def _schedule_for_normalized(self, normalized):
+        best = None
+        for _, _, pattern in self._scan(normalized):
+            if best is None or len(pattern) > len(best):
+                best = pattern
+        return tuple(self.schedules[best]) if best else None
+
+
+_drug_matcher = None
+_drug_matcher_lock = threading.Lock()
+
+
+def get_drug_matcher():
+    """
+    Process-wide DrugMatcher compiled from DRUG_VOCABULARY_PATH (defaults to
+    the bundled app/data/drug_vocabulary.csv)
+    """
+    global _drug_matcher
+    if _drug_matcher is None:
+        with _drug_matcher_lock:
+            if _drug_matcher is None:
+                path = os.getenv('DRUG_VOCABULARY_PATH', DEFAULT_VOCABULARY_PATH)
+                _drug_matcher = DrugMatcher.from_csv(path)
+                logging.info(f"Compiled drug matcher with {len(_drug_matcher.schedules)} names from {path}")
+    return _drug_matcher
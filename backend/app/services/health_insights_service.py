@@ -0,0 +1,212 @@
+import hashlib
+import json
+import re
+from typing import Any, Dict, List
+
+# Fields that do not change what the document says about the patient's health
+NON_CLINICAL_FIELDS = {
+    'source_quality_notes',  # parser diagnostics
+    'raw',                   # unnormalized OCR strings next to their parsed value
+    'clinical_staff',        # who filled in the form
+    'id', 'email', 'user_id', 'created_at'
+}
+
+# Placeholder values the OCR parser uses for empty fields
+EMPTY_VALUES = {'', 'n/a', 'na', 'none', 'null'}
+
+
+def clinical_view(data: Any) -> Any:
+    """
+    The clinically relevant part of a parsed document: non-clinical fields,
+    nulls, empty placeholders and empty containers are dropped and whitespace
+    in strings is collapsed. Returns None if nothing is left.
+    """
+    if isinstance(data, dict):
+        view = {}
+        for key, value in data.items():
+            if key in NON_CLINICAL_FIELDS:
+                continue
+            value = clinical_view(value)
+            if value is not None:
+                view[key] = value
+        return view or None
+    if isinstance(data, list):
+        items = [item for item in (clinical_view(value) for value in data) if item is not None]
+        return items or None
+    if isinstance(data, str):
+        text = ' '.join(data.split())
+        return None if text.lower() in EMPTY_VALUES else text
+    return data
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    if isinstance(value, list):
+        items = [_canonical(item) for item in value]
+        # Order of listed medications, symptoms etc. carries no meaning
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    if isinstance(value, str):
+        return value.casefold()
+    return value
+
+
+def document_fingerprint(data: Dict[str, Any]) -> str:
+    """
+    Stable digest of a document's clinical content; documents that differ only
+    in non-clinical fields, case, whitespace or list order share it
+    """
+    canonical = json.dumps(_canonical(clinical_view(data)), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+# Prompt compaction. Sections dropped, in this order, when a document is over
+# the prompt token budget; CORE_SECTIONS are never dropped and 'hpi' only
+# after any section not listed here.
+LOW_VALUE_SECTIONS = ['review_of_systems', 'location_of_care', 'visit_type', 'doc_type',
+                      'date_of_service', 'patient_name']
+LAST_RESORT_SECTIONS = ['hpi']
+CORE_SECTIONS = {'vitals', 'medications', 'allergies', 'chief_complaint', 'impression_or_diagnosis'}
+# Sections whose fields all record the same kind of finding, so identical
+# values can be written once; elsewhere equal values mean different things
+UNIFORM_SECTIONS = {'review_of_systems'}
+
+# Rough token estimate for English and JSON text with the GPT tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _collapse(view: Any, section: str = None) -> Any:
+    """
+    {"value": 98.6} -> 98.6, and in UNIFORM_SECTIONS a group of identical
+    findings such as a review of systems that is unremarkable throughout ->
+    {"all": "unremarkable", "fields": ["chest", "ent", "eyes"]}
+    """
+    if isinstance(view, dict):
+        view = {key: _collapse(value, key) for key, value in view.items()}
+        if list(view) == ['value']:
+            return view['value']
+        values = list(view.values())
+        if (section in UNIFORM_SECTIONS and len(values) > 2
+                and all(isinstance(value, str) for value in values) and len(set(values)) == 1):
+            return {'all': values[0], 'fields': sorted(view)}
+        return view
+    if isinstance(view, list):
+        return [_collapse(value) for value in view]
+    return view
+
+
+def compact_document(data: Dict[str, Any], max_tokens: int = None) -> Dict[str, Any]:
+    """
+    Render a parsed document for a prompt in as few tokens as possible
+
+    Keeps only the clinical view (see clinical_view), collapses redundant
+    structure and writes compact JSON with sorted keys. Over max_tokens,
+    whole sections are dropped, least useful first, until it fits or only
+    core sections are left.
+
+    Args:
+        data (dict): Parsed document data
+        max_tokens (int): Token budget for the document text (None for no limit)
+
+    Returns:
+        dict: text, tokens (estimated), original_tokens (the Python repr the
+              prompts used to embed), saved_tokens and dropped (section names)
+    """
+    view = _collapse(clinical_view(data)) or {}
+    if not isinstance(view, dict):
+        view = {'document': view}
+
+    def render(document):
+        return json.dumps(document, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+    text = render(view)
+    dropped = []
+    if max_tokens is not None and estimate_tokens(text) > max_tokens:
+        unlisted = [key for key in view
+                    if key not in CORE_SECTIONS and key not in LOW_VALUE_SECTIONS and key not in LAST_RESORT_SECTIONS]
+        for key in LOW_VALUE_SECTIONS + unlisted + LAST_RESORT_SECTIONS:
+            if key not in view:
+                continue
+            del view[key]
+            dropped.append(key)
+            text = render(view)
+            if estimate_tokens(text) <= max_tokens:
+                break
+
+    tokens = estimate_tokens(text)
+    original_tokens = estimate_tokens(str(data))
+    return {
+        'text': text,
+        'tokens': tokens,
+        'original_tokens': original_tokens,
+        'saved_tokens': max(original_tokens - tokens, 0),
+        'dropped': dropped
+    }
+
+
+class JsonArrayStream:
+    """
+    Incremental reader of the objects in one array of a JSON document that
+    arrives in pieces, such as {"insights": [{...}, {...}]} streamed from a
+    model. feed() returns each object of the array as soon as its closing
+    brace arrives, without waiting for the rest of the document.
+    """
+
+    def __init__(self, key: str):
+        self._start_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self.buffer = ''
+        self.position = None  # scan position once the array has started
+        self.depth = 0
+        self.item_start = None
+        self.in_string = False
+        self.escaped = False
+        self.done = False
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Add the next piece of the document; returns the objects it completed
+        """
+        self.buffer += text
+        items = []
+        if self.done:
+            return items
+        if self.position is None:
+            match = self._start_re.search(self.buffer)
+            if match is None:
+                return items
+            self.position = match.end()
+
+        buffer = self.buffer
+        for position in range(self.position, len(buffer)):
+            char = buffer[position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                if self.depth == 0:
+                    self.item_start = position
+                self.depth += 1
+            elif char in '}]':
+                if self.depth == 0:
+                    # End of the array
+                    self.done = True
+                    break
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        items.append(json.loads(buffer[self.item_start:position + 1]))
+                    except ValueError:
+                        pass
+                    self.item_start = None
+        self.position = len(buffer)
+        return items
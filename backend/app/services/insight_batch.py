@@ -0,0 +1,264 @@
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import openai
+from app.services.llm_client import LLMBusyError
+from app.utils.rate_limiter import RateLimiter
+from app.utils.shared_cache import get_shared_cache
+
+# Errors worth another attempt after a pause; anything else fails the document
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                    openai.InternalServerError, LLMBusyError)
+
+
+class InsightBatchJob:
+    """
+    Generates answers for many documents in a background thread.
+
+    Each document is looked up first (the response cache) and only misses
+    call the model. Calls go out through the shared RateLimiter, sized to the
+    account's request and token quotas, from at most `concurrency` threads.
+    A 429 pauses the limiter for every thread (Retry-After, or exponential
+    backoff with jitter) before the document is retried, so a batch settles
+    at the quota instead of failing on it.
+
+    With a SharedCache the job publishes its progress and each finished
+    result there, so any worker on the host can answer status queries (see
+    get_batch_snapshot).
+    """
+
+    def __init__(self, documents, lookup, generate, estimate_tokens, limiter, kind='insights',
+                 concurrency=4, max_attempts=5, backoff_base=1.0, backoff_cap=60.0, acquire_timeout=600,
+                 cache=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.documents = documents
+        self.lookup = lookup
+        self.generate = generate
+        self.estimate_tokens = estimate_tokens
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.acquire_timeout = acquire_timeout
+        self.cache = cache
+
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.results = [{'index': index, 'status': 'pending', 'attempts': 0} for index in range(len(documents))]
+        self.counters = {'cached': 0, 'generated': 0, 'fallback': 0, 'failed': 0, 'retries': 0, 'rate_limited': 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            self._publish()
+        self._thread = threading.Thread(target=self._run, name=f"insight-batch-{self.id[:8]}", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        with self._lock:
+            self.status = 'running'
+            self.started_at = time.time()
+            self._publish()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency,
+                                    thread_name_prefix=f"insight-batch-{self.id[:8]}") as pool:
+                list(pool.map(self._process, range(len(self.documents))))
+        except Exception as e:
+            logging.error(f"Insight batch {self.id} failed: {e}")
+        with self._lock:
+            self.finished_at = time.time()
+            self.status = 'done'
+            self._publish()
+        logging.info(f"Insight batch {self.id} done in {self.finished_at - self.started_at:.1f}s: {self.counters}")
+
+    def _process(self, index):
+        document = self.documents[index]
+        result = self.results[index]
+        try:
+            cached = self.lookup(document)
+        except Exception as e:
+            logging.warning(f"Insight batch {self.id} cache lookup failed for document {index}: {e}")
+            cached = None
+        if cached is not None:
+            self._finish(result, 'cached', data=cached['data'])
+            return
+
+        tokens = self.estimate_tokens(document)
+        for attempt in range(self.max_attempts):
+            result['attempts'] = attempt + 1
+            if not self.limiter.acquire(tokens=tokens, timeout=self.acquire_timeout):
+                self._finish(result, 'failed', error='Timed out waiting for rate limit capacity')
+                return
+            try:
+                response_data, generated = self.generate(document)
+            except RETRYABLE_ERRORS as e:
+                if attempt + 1 == self.max_attempts:
+                    self._finish(result, 'failed', error=str(e))
+                    return
+                delay = self._retry_delay(e, attempt)
+                with self._lock:
+                    self.counters['retries'] += 1
+                    if isinstance(e, openai.RateLimitError):
+                        self.counters['rate_limited'] += 1
+                if isinstance(e, openai.RateLimitError):
+                    # Everyone waits, not just this thread
+                    self.limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+                continue
+            except Exception as e:
+                self._finish(result, 'failed', error=str(e))
+                return
+            self._finish(result, 'generated' if generated else 'fallback', data=response_data['data'])
+            return
+
+    def _retry_delay(self, error, attempt):
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                return min(self.backoff_cap, float(response.headers.get('retry-after')))
+            except (TypeError, ValueError):
+                pass
+        return random.uniform(0.5, 1.0) * min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+
+    def _finish(self, result, status, data=None, error=None):
+        with self._lock:
+            result['status'] = status
+            if data is not None:
+                result['data'] = data
+            if error is not None:
+                result['error'] = error
+            self.counters[status] += 1
+            self._publish(result)
+
+    def snapshot(self, include_results=True):
+        with self._lock:
+            snapshot = self._summary()
+            if include_results:
+                snapshot['results'] = [dict(result) for result in self.results]
+        return snapshot
+
+    def _summary(self):
+        completed = sum(self.counters[status] for status in ('cached', 'generated', 'fallback', 'failed'))
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'documents': len(self.documents),
+            'completed': completed,
+            'counters': dict(self.counters),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+    def _publish(self, result=None):
+        """
+        Write the summary (and a finished result) to the shared cache; called
+        with the job lock held so summaries are written in order
+        """
+        if self.cache is None:
+            return
+        try:
+            if result is not None and not self.cache.set(_result_key(self.id, result['index']), result,
+                                                          ttl=BATCH_JOB_TTL):
+                # Too large for a cache slot: other workers see the status only
+                self.cache.set(_result_key(self.id, result['index']),
+                               dict({key: value for key, value in result.items() if key != 'data'},
+                                    data_omitted=True), ttl=BATCH_JOB_TTL)
+            self.cache.set(_summary_key(self.id), self._summary(), ttl=BATCH_JOB_TTL)
+        except Exception as e:
+            logging.warning(f"Insight batch {self.id} could not publish progress: {e}")
+
+
+MAX_BATCH_JOBS = 100
+# How long other workers can query a job after its last progress
+BATCH_JOB_TTL = 24 * 3600
+_batch_jobs = OrderedDict()
+_batch_jobs_lock = threading.Lock()
+
+
+def _summary_key(job_id):
+    return f"insights:batch:{job_id}"
+
+
+def _result_key(job_id, index):
+    return f"insights:batch:{job_id}:{index}"
+
+
+def submit_batch_job(job):
+    """
+    Start job and keep it for status queries; the oldest finished jobs are
+    forgotten beyond MAX_BATCH_JOBS
+    """
+    with _batch_jobs_lock:
+        _batch_jobs[job.id] = job
+        for job_id in list(_batch_jobs):
+            if len(_batch_jobs) <= MAX_BATCH_JOBS:
+                break
+            if _batch_jobs[job_id].status == 'done':
+                del _batch_jobs[job_id]
+    job.start()
+    return job
+
+
+def get_batch_snapshot(job_id, include_results=True, cache=None):
+    """
+    Progress (and results) of a batch job, from this worker if it runs the
+    job, else as published to the shared cache by the worker that does.
+    Returns None for an unknown job.
+    """
+    with _batch_jobs_lock:
+        job = _batch_jobs.get(job_id)
+    if job is not None:
+        return job.snapshot(include_results)
+    cache = cache or get_shared_cache()
+    if cache is None:
+        return None
+    snapshot = cache.get(_summary_key(job_id))
+    if snapshot is None:
+        return None
+    if include_results:
+        snapshot['results'] = [cache.get(_result_key(job_id, index)) or {'index': index, 'status': 'pending'}
+                               for index in range(snapshot['documents'])]
+    return snapshot
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_openai_rate_limiter():
+    """
+    Process-wide limiter for batch OpenAI calls, sized by
+    OPENAI_REQUESTS_PER_MINUTE and OPENAI_TOKENS_PER_MINUTE. Its buckets live
+    in the shared cache so all workers on the host share the quota; without
+    the cache each worker gets 1/WEB_CONCURRENCY of it.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                cache = get_shared_cache()
+                workers = 1 if cache is not None else max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+                _rate_limiter = RateLimiter(
+                    requests_per_minute=int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', 500)) / workers,
+                    tokens_per_minute=int(os.getenv('OPENAI_TOKENS_PER_MINUTE', 60000)) / workers,
+                    cache=cache,
+                    key='openai:rate-limiter'
+                )
+    return _rate_limiter
@@ -0,0 +1,192 @@
+import re
+from typing import Any, Dict, List, Optional
+
+# Adult thresholds (blood pressure per the ACC/AHA categories)
+BP_CRISIS = (180, 120)
+BP_STAGE_2 = (140, 90)
+BP_STAGE_1 = (130, 80)
+BP_ELEVATED_SYSTOLIC = 120
+BP_LOW = (90, 60)
+PULSE_RANGE = (60, 100)
+RESP_RATE_RANGE = (12, 20)
+FEVER_F = 100.4
+LOW_TEMPERATURE_F = 95.0
+
+EMPTY_VALUES = {'', 'n/a', 'na', 'none', 'null', 'no', 'nkda', 'nka', 'no known allergies'}
+
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+_BP_RE = re.compile(r'(\d{2,3})\s*/\s*(\d{2,3})')
+
+
+def _value(field: Any) -> Any:
+    """
+    A parsed field's value: {"value": 98.6, "raw": ...} -> 98.6
+    """
+    if isinstance(field, dict):
+        return field.get('value')
+    return field
+
+
+def _number(field: Any) -> Optional[float]:
+    value = _value(field)
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value)) if value is not None else None
+    return float(match.group()) if match else None
+
+
+def _names(field: Any) -> List[str]:
+    """
+    Medication or allergy names from a list or a comma/semicolon separated string
+    """
+    if field is None or isinstance(field, bool):
+        return []
+    items = field if isinstance(field, list) else re.split(r'[;,\n]', str(field))
+    names = []
+    for item in items:
+        name = ' '.join(str(_value(item) or '').split())
+        if name and name.lower() not in EMPTY_VALUES:
+            names.append(name)
+    return names
+
+
+def _join(names: List[str]) -> str:
+    return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} and {names[-1]}"
+
+
+def _blood_pressure(field: Any) -> Optional[Dict[str, str]]:
+    match = _BP_RE.search(str(_value(field) or ''))
+    if not match:
+        return None
+    systolic, diastolic = int(match.group(1)), int(match.group(2))
+    reading = f"{systolic}/{diastolic}"
+    if systolic >= BP_CRISIS[0] or diastolic >= BP_CRISIS[1]:
+        return {'title': 'Very High Blood Pressure',
+                'description': f"Your blood pressure of {reading} is in a dangerous range. "
+                               "Get medical help right away, especially if you have chest pain, "
+                               "headache or trouble breathing."}
+    if systolic >= BP_STAGE_2[0] or diastolic >= BP_STAGE_2[1]:
+        return {'title': 'High Blood Pressure',
+                'description': f"Your blood pressure of {reading} is high. "
+                               "Talk with your doctor about how to bring it down."}
+    if systolic >= BP_STAGE_1[0] or diastolic >= BP_STAGE_1[1]:
+        return {'title': 'Blood Pressure Elevated',
+                'description': f"Your blood pressure of {reading} is higher than ideal. "
+                               "Checking it regularly helps you and your doctor see if it stays up."}
+    if systolic < BP_LOW[0] or diastolic < BP_LOW[1]:
+        return {'title': 'Low Blood Pressure',
+                'description': f"Your blood pressure of {reading} is on the low side. "
+                               "Tell your doctor if you feel dizzy or faint."}
+    if systolic >= BP_ELEVATED_SYSTOLIC:
+        return {'title': 'Blood Pressure Slightly High',
+                'description': f"Your blood pressure of {reading} is slightly above normal. "
+                               "Healthy habits can help keep it from rising."}
+    return {'title': 'Blood Pressure Normal',
+            'description': f"Your blood pressure of {reading} is in the healthy range."}
+
+
+def _pulse(field: Any) -> Optional[Dict[str, str]]:
+    pulse = _number(field)
+    if pulse is None:
+        return None
+    if pulse > PULSE_RANGE[1]:
+        return {'title': 'Fast Heart Rate',
+                'description': f"Your heart rate of {pulse:g} beats per minute is faster than normal. "
+                               "Fever, stress or some medicines can cause this, so mention it to your doctor."}
+    if pulse < PULSE_RANGE[0]:
+        return {'title': 'Slow Heart Rate',
+                'description': f"Your heart rate of {pulse:g} beats per minute is slower than usual. "
+                               "This can be normal if you are very fit; tell your doctor if you feel tired or dizzy."}
+    return {'title': 'Heart Rate Normal',
+            'description': f"Your heart rate of {pulse:g} beats per minute is in the normal range."}
+
+
+def _temperature(field: Any) -> Optional[Dict[str, str]]:
+    temperature = _number(field)
+    if temperature is None:
+        return None
+    unit = str(field.get('unit') or '').upper() if isinstance(field, dict) else ''
+    # Celsius readings are converted; a bare value below 45 can only be Celsius
+    fahrenheit = temperature * 9 / 5 + 32 if unit.startswith('C') or temperature < 45 else temperature
+    if fahrenheit >= FEVER_F:
+        return {'title': 'You Have a Fever',
+                'description': f"Your temperature of {fahrenheit:.1f}°F means you have a fever. "
+                               "Rest, drink fluids and call your doctor if it keeps rising."}
+    if fahrenheit < LOW_TEMPERATURE_F:
+        return {'title': 'Low Body Temperature',
+                'description': f"Your temperature of {fahrenheit:.1f}°F is lower than normal. "
+                               "Keep warm and let your doctor know."}
+    return {'title': 'Temperature Normal',
+            'description': f"Your temperature of {fahrenheit:.1f}°F is normal, so there is no sign of fever."}
+
+
+def _respiratory_rate(field: Any) -> Optional[Dict[str, str]]:
+    rate = _number(field)
+    if rate is None or RESP_RATE_RANGE[0] <= rate <= RESP_RATE_RANGE[1]:
+        return None
+    if rate > RESP_RATE_RANGE[1]:
+        return {'title': 'Fast Breathing',
+                'description': f"You were breathing {rate:g} times a minute, faster than normal. "
+                               "Tell your doctor if you feel short of breath."}
+    return {'title': 'Slow Breathing',
+            'description': f"You were breathing {rate:g} times a minute, slower than normal."}
+
+
+def rule_based_insights(data: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    Patient-facing insights from fixed rules over a parsed document: vital
+    sign thresholds, medication changes and allergies. Deterministic and
+    local, so it answers instantly while (or instead of) the model.
+
+    Args:
+        data (dict): Parsed document data
+
+    Returns:
+        list: Insights with title and description, most urgent first
+    """
+    if not isinstance(data, dict):
+        return []
+    insights = []
+
+    vitals = data.get('vitals') if isinstance(data.get('vitals'), dict) else {}
+    for rule, field in ((_blood_pressure, 'blood_pressure'), (_pulse, 'pulse_rate'),
+                        (_temperature, 'temperature'), (_respiratory_rate, 'resp_rate')):
+        insight = rule(vitals.get(field)) if vitals.get(field) is not None else None
+        if insight is not None:
+            insights.append(insight)
+
+    medications = data.get('medications') if isinstance(data.get('medications'), dict) else {}
+    added = _names(medications.get('added_or_changed'))
+    deleted = _names(medications.get('deleted'))
+    if added:
+        insights.append({
+            'title': 'New Medication Added' if len(added) == 1 else 'New Medications Added',
+            'description': f"{_join(added)} {'was' if len(added) == 1 else 'were'} added or changed at this visit. "
+                           "Make sure you know how and when to take "
+                           f"{'it' if len(added) == 1 else 'each one'}."
+        })
+    if deleted:
+        insights.append({
+            'title': 'Medication Stopped' if len(deleted) == 1 else 'Medications Stopped',
+            'description': f"Your doctor stopped {_join(deleted)}. "
+                           f"Do not keep taking {'it' if len(deleted) == 1 else 'them'} unless your doctor tells you to."
+        })
+
+    allergies = data.get('allergies') if isinstance(data.get('allergies'), dict) else {}
+    new_allergies = _names(allergies.get('new_allergies'))
+    if new_allergies:
+        insights.append({
+            'title': 'Allergy Alert',
+            'description': f"A new allergy to {_join(new_allergies)} was recorded. "
+                           "Tell every doctor and pharmacist about it before you take a new medicine."
+        })
+    elif allergies.get('unchanged_from_summary') is True:
+        insights.append({
+            'title': 'No New Allergies',
+            'description': 'No new allergies were found at this visit, so your allergy list stays the same.'
+        })
+
+    urgent = {'Very High Blood Pressure', 'You Have a Fever', 'Allergy Alert', 'High Blood Pressure'}
+    return sorted(insights, key=lambda insight: insight['title'] not in urgent)
@@ -0,0 +1,441 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import httpx
+import openai
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.completion_usage import CompletionUsage
+from app.services.health_insights_service import estimate_tokens
+from app.utils.resilience import LatencyWindow
+
+
+class LLMBusyError(Exception):
+    """Raised when no LLM call slot frees up before the caller's deadline"""
+
+
+class LLMClient:
+    """
+    Process-wide OpenAI client shared by all request threads.
+
+    One openai.OpenAI over one pooled httpx.Client, so calls reuse warm
+    keep-alive connections instead of paying client construction and a TLS
+    handshake each time. Every call has a deadline covering both the wait for
+    a slot and the request itself, and at most max_concurrency calls run at
+    once; a caller that cannot get a slot before its deadline gets
+    LLMBusyError rather than queueing on the connection pool.
+
+    The library's own retries are off by default (OPENAI_MAX_RETRIES) so the
+    deadline bounds the whole call.
+
+    With hedge=True, a chat() call still running after the recent
+    hedge_percentile latency sends an identical second request, if a call
+    slot is free and hedges stay under max_hedge_ratio of calls. The first
+    to finish is returned and the other is cancelled. Both requests are
+    streamed internally, so cancelling closes the loser's connection and
+    OpenAI stops generating it. With stream_usage=True (the default) the
+    streams ask for the real token usage (stream_options.include_usage);
+    otherwise, or if the server does not send it, usage is estimated from
+    the text and the response has usage_estimated=True.
+    """
+
+    def __init__(self, api_key=None, base_url=None, timeout=30.0, connect_timeout=5.0, max_retries=0,
+                 max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0,
+                 max_concurrency=8, transport=None, hedge=False, hedge_percentile=95,
+                 hedge_min_delay=1.0, max_hedge_ratio=0.05, hedge_min_samples=20, stream_usage=True):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_concurrency = max_concurrency
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.hedge_min_samples = hedge_min_samples
+        self.stream_usage = stream_usage
+        self.http_client = httpx.Client(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            transport=transport
+        )
+        self.client = openai.OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            max_retries=max_retries,
+            http_client=self.http_client
+        )
+        self.counters = {'calls': 0, 'successes': 0, 'failures': 0, 'timeouts': 0, 'busy': 0,
+                         'hedges': 0, 'hedge_wins': 0, 'hedges_skipped': 0}
+        self.in_flight = 0
+        self.waiting = 0
+        # Latency of chat() as callers see it, and of its first attempt alone
+        # (projected from its progress when a hedge won), to show what hedging saves
+        self.latency = LatencyWindow()
+        self.unhedged_latency = LatencyWindow()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._hedge_pool = (ThreadPoolExecutor(max_workers=2 * max_concurrency, thread_name_prefix='llm-hedge')
+                            if hedge else None)
+
+    def chat(self, timeout=None, **kwargs):
+        """
+        client.chat.completions.create(**kwargs) within a deadline
+
+        Args:
+            timeout (float): Seconds for the whole call, slot wait included
+                (defaults to the client timeout)
+            **kwargs: Arguments for chat.completions.create
+
+        Returns:
+            ChatCompletion: The completion
+        """
+        deadline = self._acquire(timeout)
+        started = time.monotonic()
+        try:
+            if self.hedge:
+                # The first attempt owns the call's slot and releases it when it ends
+                response = self._hedged_chat(started, deadline, kwargs)
+            else:
+                response = self.client.chat.completions.create(timeout=self._request_timeout(deadline), **kwargs)
+                self.unhedged_latency.record(time.monotonic() - started)
+        except Exception as e:
+            self._finish(e, release=not self.hedge)
+            raise
+        self.latency.record(time.monotonic() - started)
+        self._finish(release=not self.hedge)
+        return response
+
+    def _hedged_chat(self, started, deadline, kwargs):
+        """
+        The call's first attempt, plus a second one once it runs past the
+        hedge delay; returns whichever completes first
+        """
+        primary = _HedgeAttempt(self, kwargs, deadline)
+        attempts = {self._hedge_pool.submit(primary.run): primary}
+        delay = self.hedge_delay()
+        if delay is not None and started + delay < deadline:
+            done, _ = wait(attempts, timeout=max(0, started + delay - time.monotonic()))
+            if not done:
+                if self._may_hedge() and self._slots.acquire(blocking=False):
+                    with self._lock:
+                        self.in_flight += 1
+                    self._count('hedges')
+                    hedge = _HedgeAttempt(self, kwargs, deadline)
+                    attempts[self._hedge_pool.submit(hedge.run)] = hedge
+                else:
+                    self._count('hedges_skipped')
+
+        pending = set(attempts)
+        error = None
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        response = future.result()
+                        elapsed = time.monotonic() - started
+                        if attempts[future] is primary:
+                            self.unhedged_latency.record(elapsed)
+                        else:
+                            self._count('hedge_wins')
+                            self.unhedged_latency.record(
+                                primary.projected_seconds(elapsed, len(response.choices[0].message.content), deadline - started)
+                            )
+                        return response
+                    error = future.exception()
+        finally:
+            for attempt in attempts.values():
+                attempt.cancel()
+        if error is not None and not pending:
+            raise error
+        raise openai.APITimeoutError(request=httpx.Request('POST', f"{self.client.base_url}chat/completions"))
+
+    def hedge_delay(self):
+        """
+        Delay before a duplicate request: the recent hedge_percentile latency,
+        or None until enough calls have completed
+        """
+        observed = self.latency.percentile(self.hedge_percentile, self.hedge_min_samples)
+        if observed is None:
+            return None
+        return max(self.hedge_min_delay, observed)
+
+    def _may_hedge(self):
+        with self._lock:
+            return self.counters['hedges'] < self.max_hedge_ratio * max(1, self.counters['calls'])
+
+    def stream_chat(self, timeout=None, **kwargs):
+        """
+        Streamed chat.completions.create(**kwargs) within a deadline. Returns
+        once the response has started, so connection, authentication and
+        rate-limit errors are raised here rather than while iterating.
+
+        Returns:
+            ChatStream: Iterable of content deltas; holds a call slot until
+                exhausted or closed
+        """
+        deadline = self._acquire(timeout)
+        try:
+            stream = self.client.chat.completions.create(
+                timeout=self._request_timeout(deadline), stream=True, **kwargs
+            )
+        except Exception as e:
+            self._finish(e)
+            raise
+        return ChatStream(self, stream, deadline)
+
+    def _acquire(self, timeout):
+        """
+        Take a call slot; returns the call's deadline (monotonic seconds)
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._count('calls')
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=max(0, deadline - time.monotonic()))
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.in_flight += 1
+        if not acquired:
+            self._count('busy')
+            raise LLMBusyError(f"All {self.max_concurrency} OpenAI call slots busy")
+        return deadline
+
+    def _request_timeout(self, deadline):
+        remaining = max(0.001, deadline - time.monotonic())
+        return httpx.Timeout(remaining, connect=min(self.connect_timeout, remaining))
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _finish(self, error=None, release=True):
+        """
+        Release the call slot (unless a hedged call's first attempt holds it)
+        and count the outcome
+        """
+        if release:
+            self._release()
+        if error is None:
+            self._count('successes')
+        elif isinstance(error, openai.APITimeoutError):
+            self._count('timeouts')
+        else:
+            self._count('failures')
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(
+                self.counters,
+                in_flight=self.in_flight,
+                waiting=self.waiting,
+                max_concurrency=self.max_concurrency,
+                timeout_seconds=self.timeout
+            )
+        p99 = self.latency.percentile(99)
+        unhedged_p99 = self.unhedged_latency.percentile(99)
+        delay = self.hedge_delay() if self.hedge else None
+        stats['hedging'] = {
+            'enabled': self.hedge,
+            'hedge_rate': round(stats['hedges'] / max(stats['calls'], 1), 4),
+            'max_hedge_ratio': self.max_hedge_ratio,
+            'delay_ms': round(delay * 1000, 1) if delay is not None else None,
+            'p99_ms': round(p99 * 1000, 1) if p99 is not None else None,
+            'unhedged_p99_ms': round(unhedged_p99 * 1000, 1) if unhedged_p99 is not None else None,
+            'p99_saved_ms': (round(max(0.0, unhedged_p99 - p99) * 1000, 1)
+                             if p99 is not None and unhedged_p99 is not None else None)
+        }
+        return stats
+
+    def close(self):
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self.http_client.close()
+
+
+class _HedgeAttempt:
+    """
+    One request of a hedged chat() call, streamed and collected into a
+    ChatCompletion; holds a call slot until it ends. cancel() closes the
+    stream so a losing attempt stops.
+    """
+
+    def __init__(self, llm_client, kwargs, deadline):
+        self.llm_client = llm_client
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.stream = None
+        self.cancelled = False
+        self.received_chars = 0
+        self._lock = threading.Lock()
+
+    def run(self):
+        try:
+            kwargs = dict(self.kwargs)
+            if self.llm_client.stream_usage:
+                kwargs['extra_body'] = dict(kwargs.get('extra_body') or {},
+                                            stream_options={'include_usage': True})
+            stream = self.llm_client.client.chat.completions.create(
+                timeout=self.llm_client._request_timeout(self.deadline), stream=True, **kwargs
+            )
+            with self._lock:
+                self.stream = stream
+                cancelled = self.cancelled
+            if cancelled:
+                stream.response.close()
+                raise openai.APIConnectionError(request=stream.response.request)
+            return self._collect(stream)
+        finally:
+            self.llm_client._release()
+
+    def _collect(self, stream):
+        parts = []
+        chunk = None
+        finish_reason = None
+        usage = None
+        try:
+            for chunk in stream:
+                if time.monotonic() > self.deadline:
+                    raise openai.APITimeoutError(request=stream.response.request)
+                if chunk.choices:
+                    parts.append(chunk.choices[0].delta.content or '')
+                    self.received_chars += len(parts[-1])
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                # The last chunk carries the usage when include_usage was asked for
+                usage = getattr(chunk, 'usage', None) or usage
+        except httpx.TimeoutException:
+            raise openai.APITimeoutError(request=stream.response.request)
+        finally:
+            stream.response.close()
+        content = ''.join(parts)
+        estimated = usage is None
+        if not estimated:
+            # Not a declared field of the chunk model, so it arrives as a plain dict
+            usage = CompletionUsage(**usage) if isinstance(usage, dict) else CompletionUsage(
+                prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                total_tokens=usage.total_tokens
+            )
+        else:
+            # No usage in the stream, so tokens are estimated from the text
+            prompt_tokens = sum(estimate_tokens(str(message.get('content') or ''))
+                                for message in self.kwargs.get('messages', []))
+            completion_tokens = estimate_tokens(content)
+            usage = CompletionUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                    total_tokens=prompt_tokens + completion_tokens)
+        return ChatCompletion(
+            id=chunk.id if chunk is not None else '',
+            object='chat.completion',
+            created=chunk.created if chunk is not None else int(time.time()),
+            model=chunk.model if chunk is not None else self.kwargs.get('model', ''),
+            choices=[Choice(index=0, finish_reason=finish_reason or 'stop',
+                            message=ChatCompletionMessage(role='assistant', content=content))],
+            usage=usage,
+            usage_estimated=estimated
+        )
+
+    def projected_seconds(self, elapsed, total_chars, limit):
+        """
+        How long this attempt would have taken to write total_chars, from its
+        progress after elapsed seconds; elapsed itself (a lower bound) if it
+        has not written anything yet
+        """
+        if not self.received_chars:
+            return elapsed
+        return min(limit, max(elapsed, elapsed * total_chars / self.received_chars))
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            stream = self.stream
+        if stream is not None:
+            stream.response.close()
+
+
+class ChatStream:
+    """
+    Content deltas of a streamed chat completion. The deadline of the call
+    covers the whole stream; a stream still running past it raises
+    openai.APITimeoutError.
+    """
+
+    def __init__(self, llm_client, stream, deadline):
+        self.llm_client = llm_client
+        self.stream = stream
+        self.deadline = deadline
+        self._closed = False
+
+    def __iter__(self):
+        error = None
+        try:
+            for chunk in self.stream:
+                if time.monotonic() > self.deadline:
+                    raise openai.APITimeoutError(request=self.stream.response.request)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except httpx.TimeoutException:
+            error = openai.APITimeoutError(request=self.stream.response.request)
+            raise error
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.close(error)
+
+    def close(self, error=None):
+        """
+        Stop reading and release the call slot; safe to call more than once
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.stream.response.close()
+        self.llm_client._finish(error)
+
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """
+    Process-wide LLMClient configured from OPENAI_* environment variables.
+    Raises openai.OpenAIError (and retries on the next call) while
+    OPENAI_API_KEY is not set.
+    """
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = LLMClient(
+                    api_key=os.getenv('OPENAI_API_KEY'),
+                    base_url=os.getenv('OPENAI_BASE_URL') or None,
+                    timeout=float(os.getenv('OPENAI_TIMEOUT_SECONDS', 30)),
+                    connect_timeout=float(os.getenv('OPENAI_CONNECT_TIMEOUT_SECONDS', 5)),
+                    max_retries=int(os.getenv('OPENAI_MAX_RETRIES', 0)),
+                    max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', 20)),
+                    max_keepalive_connections=int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10)),
+                    max_concurrency=int(os.getenv('OPENAI_MAX_CONCURRENCY', 8)),
+                    hedge=os.getenv('OPENAI_HEDGE', 'false').lower() == 'true',
+                    hedge_percentile=float(os.getenv('OPENAI_HEDGE_PERCENTILE', 95)),
+                    hedge_min_delay=float(os.getenv('OPENAI_HEDGE_MIN_DELAY_SECONDS', 1.0)),
+                    max_hedge_ratio=float(os.getenv('OPENAI_MAX_HEDGE_RATIO', 0.05)),
+                    stream_usage=os.getenv('OPENAI_STREAM_USAGE', 'true').lower() == 'true'
+                )
+                logging.info(f"OpenAI client ready: {_llm_client.max_concurrency} concurrent calls, "
+                             f"{_llm_client.timeout}s deadline")
+    return _llm_client
@@ -0,0 +1,371 @@
+import bisect
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from app.services.medications_service import MedicationsService
+
+# Bump when MedicationsService extraction changes (names, sig parsing, timing):
+# a journal written with another version is ignored and rebuilt from Supabase
+INDEX_VERSION = 3
+
+
+def has_medications(info):
+    """
+    Same predicate as SupabaseService.get_medication_records: info.medications
+    lists something under added_or_changed or deleted
+    """
+    medications = info.get('medications') if isinstance(info, dict) else None
+    if not isinstance(medications, dict):
+        return False
+    return any(medications.get(key) not in (None, []) for key in ('added_or_changed', 'deleted'))
+
+
+class MedicationIndex:
+    """
+    Materialized per-row medication extraction, kept in step with the
+    information table by SupabaseService instead of being recomputed on every
+    request.
+
+    The index lives in memory and is persisted as an append-only JSON-lines
+    journal (version / put / del / built operations). Every worker appends its changes
+    under an fcntl lock and replays lines other workers appended before
+    answering, so all workers on a host share one index that survives
+    restarts. The journal is compacted into one put per row once it holds many
+    superseded lines.
+
+    A journal whose version line is missing or differs from INDEX_VERSION
+    was written by an older extractor; the index reports itself unbuilt so it
+    is rebuilt from Supabase on first use instead of serving stale entries.
+    """
+
+    def __init__(self, path, medications_service=None):
+        self.path = path
+        self.medications_service = medications_service or MedicationsService()
+        self.records = {}
+        self.ids = []
+        self.built = False
+        self.version = None
+        self._offset = 0
+        self._inode = None
+        self._lines = 0
+        # Memoized fingerprint per email ('' = all rows), dropped when its rows change
+        self._fingerprints = {}
+        self._lock = threading.RLock()
+
+    # Queries
+
+    def is_built(self):
+        with self._lock:
+            self._sync()
+            return self.built and self.version == INDEX_VERSION
+
+    def is_stale(self):
+        """
+        Whether the journal on disk was written by another extractor version
+        """
+        with self._lock:
+            self._sync()
+            return os.path.exists(self.path) and self.version != INDEX_VERSION
+
+    def medications(self, email=None, limit=100):
+        """
+        Medications of the `limit` most recent rows that list any, newest first,
+        each tagged with source_ocr_id and source_date
+        """
+        with self._lock:
+            self._sync()
+            result = []
+            rows = 0
+            for record_id in reversed(self.ids):
+                record = self.records[record_id]
+                if email and record['email'] != email:
+                    continue
+                result.extend(dict(med) for med in record['medications'])
+                rows += 1
+                if rows >= limit:
+                    break
+            return result
+
+    def records_for(self, email=None):
+        """
+        Indexed rows (id, email, created_at, medications), oldest first
+        """
+        with self._lock:
+            self._sync()
+            return [
+                dict(self.records[record_id], id=record_id) for record_id in self.ids
+                if not email or self.records[record_id]['email'] == email
+            ]
+
+    def emails(self):
+        """
+        Emails with at least one indexed row
+        """
+        with self._lock:
+            self._sync()
+            return sorted({record['email'] for record in self.records.values() if record['email']})
+
+    def fingerprint(self, email=None):
+        """
+        Digest of the indexed rows for email (all rows if None). It is the same
+        in every worker and changes whenever one of those rows is put or removed.
+        """
+        with self._lock:
+            self._sync()
+            key = email or ''
+            if key not in self._fingerprints:
+                digest = hashlib.sha1()
+                for record_id in self.ids:
+                    record = self.records[record_id]
+                    if email and record['email'] != email:
+                        continue
+                    digest.update(json.dumps([record_id, record['created_at'], record['medications']],
+                                             sort_keys=True).encode())
+                self._fingerprints[key] = digest.hexdigest()
+            return self._fingerprints[key]
+
+    # Updates
+
+    def put(self, row):
+        """
+        Index (or re-index) one information row with id, info, email, created_at.
+        Rows without medications are dropped from the index.
+        """
+        info = row.get('info')
+        if not has_medications(info):
+            self.remove([row['id']])
+            return
+        self._append([{
+            'op': 'put',
+            'id': row['id'],
+            'email': row.get('email'),
+            'created_at': row.get('created_at'),
+            'medications': self._extract(row['id'], row.get('created_at'), info)
+        }])
+
+    def remove(self, ids):
+        with self._lock:
+            self._sync()
+            ids = [record_id for record_id in ids if record_id in self.records]
+        if ids:
+            self._append([{'op': 'del', 'ids': ids}])
+
+    def rebuild(self, rows, if_unbuilt=False):
+        """
+        Replace the whole index with rows from get_medication_records
+        (id, email, created_at, medications).
+
+        rows may be a list or a function returning one. A function is called
+        under a host-wide rebuild lock, so only one worker loads rows from
+        Supabase at a time; with if_unbuilt=True a worker that waited for
+        another's rebuild returns without loading again. Puts and dels
+        journaled by any worker while the rows load are replayed on top of
+        them, so changes racing with the load are not lost.
+
+        Returns:
+            int: Number of rows loaded, or None if the index was already built
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + '.rebuild.lock', 'a') as rebuild_lock:
+            fcntl.flock(rebuild_lock, fcntl.LOCK_EX)
+            try:
+                if if_unbuilt and self.is_built():
+                    return None
+                start = self._journal_position()
+                if callable(rows):
+                    rows = rows()
+                operations = [{'op': 'reset'}, {'op': 'version', 'version': INDEX_VERSION}]
+                for row in rows:
+                    info = {'medications': row.get('medications')}
+                    if has_medications(info):
+                        operations.append({
+                            'op': 'put',
+                            'id': row['id'],
+                            'email': row.get('email'),
+                            'created_at': row.get('created_at'),
+                            'medications': self._extract(row['id'], row.get('created_at'), info)
+                        })
+                operations.append({'op': 'built'})
+                self._append(operations, compact=True, replay_since=start)
+                return len(rows)
+            finally:
+                fcntl.flock(rebuild_lock, fcntl.LOCK_UN)
+
+    # Internals
+
+    def _extract(self, record_id, created_at, info):
+        medications = self.medications_service.extract_medications_from_ocr({'medications': info['medications']})
+        for med in medications:
+            med['source_ocr_id'] = record_id
+            med['source_date'] = created_at
+        return medications
+
+    def _apply(self, operation):
+        op = operation['op']
+        if op == 'put':
+            self._changed(self.records.get(operation['id'], {}).get('email'), operation.get('email'))
+            if operation['id'] not in self.records:
+                bisect.insort(self.ids, operation['id'])
+            self.records[operation['id']] = {
+                'email': operation.get('email'),
+                'created_at': operation.get('created_at'),
+                'medications': operation['medications']
+            }
+        elif op == 'del':
+            for record_id in operation['ids']:
+                record = self.records.pop(record_id, None)
+                if record is not None:
+                    self._changed(record['email'])
+                    self.ids.pop(bisect.bisect_left(self.ids, record_id))
+        elif op == 'reset':
+            self.records, self.ids, self.built, self.version = {}, [], False, None
+            self._fingerprints = {}
+        elif op == 'version':
+            self.version = operation['version']
+        elif op == 'built':
+            self.built = True
+
+    def _changed(self, *emails):
+        for email in ('',) + emails:
+            self._fingerprints.pop(email or '', None)
+
+    def _sync(self):
+        """
+        Replay journal lines appended since the last read (by any worker)
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # First load, or another worker compacted the journal
+            self.records, self.ids, self.built, self.version = {}, [], False, None
+            self._fingerprints = {}
+            self._offset, self._inode, self._lines = 0, stat.st_ino, 0
+        if stat.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as journal:
+            journal.seek(self._offset)
+            for line in journal:
+                if not line.endswith(b'\n'):
+                    # Partial line from an append in progress; read it next time
+                    break
+                self._offset += len(line)
+                self._lines += 1
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    logging.error(f"Skipping bad medication index journal line: {e}")
+
+    def _journal_position(self):
+        """
+        (inode, offset) of the end of the journal, read under the file lock
+        """
+        with self._journal_lock():
+            self._sync()
+            return self._inode, self._offset
+
+    def _journaled_since(self, position):
+        """
+        Put and del operations appended after position (called with the file
+        lock held, after _sync). The journal is not compacted while a rebuild
+        holds the rebuild lock, so position is still valid.
+        """
+        inode, offset = position
+        if self._inode is None:
+            return []
+        if inode is None:
+            offset = 0
+        elif inode != self._inode:
+            logging.error("Medication index journal was replaced during a rebuild; changes made meanwhile are not replayed")
+            return []
+        operations = []
+        with open(self.path, 'rb') as journal:
+            journal.seek(offset)
+            for line in journal.read(self._offset - offset).splitlines():
+                try:
+                    operation = json.loads(line)
+                except ValueError:
+                    continue
+                if operation.get('op') in ('put', 'del'):
+                    operations.append(operation)
+        return operations
+
+    def _rebuilding(self):
+        """
+        Whether some worker holds the rebuild lock
+        """
+        try:
+            with open(self.path + '.rebuild.lock', 'a') as rebuild_lock:
+                fcntl.flock(rebuild_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(rebuild_lock, fcntl.LOCK_UN)
+                return False
+        except BlockingIOError:
+            return True
+
+    @contextlib.contextmanager
+    def _journal_lock(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, operations, compact=False, replay_since=None):
+        with self._journal_lock():
+            self._sync()
+            if replay_since is not None:
+                operations = operations + self._journaled_since(replay_since)
+            for operation in operations:
+                self._apply(operation)
+            if compact or (self._lines > 2 * len(self.records) + 1000 and not self._rebuilding()):
+                self._compact()
+            else:
+                data = ''.join(json.dumps(operation) + '\n' for operation in operations).encode()
+                with open(self.path, 'ab') as journal:
+                    journal.write(data)
+                stat = os.stat(self.path)
+                self._offset, self._inode = stat.st_size, stat.st_ino
+                self._lines += len(operations)
+
+    def _compact(self):
+        """
+        Rewrite the journal as its version line and one put per row (called
+        with the file lock held)
+        """
+        lines = [json.dumps(dict(self.records[record_id], op='put', id=record_id)) for record_id in self.ids]
+        if self.version is not None:
+            lines.insert(0, json.dumps({'op': 'version', 'version': self.version}))
+        if self.built:
+            lines.append(json.dumps({'op': 'built'}))
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as journal:
+            journal.write(''.join(line + '\n' for line in lines))
+        os.replace(temp_path, self.path)
+        stat = os.stat(self.path)
+        self._offset, self._inode, self._lines = stat.st_size, stat.st_ino, len(lines)
+
+
+_medication_index = None
+_medication_index_lock = threading.Lock()
+
+
+def get_medication_index():
+    """
+    Process-wide MedicationIndex persisted at MEDICATION_INDEX_PATH
+    """
+    global _medication_index
+    if _medication_index is None:
+        with _medication_index_lock:
+            if _medication_index is None:
+                _medication_index = MedicationIndex(
+                    os.getenv('MEDICATION_INDEX_PATH', os.path.join('instance', 'medication_index.jsonl'))
+                )
+    return _medication_index
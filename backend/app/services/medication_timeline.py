@@ -0,0 +1,149 @@
+import bisect
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+# Start of an interval whose medication was deleted before any document listed it
+UNKNOWN_START = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """
+    UTC datetime of an ISO date or timestamp (naive values are taken as UTC),
+    or None if it cannot be parsed
+    """
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+class MedicationTimeline:
+    """
+    Interval history of one patient's medications.
+
+    Built from the patient's indexed information rows in document order: a
+    medication listed under added_or_changed opens an interval (if none is
+    open), and one listed under deleted closes it at that document's time.
+    A document's deletions are applied before its additions, so a dose change
+    (new strength added, old strength deleted) ends the old interval and
+    opens a new one rather than leaving the drug discontinued.
+    The intervals are swept once into elementary segments between consecutive
+    boundaries, each holding the intervals covering it, so "active at" and
+    "active between" queries are a binary search plus a walk over the
+    segments in range.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], medications_service):
+        self.intervals = []
+        open_intervals = {}
+
+        for record in sorted(records, key=lambda row: (row.get('created_at') or '', row['id'])):
+            at = parse_timestamp(record.get('created_at'))
+            if at is None:
+                continue
+            # Deletions first (False sorts before True)
+            for med in sorted(record['medications'], key=lambda med: med['status'] == 'active'):
+                key = medications_service.medication_key(med['name'])
+                interval = open_intervals.get(key)
+                if med['status'] == 'active':
+                    if interval is None:
+                        interval = open_intervals[key] = {
+                            'key': key, 'start': at, 'end': None,
+                            'started_by': record['id'], 'ended_by': None, 'source_ids': []
+                        }
+                        self.intervals.append(interval)
+                    # Latest mention decides the name and schedule shown
+                    interval.update(name=med['name'], timing=med['timing'], times=med['times'],
+                                    frequency=med['frequency'])
+                else:
+                    if interval is None:
+                        interval = {
+                            'key': key, 'start': UNKNOWN_START, 'started_by': None,
+                            'name': med['name'], 'timing': med['timing'], 'times': med['times'],
+                            'frequency': med['frequency'], 'source_ids': []
+                        }
+                        self.intervals.append(interval)
+                    else:
+                        del open_intervals[key]
+                    interval.update(end=at, ended_by=record['id'])
+                if record['id'] not in interval['source_ids']:
+                    interval['source_ids'].append(record['id'])
+
+        # Zero-length intervals (listed and deleted at the same time) cover nothing
+        self.intervals = [interval for interval in self.intervals
+                          if interval['end'] is None or interval['end'] > interval['start']]
+        self.intervals.sort(key=lambda interval: interval['start'])
+        self._build_segments()
+
+    def _build_segments(self):
+        bounds = set()
+        for interval in self.intervals:
+            bounds.add(interval['start'])
+            if interval['end'] is not None:
+                bounds.add(interval['end'])
+        self.bounds = sorted(bounds)
+
+        # Sweep: segment i spans bounds[i]..bounds[i + 1] (the last one is open-ended)
+        starts, ends = {}, {}
+        for position, interval in enumerate(self.intervals):
+            starts.setdefault(interval['start'], []).append(position)
+            if interval['end'] is not None:
+                ends.setdefault(interval['end'], []).append(position)
+        self.segments = []
+        active = set()
+        for bound in self.bounds:
+            active.difference_update(ends.get(bound, ()))
+            active.update(starts.get(bound, ()))
+            self.segments.append(tuple(sorted(active)))
+
+    def active_at(self, at: datetime) -> List[Dict[str, Any]]:
+        """
+        Intervals covering the instant at
+        """
+        segment = bisect.bisect_right(self.bounds, at) - 1
+        if segment < 0:
+            return []
+        return [self._public(self.intervals[position]) for position in self.segments[segment]]
+
+    def active_between(self, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """
+        Intervals overlapping [start, end), in order of their start
+        """
+        if end <= start:
+            return []
+        first = max(bisect.bisect_right(self.bounds, start) - 1, 0)
+        last = bisect.bisect_left(self.bounds, end)
+        positions = set()
+        for segment in self.segments[first:last]:
+            positions.update(segment)
+        return [self._public(self.intervals[position]) for position in sorted(positions)]
+
+    def active_on(self, date: str) -> List[Dict[str, Any]]:
+        """
+        Intervals overlapping the UTC calendar day date (YYYY-MM-DD)
+        """
+        day = parse_timestamp(date).replace(hour=0, minute=0, second=0, microsecond=0)
+        return self.active_between(day, day + timedelta(days=1))
+
+    def history(self) -> List[Dict[str, Any]]:
+        """
+        Every interval, in order of its start
+        """
+        return [self._public(interval) for interval in self.intervals]
+
+    def _public(self, interval):
+        return {
+            'name': interval['name'],
+            'status': 'active' if interval['end'] is None else 'discontinued',
+            'start': interval['start'].isoformat() if interval['start'] is not UNKNOWN_START else None,
+            'end': interval['end'].isoformat() if interval['end'] is not None else None,
+            'timing': interval['timing'],
+            'times': interval['times'],
+            'frequency': interval['frequency'],
+            'started_by': interval['started_by'],
+            'ended_by': interval['ended_by'],
+            'source_ids': list(interval['source_ids'])
+        }
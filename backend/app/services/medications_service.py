@@ -1,7 +1,87 @@
 import json
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Iterator
+from app.services.drug_matcher import get_drug_matcher, normalize_drug_text
+from app.services.dose_timeline import DoseTimeline
+from app.services.sig_parser import parse_sig, describe_frequency
+
+# Strength / quantity tokens ignored when matching medication names
+DOSE_TOKEN_RE = re.compile(r'^\d+(\.\d+)?(mg|mcg|g|ml|u|units?|iu|%)?$|^(mg|mcg|g|ml|u|units?|iu)$')
+# Release forms and dosage forms; not part of a medication's identity
+FORMULATION_TOKENS = {'er', 'xr', 'xl', 'sr', 'cr', 'dr', 'ec', 'ir', 'odt', 'tab', 'tabs', 'tablet', 'tablets',
+                      'cap', 'caps', 'capsule', 'capsules'}
+
+# RRULE BYDAY codes, indexed like datetime.weekday()
+ICAL_WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+# Shared by every medication calendar event; treat as read-only
+CALENDAR_TIMEZONE = 'America/New_York'
+DOSE_EVENT_DURATION = timedelta(minutes=15)
+EVENT_REMINDERS = {
+    'useDefault': False,
+    'overrides': [
+        {'method': 'popup', 'minutes': 15},
+        {'method': 'email', 'minutes': 30}
+    ]
+}
+EVENT_SOURCE = {
+    'title': 'HealthSync Medications',
+    'url': 'https://healthsync.app'
+}
+
+# VTIMEZONE for CALENDAR_TIMEZONE, referenced by every DTSTART in the iCalendar feed
+ICAL_TIMEZONE = [
+    'BEGIN:VTIMEZONE',
+    f'TZID:{CALENDAR_TIMEZONE}',
+    'BEGIN:DAYLIGHT',
+    'TZOFFSETFROM:-0500',
+    'TZOFFSETTO:-0400',
+    'TZNAME:EDT',
+    'DTSTART:19700308T020000',
+    'RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=2SU',
+    'END:DAYLIGHT',
+    'BEGIN:STANDARD',
+    'TZOFFSETFROM:-0400',
+    'TZOFFSETTO:-0500',
+    'TZNAME:EST',
+    'DTSTART:19701101T020000',
+    'RRULE:FREQ=YEARLY;BYMONTH=11;BYDAY=1SU',
+    'END:STANDARD',
+    'END:VTIMEZONE'
+]
+
+def ical_text(value: Any) -> str:
+    """
+    Escape a value for an iCalendar TEXT property (RFC 5545 3.3.11)
+    """
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+def ical_line(line: str) -> str:
+    """
+    Fold a content line at 75 octets and terminate it with CRLF (RFC 5545 3.1)
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    start, limit = 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Never split a multi-byte character
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return '\r\n '.join(parts) + '\r\n'
+
+def ical_weekdays(weekdays: List[int]) -> str:
+    """
+    RRULE BYDAY value of weekdays (0-6 from Monday), e.g. "MO,WE,FR"
+    """
+    return ','.join(ICAL_WEEKDAYS[day] for day in weekdays)
 
 class MedicationsService:
     """
@@ -15,11 +95,17 @@ class MedicationsService:
             'evening': '20:00',
             'bedtime': '22:00'
         }
+        # Compiled once per process from the drug vocabulary file
+        self.drug_matcher = get_drug_matcher()
     
     def extract_medications_from_ocr(self, ocr_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Extract medication information from OCR data
         
+        Only the structured medications lists are read. Rows without them are
+        filtered out in Postgres (SupabaseService.get_medication_records) and
+        never reach this method, so there is no free-text fallback.
+        
         Args:
             ocr_data (dict): OCR result data from information table
             
@@ -48,10 +134,6 @@ class MedicationsService:
                     medication = self._create_medication_entry(med_name, 'discontinued')
                     medications.append(medication)
             
-            # If no specific medications found, check for common patterns
-            if not medications:
-                medications = self._extract_medications_from_text(ocr_data)
-            
             logging.info(f"Extracted {len(medications)} medications from OCR data")
             return medications
             
@@ -61,72 +143,104 @@ class MedicationsService:
     
     def _create_medication_entry(self, med_name: str, status: str) -> Dict[str, Any]:
         """
-        Create a standardized medication entry
+        Create a standardized medication entry from a medication line, using
+        the dose/frequency in it (e.g. "Albuterol 2 puffs q4h prn") when present
         
         Args:
-            med_name (str): Name of the medication
+            med_name (str): Medication line from the document
             status (str): Status of the medication (active/discontinued)
             
         Returns:
-            dict: Medication entry with timing information
-        """
-        # Common medication timing patterns
-        timing_patterns = {
-            'albuterol': ['morning', 'afternoon', 'evening'],  # 3x daily
-            'lisinopril': ['morning'],  # 1x daily
-            'metformin': ['morning', 'evening'],  # 2x daily
-            'aspirin': ['morning'],  # 1x daily
-            'vitamin': ['morning'],  # 1x daily
-            'insulin': ['morning', 'evening'],  # 2x daily
-        }
+            dict: Medication entry with timing information; weekdays (0-6
+                  from Monday) is None when it is taken every day
+        """
+        sig = parse_sig(med_name)
         
-        # Determine timing based on medication name
-        timing = ['morning']  # Default to once daily
-        med_lower = med_name.lower()
+        if sig['times'] is not None:
+            # Interval (q4h) or as-needed schedule straight from the sig
+            timing, times = sig['timing'], sig['times']
+        else:
+            # Slots from the sig frequency, else the drug vocabulary default,
+            # once daily if the drug is unknown
+            timing = sig['timing'] or list(self.drug_matcher.schedule_for(sig['name']) or ['morning'])
+            times = [self.default_medication_times[t] for t in timing]
         
-        for pattern, times in timing_patterns.items():
-            if pattern in med_lower:
-                timing = times
-                break
+        notes = f"Status: {status}"
+        if sig['instructions']:
+            notes += f"; {sig['instructions']}"
+        if sig['overnight']:
+            notes += f"; overnight doses at {', '.join(sig['overnight'])}"
         
         return {
-            'name': med_name,
+            'name': sig['name'],
             'status': status,
             'timing': timing,
-            'times': [self.default_medication_times[t] for t in timing],
-            'frequency': f"{len(timing)}x daily",
-            'notes': f"Status: {status}"
+            'times': times,
+            'weekdays': sig['weekdays'],
+            'frequency': describe_frequency(dict(sig, timing=timing)) or f"{len(timing)}x daily",
+            'notes': notes,
+            'sig': {key: sig[key] for key in ('strength', 'dose', 'unit', 'route', 'frequency', 'interval_hours', 'prn', 'duration', 'overnight')}
         }
     
-    def _extract_medications_from_text(self, ocr_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def medication_key(self, med_name: str) -> str:
+        """
+        Identity of a medication across documents: the vocabulary names found
+        in it, then its remaining words without strength and formulation
+        tokens. "Metformin ER 500 mg tablet" and "metformin" collapse, and so
+        do "HCTZ/Lisinopril" and "Lisinopril-HCTZ", while "Vitamin D3" and
+        "Vitamin B12" stay apart.
+        """
+        drugs = self.drug_matcher.find_all(med_name)
+        drug_words = {word for drug in drugs for word in drug.split()}
+        tokens = [
+            token for token in normalize_drug_text(med_name).split()
+            if token not in drug_words and token not in FORMULATION_TOKENS and not DOSE_TOKEN_RE.match(token)
+        ]
+        return ' '.join(drugs + tokens) or normalize_drug_text(med_name)
+    
+    def merge_medications(self, medications: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Fallback method to extract medications from raw text
+        Collapse entries for the same medication across documents in one pass
+        
+        Entries are grouped by medication_key. The entry from the latest document
+        (source_date, then source_ocr_id) decides the status and timing, and
+        source_ids lists every document that mentioned it. Within one document
+        an active entry beats a discontinued one, so a dose change (new strength
+        added, old strength deleted) keeps the drug active at the new strength.
+        
+        Args:
+            medications (list): Medication entries from one or more documents
+            
+        Returns:
+            list: One entry per medication, most recently mentioned first
         """
-        medications = []
+        merged = {}
         
-        # Look for medication mentions in various fields
-        text_fields = ['chief_complaint', 'impression_or_diagnosis', 'source_quality_notes']
+        for med in medications:
+            key = self.medication_key(med['name'])
+            recency = (med.get('source_date') or '', med.get('source_ocr_id') or 0)
+            rank = recency + (med.get('status') == 'active',)
+            current = merged.get(key)
+            
+            if current is None:
+                current = merged[key] = {'entry': med, 'recency': recency, 'rank': rank, 'source_ids': set()}
+            elif rank >= current['rank']:
+                current.update(entry=med, recency=recency, rank=rank)
+            
+            if med.get('source_ocr_id') is not None:
+                current['source_ids'].add(med['source_ocr_id'])
         
-        for field in text_fields:
-            if field in ocr_data and ocr_data[field]:
-                text = str(ocr_data[field]).lower()
-                
-                # Common medication keywords
-                med_keywords = [
-                    'albuterol', 'lisinopril', 'metformin', 'aspirin', 'insulin',
-                    'vitamin', 'antibiotic', 'medication', 'prescription'
-                ]
-                
-                for keyword in med_keywords:
-                    if keyword in text:
-                        medication = self._create_medication_entry(keyword.title(), 'active')
-                        if medication not in medications:
-                            medications.append(medication)
+        result = []
+        for group in sorted(merged.values(), key=lambda group: group['recency'], reverse=True):
+            entry = dict(group['entry'])
+            entry['source_ids'] = sorted(group['source_ids'])
+            result.append(entry)
         
-        return medications
+        return result
     
     def create_calendar_events(self, medications: List[Dict[str, Any]], 
-                              start_date: str = None, duration_days: int = 7) -> List[Dict[str, Any]]:
+                              start_date: str = None, duration_days: int = 7,
+                              recurring: bool = False) -> List[Dict[str, Any]]:
         """
         Create calendar event data for medications
         
@@ -134,55 +248,186 @@ class MedicationsService:
             medications (list): List of medications
             start_date (str): Start date for events (YYYY-MM-DD)
             duration_days (int): Number of days to create events for
+            recurring (bool): Emit one daily-repeating event (RRULE) per dose time
+                              instead of one event per dose per day
             
         Returns:
             list: List of calendar events
         """
-        if not start_date:
-            start_date = datetime.now().strftime('%Y-%m-%d')
+        if recurring:
+            return list(self.iter_recurring_calendar_events(medications, start_date, duration_days))
+        # Imported here: schedule_engine imports this module
+        from app.services.schedule_engine import build_dose_schedule
+        start = self._calendar_start(start_date).strftime('%Y-%m-%d')
+        return list(build_dose_schedule({None: medications}, start, duration_days, self).iter_events())
+    
+    def iter_calendar_events(self, medications: List[Dict[str, Any]], 
+                             start_date: str = None, duration_days: int = 7) -> Iterator[Dict[str, Any]]:
+        """
+        Yield one explicit event per active medication dose per day, for
+        clients that need every instance. Dose times are parsed once per
+        medication and the text fields are shared by all of its events.
         
-        events = []
-        start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+        create_calendar_events builds the same events with the vectorized
+        schedule engine; this per-event loop is its reference.
+        """
+        start_dt = self._calendar_start(start_date)
         
         for medication in medications:
             if medication['status'] != 'active':
                 continue
-                
+            
+            template = self._event_template(medication)
+            dose_times = self._dose_start_times(start_dt, medication['times'])
+            weekdays = medication.get('weekdays')
+            
             for day in range(duration_days):
-                current_date = start_dt + timedelta(days=day)
-                
-                for time_str in medication['times']:
-                    event_time = datetime.strptime(f"{current_date.strftime('%Y-%m-%d')} {time_str}", 
-                                                 '%Y-%m-%d %H:%M')
-                    
-                    event = {
-                        'summary': f"💊 {medication['name']}",
-                        'description': f"Medication: {medication['name']}\nFrequency: {medication['frequency']}\nNotes: {medication['notes']}",
-                        'start': {
-                            'dateTime': event_time.isoformat(),
-                            'timeZone': 'America/New_York'
-                        },
-                        'end': {
-                            'dateTime': (event_time + timedelta(minutes=15)).isoformat(),
-                            'timeZone': 'America/New_York'
-                        },
-                        'reminders': {
-                            'useDefault': False,
-                            'overrides': [
-                                {'method': 'popup', 'minutes': 15},
-                                {'method': 'email', 'minutes': 30}
-                            ]
-                        },
-                        'colorId': '11',  # Blue color for medications
-                        'source': {
-                            'title': 'HealthSync Medications',
-                            'url': 'https://healthsync.app'
-                        }
-                    }
-                    
-                    events.append(event)
-        
-        return events
+                offset = timedelta(days=day)
+                if weekdays and (start_dt + offset).weekday() not in weekdays:
+                    continue
+                for dose_time in dose_times:
+                    yield self._timed_event(template, dose_time + offset)
+    
+    def iter_recurring_calendar_events(self, medications: List[Dict[str, Any]], 
+                                       start_date: str = None, duration_days: int = 7) -> Iterator[Dict[str, Any]]:
+        """
+        Yield one event per active medication dose time, repeating daily (or
+        on its weekdays) for duration_days via an RRULE
+        """
+        start_dt = self._calendar_start(start_date)
+        
+        for medication in medications:
+            if medication['status'] != 'active':
+                continue
+            
+            weekdays = medication.get('weekdays')
+            if weekdays:
+                days = [day for day in range(duration_days)
+                        if (start_dt + timedelta(days=day)).weekday() in weekdays]
+                if not days:
+                    continue
+                # The first occurrence must itself match the rule
+                first_dt = start_dt + timedelta(days=days[0])
+                recurrence = [f"RRULE:FREQ=WEEKLY;BYDAY={ical_weekdays(weekdays)};COUNT={len(days)}"]
+            else:
+                first_dt = start_dt
+                recurrence = [f"RRULE:FREQ=DAILY;COUNT={duration_days}"]
+            
+            template = self._event_template(medication)
+            for dose_time in self._dose_start_times(first_dt, medication['times']):
+                event = self._timed_event(template, dose_time)
+                event['recurrence'] = recurrence
+                yield event
+    
+    def iter_ical_feed(self, medications: List[Dict[str, Any]],
+                       calendar_name: str = 'HealthSync Medications') -> Iterator[str]:
+        """
+        Stream an iCalendar (.ics) subscription feed, one folded line at a time
+        
+        Each active medication dose time becomes one open-ended daily VEVENT
+        starting on the date of the document that last listed the medication,
+        so the feed only changes when the medication data does.
+        
+        Args:
+            medications (list): Merged medications (see merge_medications)
+            calendar_name (str): Display name of the calendar
+            
+        Returns:
+            iterator: CRLF-terminated content lines
+        """
+        for line in ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//HealthSync//Medications//EN',
+                     'CALSCALE:GREGORIAN', 'METHOD:PUBLISH', f'X-WR-CALNAME:{ical_text(calendar_name)}',
+                     f'X-WR-TIMEZONE:{CALENDAR_TIMEZONE}'] + ICAL_TIMEZONE:
+            yield ical_line(line)
+        
+        popup_minutes = [override['minutes'] for override in EVENT_REMINDERS['overrides']
+                         if override['method'] == 'popup']
+        
+        for medication in medications:
+            if medication['status'] != 'active':
+                continue
+            
+            template = self._event_template(medication)
+            documented_at = self._parse_source_date(medication.get('source_date'))
+            start_dt = documented_at.replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+            uid_prefix = self.medication_key(medication['name']).replace(' ', '-')
+            weekdays = medication.get('weekdays')
+            if weekdays:
+                # Start on the first of its weekdays, so DTSTART matches the rule
+                while start_dt.weekday() not in weekdays:
+                    start_dt += timedelta(days=1)
+                rrule = f"RRULE:FREQ=WEEKLY;BYDAY={ical_weekdays(weekdays)}"
+            else:
+                rrule = 'RRULE:FREQ=DAILY'
+            
+            for dose_time in self._dose_start_times(start_dt, medication['times']):
+                lines = [
+                    'BEGIN:VEVENT',
+                    f"UID:{uid_prefix}-{dose_time.strftime('%H%M')}@healthsync.app",
+                    f"DTSTAMP:{documented_at.strftime('%Y%m%dT%H%M%SZ')}",
+                    f"DTSTART;TZID={CALENDAR_TIMEZONE}:{dose_time.strftime('%Y%m%dT%H%M%S')}",
+                    f"DURATION:PT{int(DOSE_EVENT_DURATION.total_seconds() // 60)}M",
+                    rrule,
+                    f"SUMMARY:{ical_text(template['summary'])}",
+                    f"DESCRIPTION:{ical_text(template['description'])}"
+                ]
+                for minutes in popup_minutes:
+                    lines += ['BEGIN:VALARM', 'ACTION:DISPLAY', f"DESCRIPTION:{ical_text(template['summary'])}",
+                              f'TRIGGER:-PT{minutes}M', 'END:VALARM']
+                lines.append('END:VEVENT')
+                for line in lines:
+                    yield ical_line(line)
+        
+        yield ical_line('END:VCALENDAR')
+    
+    def _parse_source_date(self, source_date: str = None) -> datetime:
+        """
+        UTC datetime of a source document's created_at, falling back to the
+        Unix epoch so the feed stays deterministic
+        """
+        try:
+            parsed = datetime.fromisoformat(source_date)
+        except (TypeError, ValueError):
+            return datetime(1970, 1, 1, tzinfo=timezone.utc)
+        if parsed.tzinfo is None:
+            return parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc)
+    
+    def _calendar_start(self, start_date: str = None) -> datetime:
+        if not start_date:
+            return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return datetime.strptime(start_date, '%Y-%m-%d')
+    
+    def _dose_start_times(self, start_dt: datetime, times: List[str]) -> List[datetime]:
+        dose_times = []
+        for time_str in times:
+            hour, minute = time_str.split(':')
+            dose_times.append(start_dt.replace(hour=int(hour), minute=int(minute)))
+        return dose_times
+    
+    def _event_template(self, medication: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fields shared by every event of a medication
+        """
+        return {
+            'summary': f"💊 {medication['name']}",
+            'description': f"Medication: {medication['name']}\nFrequency: {medication['frequency']}\nNotes: {medication['notes']}",
+            'reminders': EVENT_REMINDERS,
+            'colorId': '11',  # Blue color for medications
+            'source': EVENT_SOURCE
+        }
+    
+    def _timed_event(self, template: Dict[str, Any], event_time: datetime) -> Dict[str, Any]:
+        event = dict(template)
+        event['start'] = {
+            'dateTime': event_time.isoformat(),
+            'timeZone': CALENDAR_TIMEZONE
+        }
+        event['end'] = {
+            'dateTime': (event_time + DOSE_EVENT_DURATION).isoformat(),
+            'timeZone': CALENDAR_TIMEZONE
+        }
+        return event
     
     def get_medications_summary(self, medications: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -208,31 +453,8 @@ class MedicationsService:
     
     def _get_next_dose_times(self, active_medications: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Calculate next dose times for active medications
-        """
-        next_doses = []
-        now = datetime.now()
-        
-        for med in active_medications:
-            for time_str in med['times']:
-                # Parse the time
-                time_parts = time_str.split(':')
-                hour, minute = int(time_parts[0]), int(time_parts[1])
-                
-                # Create today's dose time
-                today_dose = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                
-                # If today's dose time has passed, schedule for tomorrow
-                if today_dose <= now:
-                    today_dose += timedelta(days=1)
-                
-                next_doses.append({
-                    'medication': med['name'],
-                    'time': today_dose.strftime('%H:%M'),
-                    'date': today_dose.strftime('%Y-%m-%d'),
-                    'datetime': today_dose.isoformat()
-                })
-        
-        # Sort by next dose time
-        next_doses.sort(key=lambda x: x['datetime'])
-        return next_doses[:5]  # Return next 5 doses
+        Calculate next dose times for active medications (the next occurrence
+        of up to 5 doses)
+        """
+        timeline = DoseTimeline(active_medications)
+        return timeline.next_doses(datetime.now(), min(5, len(timeline)))
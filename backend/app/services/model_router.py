@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict
+from app.services.health_insights_service import clinical_view
+from app.utils.resilience import LatencyWindow
+
+# USD per 1K (prompt, completion) tokens; INSIGHTS_MODEL_PRICES (JSON of the
+# same shape) adds or overrides models
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-4o': (0.0025, 0.01),
+    'gpt-4-turbo': (0.01, 0.03)
+}
+
+# Strings of more than this many words count as free text
+FREE_TEXT_MIN_WORDS = 4
+
+
+def _leaves(view):
+    if isinstance(view, dict):
+        for value in view.values():
+            yield from _leaves(value)
+    elif isinstance(view, list):
+        for value in view:
+            yield from _leaves(value)
+    else:
+        yield view
+
+
+def document_complexity(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Complexity score of a parsed document: one point per populated field,
+    three per medication added or deleted, and one per 50 characters of free
+    text
+
+    Returns:
+        dict: score, fields, medications, free_text_chars
+    """
+    view = clinical_view(data) or {}
+    if not isinstance(view, dict):
+        view = {'document': view}
+    leaves = list(_leaves(view))
+    medications = view.get('medications') if isinstance(view.get('medications'), dict) else {}
+    medication_count = sum(
+        len(value) if isinstance(value, list) else len([name for name in str(value).split(',') if name.strip()])
+        for key, value in medications.items() if key in ('added_or_changed', 'deleted')
+    )
+    free_text_chars = sum(len(leaf) for leaf in leaves
+                          if isinstance(leaf, str) and len(leaf.split()) >= FREE_TEXT_MIN_WORDS)
+    return {
+        'score': round(len(leaves) + 3 * medication_count + free_text_chars / 50, 1),
+        'fields': len(leaves),
+        'medications': medication_count,
+        'free_text_chars': free_text_chars
+    }
+
+
+class ModelRouter:
+    """
+    Picks the model and answer budget for a document by its complexity.
+
+    tiers are tried in order and the first whose max_score covers the
+    document's score wins (the last tier takes everything else). Latency,
+    tokens and cost are recorded per tier so the thresholds can be tuned
+    against what each tier actually costs.
+    """
+
+    def __init__(self, tiers, prices=None):
+        self.tiers = [dict(tier) for tier in tiers]
+        self.prices = dict(MODEL_PRICES, **(prices or {}))
+        self.metrics = {
+            tier['name']: {'calls': 0, 'errors': 0, 'estimated_calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                           'cost_usd': 0.0}
+            for tier in self.tiers
+        }
+        self.latencies = {tier['name']: LatencyWindow() for tier in self.tiers}
+        self._lock = threading.Lock()
+
+    def route(self, data):
+        """
+        The tier for a document: its name, model and max_tokens plus the
+        document's complexity
+        """
+        complexity = document_complexity(data)
+        tier = next((tier for tier in self.tiers
+                     if tier.get('max_score') is None or complexity['score'] <= tier['max_score']),
+                    self.tiers[-1])
+        return dict(tier, complexity=complexity)
+
+    def record(self, tier, seconds, prompt_tokens=0, completion_tokens=0, error=False, estimated=False):
+        """
+        Record one call made for tier; estimated marks token counts estimated
+        from the text rather than reported by the API
+        """
+        name = tier['name']
+        if not error:
+            self.latencies[name].record(seconds)
+        price = self.prices.get(tier['model'])
+        with self._lock:
+            metrics = self.metrics[name]
+            metrics['calls'] += 1
+            if error:
+                metrics['errors'] += 1
+                return
+            metrics['estimated_calls'] += estimated
+            metrics['prompt_tokens'] += prompt_tokens
+            metrics['completion_tokens'] += completion_tokens
+            if price is not None:
+                metrics['cost_usd'] += (prompt_tokens * price[0] + completion_tokens * price[1]) / 1000
+
+    def stats(self):
+        with self._lock:
+            metrics = {name: dict(values) for name, values in self.metrics.items()}
+        tiers = []
+        for tier in self.tiers:
+            values = metrics[tier['name']]
+            succeeded = values['calls'] - values['errors']
+            window = self.latencies[tier['name']]
+            tiers.append(dict(
+                tier,
+                **dict(values, cost_usd=round(values['cost_usd'], 6)),
+                cost_per_call_usd=round(values['cost_usd'] / succeeded, 6) if succeeded else None,
+                priced=tier['model'] in self.prices,
+                **{f"p{pct}_ms": round(value * 1000, 1) if value is not None else None
+                   for pct in (50, 95, 99) for value in [window.percentile(pct)]}
+            ))
+        return {'tiers': tiers}
+
+
+_model_router = None
+_model_router_lock = threading.Lock()
+
+
+def get_model_router():
+    """
+    Process-wide ModelRouter with simple / standard / complex tiers configured
+    by INSIGHTS_<TIER>_MODEL, INSIGHTS_<TIER>_MAX_TOKENS and
+    INSIGHTS_<TIER>_MAX_SCORE
+    """
+    global _model_router
+    if _model_router is None:
+        with _model_router_lock:
+            if _model_router is None:
+                tiers = []
+                for name, max_tokens, max_score in (('simple', 400, 12), ('standard', 800, 40), ('complex', 1000, None)):
+                    prefix = f"INSIGHTS_{name.upper()}_"
+                    score = os.getenv(prefix + 'MAX_SCORE', max_score)
+                    tiers.append({
+                        'name': name,
+                        'model': os.getenv(prefix + 'MODEL', 'gpt-3.5-turbo'),
+                        'max_tokens': int(os.getenv(prefix + 'MAX_TOKENS', max_tokens)),
+                        'max_score': float(score) if score is not None else None
+                    })
+                prices = {}
+                if os.getenv('INSIGHTS_MODEL_PRICES'):
+                    try:
+                        prices = {model: tuple(price) for model, price in json.loads(os.getenv('INSIGHTS_MODEL_PRICES')).items()}
+                    except (ValueError, TypeError, AttributeError) as e:
+                        logging.error(f"Ignoring invalid INSIGHTS_MODEL_PRICES: {e}")
+                _model_router = ModelRouter(tiers, prices)
+    return _model_router
@@ -0,0 +1,339 @@
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from app.services.medication_index import get_medication_index
+from app.services.medications_service import MedicationsService, CALENDAR_TIMEZONE
+from app.utils.timer_wheel import TimerWheel
+
+
+def _write_json(path, data):
+    """
+    Atomically replace path with data as JSON
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as state_file:
+        json.dump(data, state_file)
+    os.replace(temp_path, path)
+
+
+def _read_json(path, default):
+    try:
+        with open(path) as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return default
+    except ValueError as e:
+        logging.error(f"Ignoring unreadable reminder state {path}: {e}")
+        return default
+
+
+class LocalReminderSink:
+    """
+    Stand-in reminder delivery target: appends each reminder to a JSON-lines
+    outbox once per reminder id, so redelivery after a restart is a no-op.
+    A real sink (push, SMS, email) only needs the same deliver(reminder)
+    method, returning False for a reminder id it already delivered.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.delivered = []
+        self._ids = set()
+        try:
+            with open(path) as outbox:
+                for line in outbox:
+                    try:
+                        self._ids.add(json.loads(line)['id'])
+                    except (ValueError, KeyError):
+                        continue
+        except FileNotFoundError:
+            pass
+
+    def deliver(self, reminder):
+        if reminder['id'] in self._ids:
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a') as outbox:
+            outbox.write(json.dumps(reminder) + '\n')
+        self._ids.add(reminder['id'])
+        self.delivered.append(reminder)
+        logging.info(f"Reminder for {reminder['email']}: {reminder['medication']} at {reminder['dose_time']}")
+        return True
+
+
+class ReminderScheduler:
+    """
+    In-process dose reminder scheduler fed by the medication index.
+
+    Each user's plan is the list of (medication, HH:MM, weekdays) dose times
+    of their active medications (weekdays None for every day). Only the next reminder of every dose sits in a
+    hierarchical timer wheel, so a tick costs the same however many users are
+    scheduled; a reminder that fires schedules the next dose day's. Plans are
+    re-read only for users whose index fingerprint changed, and replaced
+    plans are cancelled lazily through a per-user generation number.
+
+    State survives restarts: plans are saved when they change, and every tick
+    saves a watermark (all reminders due up to it were handed to the sink)
+    together with the reminders being delivered. A restart re-queues only
+    reminders due after the watermark and redelivers the in-flight ones, which
+    carry stable ids so sinks can ignore duplicates.
+    """
+
+    def __init__(self, state_path, sink, medication_index=None, medications_service=None,
+                 lead_minutes=15, tick_seconds=60, max_catch_up=3600, timezone=CALENDAR_TIMEZONE):
+        self.state_path = state_path
+        self.progress_path = state_path + '.progress'
+        self.sink = sink
+        self.medication_index = medication_index or get_medication_index()
+        self.medications_service = medications_service or MedicationsService()
+        self.lead_seconds = lead_minutes * 60
+        self.tick_seconds = tick_seconds
+        self.max_catch_up = max_catch_up
+        self.tz = ZoneInfo(timezone)
+
+        self.plans = {}
+        self.generations = {}
+        self.watermark = None
+        self.inflight = []
+        self.wheel = None
+        self.counters = {'delivered': 0, 'duplicates': 0, 'failed': 0, 'stale': 0}
+        self._index_fingerprint = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._leader_file = None
+
+    # State
+
+    def load(self, now=None):
+        """
+        Restore plans, watermark and in-flight reminders, and rebuild the wheel
+        """
+        with self._lock:
+            now = now or time.time()
+            self.plans = _read_json(self.state_path, {})
+            progress = _read_json(self.progress_path, {})
+            self.watermark = progress.get('watermark') or now
+            self.inflight = progress.get('inflight', [])
+            self.generations = {email: 1 for email in self.plans}
+            self.wheel = TimerWheel(int(now // self.tick_seconds))
+            self._index_fingerprint = None
+            for email, plan in self.plans.items():
+                for medication, time_str, *weekdays in plan['doses']:
+                    self._schedule(email, medication, time_str, weekdays[0] if weekdays else None, 1, self.watermark)
+            logging.info(f"Reminder scheduler loaded {len(self.plans)} plans, {len(self.wheel)} pending reminders")
+
+    def _save_plans(self):
+        _write_json(self.state_path, self.plans)
+
+    def _save_progress(self):
+        _write_json(self.progress_path, {'watermark': self.watermark, 'inflight': self.inflight})
+
+    # Plans
+
+    def set_plan(self, email, doses, fingerprint=None, now=None, persist=True):
+        """
+        Replace a user's dose plan, a list of (medication, HH:MM, weekdays);
+        weekdays (0-6 from Monday) may be None or left out for every day. An
+        empty plan without a fingerprint removes the user.
+        """
+        with self._lock:
+            if self.wheel is None:
+                self.load(now)
+            generation = self.generations.get(email, 0) + 1
+            self.generations[email] = generation
+            if not doses and fingerprint is None:
+                self.plans.pop(email, None)
+            else:
+                self.plans[email] = {'fingerprint': fingerprint, 'doses': [list(dose) for dose in doses]}
+                after = max(now or time.time(), self.watermark)
+                for medication, time_str, *weekdays in doses:
+                    self._schedule(email, medication, time_str, weekdays[0] if weekdays else None, generation, after)
+            if persist:
+                self._save_plans()
+
+    def refresh_from_index(self, now=None):
+        """
+        Re-plan users whose medications changed since the last refresh
+        """
+        index = self.medication_index
+        if not index.is_built():
+            return
+        fingerprint = index.fingerprint()
+        if fingerprint == self._index_fingerprint:
+            return
+
+        with self._lock:
+            emails = index.emails()
+            changed = False
+            for email in emails:
+                email_fingerprint = index.fingerprint(email)
+                if self.plans.get(email, {}).get('fingerprint') == email_fingerprint:
+                    continue
+                medications = self.medications_service.merge_medications(index.medications(email=email, limit=100))
+                doses = [(med['name'], time_str, med.get('weekdays')) for med in medications
+                         if med['status'] == 'active' for time_str in med['times']]
+                self.set_plan(email, doses, email_fingerprint, now=now, persist=False)
+                changed = True
+            for email in set(self.plans) - set(emails):
+                self.set_plan(email, [], now=now, persist=False)
+                changed = True
+            if changed:
+                self._save_plans()
+            self._index_fingerprint = fingerprint
+
+    def _next_dose(self, time_str, after, weekdays=None):
+        """
+        The first dose at local time time_str, on one of weekdays if given,
+        whose reminder fires after `after` (epoch seconds), as (dose datetime,
+        fire epoch)
+        """
+        hour, minute = (int(part) for part in time_str.split(':'))
+        local = datetime.fromtimestamp(after + self.lead_seconds, self.tz)
+        dose = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        while dose.timestamp() - self.lead_seconds <= after or (weekdays and dose.weekday() not in weekdays):
+            dose = (dose.replace(tzinfo=None) + timedelta(days=1)).replace(tzinfo=self.tz)
+        return dose, dose.timestamp() - self.lead_seconds
+
+    def _schedule(self, email, medication, time_str, weekdays, generation, after):
+        dose, fire = self._next_dose(time_str, after, weekdays)
+        self.wheel.add(math.ceil(fire / self.tick_seconds),
+                       (email, medication, time_str, weekdays, generation, dose.isoformat(), fire))
+
+    # Firing
+
+    def tick(self, now=None):
+        """
+        Deliver every reminder due by now; returns the reminders the sink
+        delivered (not failed ones, nor ones it had already delivered)
+        """
+        with self._lock:
+            if self.wheel is None:
+                self.load(now)
+            now = now or time.time()
+            now_tick = int(now // self.tick_seconds)
+
+            batch = list(self.inflight)
+            for email, medication, time_str, weekdays, generation, dose_time, fire in self.wheel.advance(now_tick):
+                if self.generations.get(email) != generation:
+                    # Plan replaced since this was scheduled
+                    continue
+                self._schedule(email, medication, time_str, weekdays, generation, max(fire, now - self.max_catch_up))
+                if now - fire > self.max_catch_up:
+                    self.counters['stale'] += 1
+                    continue
+                batch.append({
+                    'id': f"{email}|{medication}|{dose_time}",
+                    'email': email,
+                    'medication': medication,
+                    'dose_time': dose_time,
+                    'minutes_before': self.lead_seconds // 60
+                })
+
+            # Record what is about to be delivered before delivering it
+            self.watermark = max(self.watermark, now_tick * self.tick_seconds)
+            self.inflight = batch
+            self._save_progress()
+            if not batch:
+                return []
+
+            delivered, failed = [], []
+            for reminder in batch:
+                try:
+                    if self.sink.deliver(reminder) is False:
+                        # Already delivered before a restart
+                        self.counters['duplicates'] += 1
+                    else:
+                        self.counters['delivered'] += 1
+                        delivered.append(reminder)
+                except Exception as e:
+                    logging.error(f"Reminder delivery failed for {reminder['id']}: {e}")
+                    self.counters['failed'] += 1
+                    failed.append(reminder)
+            # Failed reminders stay in flight and are retried next tick
+            self.inflight = failed
+            self._save_progress()
+            return delivered
+
+    # Background thread
+
+    def start(self):
+        """
+        Run refresh + tick every tick_seconds in a daemon thread. Only the
+        worker holding the state file lock (one per host) schedules; the others
+        keep trying, so one takes over if the holder exits.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._leader_file is not None:
+            self._leader_file.close()
+            self._leader_file = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._leader_file is None and self._acquire_leadership():
+                    self.load()
+                if self._leader_file is not None:
+                    self.refresh_from_index()
+                    self.tick()
+            except Exception as e:
+                logging.error(f"Reminder scheduler tick failed: {e}")
+            self._stop.wait(self.tick_seconds - time.time() % self.tick_seconds)
+
+    def _acquire_leadership(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        lock_file = open(self.state_path + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._leader_file = lock_file
+        return True
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.counters,
+                leader=self._leader_file is not None,
+                users=len(self.plans),
+                pending=len(self.wheel) if self.wheel is not None else 0,
+                inflight=len(self.inflight),
+                watermark=self.watermark
+            )
+
+
+_reminder_scheduler = None
+_reminder_scheduler_lock = threading.Lock()
+
+
+def get_reminder_scheduler():
+    """
+    Process-wide ReminderScheduler persisted at REMINDER_STATE_PATH, delivering
+    to the local outbox at REMINDER_OUTBOX_PATH
+    """
+    global _reminder_scheduler
+    if _reminder_scheduler is None:
+        with _reminder_scheduler_lock:
+            if _reminder_scheduler is None:
+                _reminder_scheduler = ReminderScheduler(
+                    os.getenv('REMINDER_STATE_PATH', os.path.join('instance', 'reminders.json')),
+                    LocalReminderSink(os.getenv('REMINDER_OUTBOX_PATH', os.path.join('instance', 'reminder_outbox.jsonl'))),
+                    lead_minutes=int(os.getenv('REMINDER_LEAD_MINUTES', 15))
+                )
+    return _reminder_scheduler
@@ -0,0 +1,168 @@
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Mapping
+import numpy as np
+from app.services.medications_service import MedicationsService
+
+MINUTES_PER_DAY = 24 * 60
+# datetime.weekday() of 1970-01-01, day 0 of datetime64[D]
+EPOCH_WEEKDAY = 3
+# Weekday bitmask of a medication taken every day
+EVERY_DAY = 0b1111111
+
+
+class DoseSchedule:
+    """
+    Columnar dose schedule for many patients over a long horizon.
+
+    Every scheduled dose is one row of two parallel arrays: `dose` (index into
+    the per-dose tables dose_patient / dose_medication / dose_time) and `at`
+    (datetime64[m], local time in CALENDAR_TIMEZONE). Rows are grouped by
+    patient and, within a patient, ordered like iter_calendar_events
+    (medication, then day, then dose time), so one patient's schedule is the
+    slice patient_offsets[i]:patient_offsets[i + 1].
+    """
+
+    def __init__(self, patients, medications, dose_patient, dose_medication, dose_time,
+                 dose, at, patient_offsets, medications_service=None):
+        self.patients = patients
+        self.medications = medications
+        self.dose_patient = dose_patient
+        self.dose_medication = dose_medication
+        self.dose_time = dose_time
+        self.dose = dose
+        self.at = at
+        self.patient_offsets = patient_offsets
+        self.medications_service = medications_service or MedicationsService()
+        self._patient_index = {patient: i for i, patient in enumerate(patients)}
+
+    def __len__(self):
+        return len(self.at)
+
+    def patient_slice(self, patient) -> slice:
+        i = self._patient_index[patient]
+        return slice(int(self.patient_offsets[i]), int(self.patient_offsets[i + 1]))
+
+    def doses_per_patient(self) -> np.ndarray:
+        """
+        Number of scheduled doses per patient, aligned with self.patients
+        """
+        return np.diff(self.patient_offsets)
+
+    def doses_per_day(self) -> np.ndarray:
+        """
+        Number of scheduled doses per calendar day of the horizon
+        """
+        if not len(self.at):
+            return np.zeros(0, dtype=np.int64)
+        days = self.at.astype('datetime64[D]')
+        return np.bincount((days - days.min()).astype(np.int64))
+
+    def iter_events(self, patient=None) -> Iterator[Dict[str, Any]]:
+        """
+        Serialize rows (one patient's, or all) to the create_calendar_events
+        event shape, lazily
+        """
+        rows = self.patient_slice(patient) if patient is not None else slice(0, len(self.at))
+        templates = {}
+        # One vectorized conversion to datetime objects for the whole slice
+        times = self.at[rows].astype(datetime)
+        for dose, event_time in zip(self.dose[rows].tolist(), times.tolist()):
+            medication = self.dose_medication[dose]
+            if medication not in templates:
+                templates[medication] = self.medications_service._event_template(self.medications[medication])
+            yield self.medications_service._timed_event(templates[medication], event_time)
+
+
+def build_dose_schedule(plans: Mapping[Any, List[Dict[str, Any]]], start_date: str,
+                        days: int, medications_service: MedicationsService = None) -> DoseSchedule:
+    """
+    Expand patients x active medications x dose times x days into a DoseSchedule
+
+    Only the per-dose tables are built in Python (one entry per medication dose
+    time); the days are expanded with NumPy datetime64 arithmetic and a single
+    scatter into calendar order. Days outside a medication's weekdays are then
+    masked out.
+
+    Args:
+        plans (dict): Patient id -> medications (as from merge_medications)
+        start_date (str): First day of the horizon (YYYY-MM-DD)
+        days (int): Number of days to schedule
+        medications_service (MedicationsService): Used to serialize events
+
+    Returns:
+        DoseSchedule: The columnar schedule
+    """
+    patients, medications = [], []
+    dose_patient, dose_medication, dose_time, dose_minute = [], [], [], []
+    # Per dose: position within its medication's times, that medication's dose
+    # count, and the bitmask of its weekdays
+    dose_slot, dose_count, dose_block, dose_weekdays = [], [], [], []
+
+    for patient_index, (patient, patient_medications) in enumerate(plans.items()):
+        patients.append(patient)
+        for medication in patient_medications:
+            if medication['status'] != 'active' or not medication['times']:
+                continue
+            block = len(medications)
+            medications.append(medication)
+            weekdays = EVERY_DAY
+            if medication.get('weekdays'):
+                weekdays = sum(1 << day for day in set(medication['weekdays']))
+            for slot, time_str in enumerate(medication['times']):
+                hour, minute = (int(part) for part in time_str.split(':'))
+                dose_patient.append(patient_index)
+                dose_medication.append(block)
+                dose_time.append(time_str)
+                dose_minute.append(hour * 60 + minute)
+                dose_slot.append(slot)
+                dose_count.append(len(medication['times']))
+                dose_block.append(block)
+                dose_weekdays.append(weekdays)
+
+    days = max(int(days), 0)
+    dose_count = np.asarray(dose_count, dtype=np.int64)
+    dose_block = np.asarray(dose_block, dtype=np.int64)
+    n_doses = len(dose_minute)
+
+    # First output row of each medication block: blocks are laid out in order,
+    # each taking days * (its dose count) rows
+    block_rows = np.zeros(len(medications) + 1, dtype=np.int64)
+    if n_doses:
+        np.add.at(block_rows, dose_block + 1, days)
+    block_offsets = np.cumsum(block_rows)
+
+    # Dose-major expansion: dose d on day t lands at block start + t * count + slot.
+    # Arithmetic is done in place to keep peak memory near the output size.
+    day_index = np.tile(np.arange(days, dtype=np.int64), n_doses)
+    positions = np.repeat(block_offsets[dose_block] + np.asarray(dose_slot, dtype=np.int64), days)
+    step = np.repeat(dose_count, days)
+    step *= day_index
+    positions += step
+    del step
+
+    # Minutes since the epoch, viewed as datetime64[m] without a copy
+    minutes = day_index
+    minutes *= MINUTES_PER_DAY
+    minutes += np.repeat(np.asarray(dose_minute, dtype=np.int64), days)
+    minutes += np.datetime64(start_date, 'D').astype('datetime64[m]').astype(np.int64)
+
+    total = n_doses * days
+    at = np.empty(total, dtype='datetime64[m]')
+    at[positions] = minutes.view('datetime64[m]')
+    del minutes
+    dose = np.empty(total, dtype=np.int32)
+    dose[positions] = np.repeat(np.arange(n_doses, dtype=np.int32), days)
+
+    dose_patient = np.asarray(dose_patient, dtype=np.int32)
+    dose_weekdays = np.asarray(dose_weekdays, dtype=np.int64)
+    if (dose_weekdays != EVERY_DAY).any():
+        weekday = (at.astype('datetime64[D]').astype(np.int64) + EPOCH_WEEKDAY) % 7
+        keep = ((dose_weekdays[dose] >> weekday) & 1).astype(bool)
+        at, dose = at[keep], dose[keep]
+        rows_per_patient = np.bincount(dose_patient[dose], minlength=len(patients))
+    else:
+        rows_per_patient = np.bincount(dose_patient, minlength=len(patients)) * days
+    patient_offsets = np.concatenate(([0], np.cumsum(rows_per_patient))).astype(np.int64)
+
+    return DoseSchedule(patients, medications, dose_patient, np.asarray(dose_medication, dtype=np.int32),
+                        dose_time, dose, at, patient_offsets, medications_service)
@@ -0,0 +1,235 @@
+import re
+from typing import Any, Dict, List, Optional
+
+# Dose slots of the fixed-slot frequencies, in MedicationsService.default_medication_times terms
+FREQUENCY_SLOTS = {
+    'qd': ['morning'],
+    'qam': ['morning'],
+    'qpm': ['evening'],
+    'qhs': ['bedtime'],
+    'bid': ['morning', 'evening'],
+    'tid': ['morning', 'afternoon', 'evening'],
+    'qid': ['morning', 'afternoon', 'evening', 'bedtime']
+}
+SLOTS_PER_DAY = {1: 'qd', 2: 'bid', 3: 'tid', 4: 'qid'}
+
+# Interval schedules (q4h, every 6 hours) run around the clock from this hour
+INTERVAL_FIRST_HOUR = 8
+# Interval doses after bedtime or before this hour fall at night and are marked
+OVERNIGHT_AFTER = '22:00'
+OVERNIGHT_BEFORE = '06:00'
+
+# Directions before the name ("Take 1 tablet of Metformin ..."); not part of it
+LEADING_WORDS = {'take', 'give', 'apply', 'inject', 'use', 'instill', 'insert', 'chew', 'place', 'of'}
+
+# Weekday of a day name's first three letters (Monday is 0, like datetime.weekday())
+WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+WEEKDAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+ROUTES = {
+    'po': 'by mouth', 'by mouth': 'by mouth', 'orally': 'by mouth', 'oral': 'by mouth',
+    'sl': 'sublingual', 'sublingual': 'sublingual',
+    'inh': 'inhaled', 'inhaled': 'inhaled', 'inhale': 'inhaled', 'neb': 'inhaled', 'nebulized': 'inhaled',
+    'im': 'intramuscular', 'iv': 'intravenous',
+    'sc': 'subcutaneous', 'sq': 'subcutaneous', 'subq': 'subcutaneous', 'subcut': 'subcutaneous',
+    'subcutaneous': 'subcutaneous',
+    'top': 'topical', 'topical': 'topical', 'topically': 'topical',
+    'pr': 'rectal', 'rectally': 'rectal',
+    'nasal': 'nasal', 'intranasal': 'nasal'
+}
+
+# Units of a countable dose ("2 puffs"); any other unit is the strength ("90 mcg")
+DOSE_UNITS = {
+    'puff': 'puff', 'puffs': 'puff', 'tab': 'tablet', 'tabs': 'tablet', 'tablet': 'tablet',
+    'tablets': 'tablet', 'cap': 'capsule', 'caps': 'capsule', 'capsule': 'capsule', 'capsules': 'capsule',
+    'drop': 'drop', 'drops': 'drop', 'gtt': 'drop', 'gtts': 'drop', 'spray': 'spray', 'sprays': 'spray',
+    'patch': 'patch', 'patches': 'patch', 'inhalation': 'inhalation', 'inhalations': 'inhalation',
+    'vial': 'vial', 'vials': 'vial', 'u': 'unit', 'unit': 'unit', 'units': 'unit', 'iu': 'unit'
+}
+
+NUMBER_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'half': 0.5}
+
+DURATION_UNITS = {'d': 'day', 'day': 'day', 'days': 'day', 'wk': 'week', 'wks': 'week', 'week': 'week',
+                  'weeks': 'week', 'mo': 'month', 'month': 'month', 'months': 'month'}
+
+# One alternation over every sig token; a line is tokenized by a single finditer
+SIG_TOKEN_RE = re.compile(r"""
+    (?P<prn>\bp\.?r\.?n\b\.?|\bas\s+needed\b)
+  | (?P<interval>\b(?:q\.?\s*|every\s+)(?P<hours>\d{1,2})(?:\s*(?:-|to)\s*(?P<hours_max>\d{1,2}))?\s*
+        (?:h|hr|hrs|hours?)\b\.?)
+  | (?P<per_day>\b(?P<count>[1-4]|one|two|three|four)\s*(?:x|times)\s*(?:a\s+|per\s+)?(?:day|daily)\b)
+  | (?P<frequency>\b(?:
+        (?P<qd>q\.?d\b\.?|daily|once\s+(?:a\s+)?(?:day|daily)|every\s+day)
+      | (?P<bid>b\.?i\.?d\b\.?|twice\s+(?:a\s+)?(?:day|daily))
+      | (?P<tid>t\.?i\.?d\b\.?|three\s+times\s+(?:a\s+)?(?:day|daily))
+      | (?P<qid>q\.?i\.?d\b\.?|four\s+times\s+(?:a\s+)?(?:day|daily))
+      | (?P<qhs>q\.?\s*h\.?s\b\.?|at\s+bedtime|nightly|every\s+night)
+      | (?P<qam>q\.?\s*a\.?m\b\.?|every\s+morning|in\s+the\s+morning)
+      | (?P<qpm>q\.?\s*p\.?m\b\.?|every\s+evening|in\s+the\s+evening)
+    ))
+  | (?P<duration>(?:\bx\s*|\bfor\s+)(?P<duration_count>\d+)\s*(?P<duration_unit>days?|d|wks?|weeks?|mo|months?)\b\.?)
+  | (?P<weekday>\b(?:on\s+|every\s+)?(?P<day>mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?|thu(?:r(?:s(?:day)?)?)?
+        |fri(?:day)?|sat(?:urday)?|sun(?:day)?)s?\b\.?)
+  | (?P<route>\b(?:p\.?o\b\.?|by\s+mouth|orally|oral|s\.?l\b\.?|sublingual|inh|inhaled|inhale|neb|nebulized
+        |i\.?m\b\.?|i\.?v\b\.?|s\.?c\b\.?|sq|subq|subcut|subcutaneous|top|topical|topically|p\.?r\b\.?
+        |rectally|nasal|intranasal)\b)
+  | (?P<dose>(?:\b(?P<amount>\d+(?:\.\d+)?(?:\s*/\s*\d+)?(?:\s*(?:-|to)\s*\d+(?:\.\d+)?)?)
+        |\b(?P<amount_word>one|two|three|four|half)\b)
+        \s*(?P<unit>mg|mcg|µg|g|gm|ml|l|units?|u|iu|meq|%|puffs?|tabs?|tablets?|caps?|capsules?|drops?|gtts?
+        |sprays?|patch(?:es)?|inhalations?|vials?)?(?!\w)\.?)
+  | (?P<word>[^\W\d_][\w\-']*)
+""", re.IGNORECASE | re.VERBOSE)
+
+
+def _route_key(text: str) -> str:
+    """
+    "P.O." -> "po", "by  mouth" -> "by mouth"
+    """
+    return ' '.join(text.lower().replace('.', '').split())
+
+
+def _amount(text: str) -> Any:
+    """
+    Numeric dose amount: "2" -> 2, "0.5" -> 0.5, "1/2" -> 0.5; ranges ("1-2")
+    are kept as text
+    """
+    compact = re.sub(r'\s', '', text)
+    if '/' in compact and '-' not in compact:
+        numerator, denominator = compact.split('/')
+        return int(numerator) / int(denominator) if int(denominator) else compact
+    try:
+        number = float(compact)
+    except ValueError:
+        return compact
+    return int(number) if number.is_integer() else number
+
+
+def interval_times(hours: int) -> List[str]:
+    """
+    Dose times every `hours` hours around the clock, starting at 08:00
+    """
+    hours = max(1, min(hours, 24))
+    return sorted(f"{(INTERVAL_FIRST_HOUR + hours * k) % 24:02d}:00" for k in range(24 // hours))
+
+
+def parse_sig(line: str) -> Dict[str, Any]:
+    """
+    Parse a medication line such as "Albuterol 90 mcg 2 puffs inh q4h prn"
+
+    Leading words (plus any strength right after them) form the name; the rest
+    is scanned once for dose, unit, route, frequency, weekdays and prn.
+    Directions before the name ("Take 1 tablet of ...") are skipped, and a
+    dose or route there does not end the name.
+
+    Args:
+        line (str): One medication line from a document
+
+    Returns:
+        dict: name, strength, dose, unit, route, frequency (qd/bid/tid/qid/
+              qhs/qam/qpm/qNh or None), interval_hours, prn, duration ("10
+              days"), weekdays (0-6 from Monday, None for every day), timing
+              (slot names), times (HH:MM, None when the line gives no
+              frequency), overnight (the interval times falling at night) and
+              instructions (the line without the name)
+    """
+    line = str(line).strip()
+    sig = {
+        'name': line, 'strength': None, 'dose': None, 'unit': None, 'route': None,
+        'frequency': None, 'interval_hours': None, 'prn': False, 'duration': None,
+        'weekdays': None, 'timing': [], 'times': None, 'overnight': [], 'instructions': ''
+    }
+    name_start = name_end = None
+    in_name = True
+    weekdays = set()
+
+    for match in SIG_TOKEN_RE.finditer(line):
+        if match.group('word') is not None:
+            if name_end is None and match.group('word').lower() in LEADING_WORDS:
+                continue
+            if in_name:
+                if name_start is None:
+                    name_start = match.start()
+                name_end = match.end()
+            continue
+
+        if match.group('dose') is not None:
+            unit = (match.group('unit') or '').lower()
+            if unit and unit not in DOSE_UNITS:
+                # A strength ("90 mcg"); part of the name when it follows it directly
+                if in_name and name_end is not None:
+                    name_end = match.end()
+                if sig['strength'] is None:
+                    sig['strength'] = match.group('dose').strip()
+                continue
+            if not unit and in_name and name_end is not None:
+                # A bare number right after the name is part of it ("Vitamin B 12")
+                name_end = match.end()
+                continue
+            if not unit and sig['frequency'] is not None:
+                # A bare number after the frequency is a quantity ("#30"), not the dose
+                continue
+            in_name = name_end is None
+            if sig['dose'] is None:
+                word = match.group('amount_word')
+                sig['dose'] = NUMBER_WORDS[word.lower()] if word else _amount(match.group('amount'))
+                sig['unit'] = DOSE_UNITS.get(unit)
+            continue
+
+        in_name = name_end is None
+        if match.group('prn') is not None:
+            sig['prn'] = True
+        elif match.group('interval') is not None and sig['frequency'] is None:
+            hours = int(match.group('hours'))
+            sig['interval_hours'] = hours
+            sig['frequency'] = f"q{hours}h"
+        elif match.group('per_day') is not None and sig['frequency'] is None:
+            count = match.group('count').lower()
+            sig['frequency'] = SLOTS_PER_DAY[NUMBER_WORDS.get(count) or int(count)]
+        elif match.group('frequency') is not None and sig['frequency'] is None:
+            sig['frequency'] = next(code for code in FREQUENCY_SLOTS if match.group(code) is not None)
+        elif match.group('duration') is not None and sig['duration'] is None:
+            count = int(match.group('duration_count'))
+            unit = DURATION_UNITS[match.group('duration_unit').lower()]
+            sig['duration'] = f"{count} {unit}{'s' if count != 1 else ''}"
+        elif match.group('weekday') is not None:
+            weekdays.add(WEEKDAYS[match.group('day')[:3].lower()])
+        elif match.group('route') is not None and sig['route'] is None:
+            sig['route'] = ROUTES.get(_route_key(match.group('route')))
+
+    if name_end is not None:
+        sig['name'] = line[name_start:name_end].strip(' ,;-')
+        directions = re.sub(r'\s+of$', '', line[:name_start].strip(' ,;-'), flags=re.IGNORECASE)
+        sig['instructions'] = ' '.join(part for part in (directions, line[name_end:].strip(' ,;-')) if part)
+    if weekdays:
+        sig['weekdays'] = sorted(weekdays)
+
+    if sig['frequency'] in FREQUENCY_SLOTS:
+        sig['timing'] = list(FREQUENCY_SLOTS[sig['frequency']])
+    if sig['prn']:
+        # As-needed medications are not scheduled
+        sig['times'] = []
+    elif sig['interval_hours']:
+        sig['times'] = interval_times(sig['interval_hours'])
+        sig['overnight'] = [time_str for time_str in sig['times']
+                            if time_str > OVERNIGHT_AFTER or time_str < OVERNIGHT_BEFORE]
+    return sig
+
+
+def describe_frequency(sig: Dict[str, Any]) -> Optional[str]:
+    """
+    Human-readable frequency of a parsed sig ("2x daily", "every 4 hours as
+    needed", "1x daily on Mon, Wed, Fri"), or None when the line gives no
+    frequency, prn or weekdays
+    """
+    if sig['interval_hours']:
+        text = f"every {sig['interval_hours']} hours"
+    elif sig['timing']:
+        text = f"{len(sig['timing'])}x daily"
+    else:
+        text = None
+    if sig['prn']:
+        text = f"{text} as needed" if text else 'as needed'
+    if sig.get('weekdays'):
+        days = ', '.join(WEEKDAY_NAMES[day] for day in sig['weekdays'])
+        text = f"{text} on {days}" if text else f"on {days}"
+    return text
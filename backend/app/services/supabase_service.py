@@ -1,27 +1,81 @@
 import os
+import hashlib
+import secrets
+from datetime import datetime, timedelta
 from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
 from dotenv import load_dotenv
 import logging
+from app.utils.resilience import ResilientExecutor, CircuitBreaker
+from app.services.medication_index import get_medication_index
 
 # Load environment variables
 load_dotenv()
 
+# Per-operation deadlines (seconds); reads are retried and hedged, writes are not
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT_SECONDS', 5))
+SUPABASE_OPERATION_TIMEOUTS = {
+    'store_ocr_result': 2 * SUPABASE_TIMEOUT,
+    'delete_ocr_results': 3 * SUPABASE_TIMEOUT,
+    'update_ocr_results': 3 * SUPABASE_TIMEOUT
+}
+
+# Shared by every SupabaseService instance so counters and breaker state are process-wide
+supabase_resilience = ResilientExecutor(
+    'supabase',
+    timeouts=SUPABASE_OPERATION_TIMEOUTS,
+    default_timeout=SUPABASE_TIMEOUT,
+    max_retries=int(os.getenv('SUPABASE_MAX_RETRIES', 2)),
+    max_in_flight=int(os.getenv('SUPABASE_MAX_IN_FLIGHT', 8)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv('SUPABASE_BREAKER_THRESHOLD', 5)),
+        reset_timeout=float(os.getenv('SUPABASE_BREAKER_RESET_SECONDS', 30))
+    )
+)
+
+# PostgREST JSON paths for the medication lists inside information.info
+MEDICATIONS_PATH = 'info->medications'
+MEDICATION_LIST_PATHS = ('info->medications->>added_or_changed', 'info->medications->>deleted')
+
 class SupabaseService:
-    def __init__(self):
+    def __init__(self, client=None, medication_index=None):
         self.supabase_url = os.getenv('SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_ANON_KEY')
+        # Kept in step with every write to the information table
+        self.medication_index = medication_index or get_medication_index()
         
-        if not self.supabase_url or not self.supabase_key:
+        if client is not None:
+            # Pre-built client, e.g. LocalPostgrest().client() in test_supabase_service.py
+            self.client = client
+        elif not self.supabase_url or not self.supabase_key:
             logging.error("Missing Supabase environment variables")
             self.client = None
         else:
             try:
-                self.client: Client = create_client(self.supabase_url, self.supabase_key)
+                # HTTP timeout ends attempts the resilience layer has stopped waiting for
+                options = ClientOptions(postgrest_client_timeout=max(SUPABASE_OPERATION_TIMEOUTS.values()))
+                self.client: Client = create_client(self.supabase_url, self.supabase_key, options=options)
                 logging.info("Supabase client initialized successfully")
             except Exception as e:
                 logging.error(f"Failed to initialize Supabase client: {e}")
                 self.client = None
     
+    def _execute(self, operation, execute, read=False):
+        """
+        Run a query's execute() through the shared timeout / retry / hedge /
+        circuit breaker policy. Only reads are retried and hedged.
+        """
+        return supabase_resilience.call(operation, execute, idempotent=read)
+    
+    def _update_medication_index(self, update, *args):
+        """
+        Apply a change to the medication index; a failure here must not fail the write
+        """
+        try:
+            update(*args)
+        except Exception as e:
+            logging.error(f"Failed to update medication index: {e}")
+    
     def store_ocr_result(self, ocr_data, email=None):
         """
         Store OCR result in the information table
@@ -47,10 +101,12 @@ class SupabaseService:
             }
             
             # Insert data into the information table
-            result = self.client.table('information').insert(insert_data).execute()
+            query = self.client.table('information').insert(insert_data)
+            result = self._execute('store_ocr_result', query.execute)
             
             if result.data:
                 logging.info(f"OCR result stored successfully with ID: {result.data[0].get('id')}")
+                self._update_medication_index(self.medication_index.put, result.data[0])
                 return {
                     'success': True,
                     'data': result.data[0],
@@ -103,7 +159,7 @@ class SupabaseService:
             if email:
                 query = query.eq('email', email)
             
-            result = query.execute()
+            result = self._execute('get_ocr_results', query.execute, read=True)
             
             if result.data is not None:
                 logging.info(f"Retrieved {len(result.data)} OCR results")
@@ -126,6 +182,149 @@ class SupabaseService:
                 'error': str(e)
             }
     
+    def store_insights(self, result_id, insights):
+        """
+        Store generated insights and recommendations on an information row
+        (insights column)
+        
+        Args:
+            result_id (int): ID of the OCR result
+            insights (dict): Insights, recommendations and the fingerprint of
+                             the document they were generated from
+            
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+        
+        try:
+            query = self.client.table('information').update({'insights': insights}).eq('id', result_id)
+            query.params = query.params.add('select', 'id')
+            result = self._execute('store_insights', query.execute)
+            
+            if result.data:
+                logging.info(f"Insights stored for OCR result {result_id}")
+                return {
+                    'success': True,
+                    'message': f'Insights stored for OCR result {result_id}'
+                }
+            else:
+                logging.error(f"No result found with ID {result_id}")
+                return {
+                    'success': False,
+                    'error': f'No result found with ID {result_id}'
+                }
+                
+        except Exception as e:
+            logging.error(f"Error storing insights for OCR result {result_id}: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def get_insights(self, result_id):
+        """
+        Retrieve an information row's document and stored insights
+        
+        Args:
+            result_id (int): ID of the OCR result
+            
+        Returns:
+            dict: Result of the operation; data has id, info and insights
+                  (None until generated), or is None if the row does not exist
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+        
+        try:
+            query = self.client.table('information').select('id', 'info', 'insights').eq('id', result_id)
+            result = self._execute('get_insights', query.execute, read=True)
+            rows = result.data or []
+            return {
+                'success': True,
+                'data': rows[0] if rows else None
+            }
+                
+        except Exception as e:
+            logging.error(f"Error retrieving insights for OCR result {result_id}: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def get_medication_records(self, email=None, limit=100, offset=0, before_id=None):
+        """
+        Retrieve only the information rows that list medications, projected
+        down to their medications sub-object.
+        
+        Filtering happens in Postgres on the info JSON: a row matches when
+        info.medications.added_or_changed or info.medications.deleted is a
+        non-empty value. Rows without medications are never transferred.
+        
+        Args:
+            email (str, optional): Filter by email
+            limit (int): Maximum number of matching rows to return
+            offset (int): Number of matching rows to skip (for paging)
+            before_id (int, optional): Only rows with a lower id (keyset paging,
+                                       stable while rows are inserted)
+            
+        Returns:
+            dict: Result of the operation; each row has id, email, created_at
+                  and medications
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+        
+        try:
+            query = self.client.table('information').select(
+                'id', 'email', 'created_at', f'medications:{MEDICATIONS_PATH}'
+            )
+            # JSON null and missing keys become SQL NULL under ->>, which neq never matches
+            query.params = query.params.add(
+                'or', '(' + ','.join(f'{path}.neq.[]' for path in MEDICATION_LIST_PATHS) + ')'
+            )
+            query = query.order('id', desc=True).limit(limit)
+            if offset:
+                query.params = query.params.add('offset', offset)
+            if before_id is not None:
+                query = query.lt('id', before_id)
+            
+            if email:
+                query = query.eq('email', email)
+            
+            result = self._execute('get_medication_records', query.execute, read=True)
+            
+            if result.data is not None:
+                logging.info(f"Retrieved {len(result.data)} information rows with medications")
+                return {
+                    'success': True,
+                    'data': result.data,
+                    'count': len(result.data)
+                }
+            else:
+                logging.error("No data returned from Supabase query")
+                return {
+                    'success': False,
+                    'error': 'No data returned from query'
+                }
+                
+        except Exception as e:
+            logging.error(f"Error retrieving medication records from Supabase: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
     def delete_ocr_result(self, result_id):
         """
         Delete an OCR result by ID
@@ -143,10 +342,12 @@ class SupabaseService:
             }
         
         try:
-            result = self.client.table('information').delete().eq('id', result_id).execute()
+            query = self.client.table('information').delete().eq('id', result_id)
+            result = self._execute('delete_ocr_result', query.execute)
             
             if result.data:
                 logging.info(f"OCR result {result_id} deleted successfully")
+                self._update_medication_index(self.medication_index.remove, [result_id])
                 return {
                     'success': True,
                     'message': f'OCR result {result_id} deleted successfully'
@@ -165,6 +366,115 @@ class SupabaseService:
                 'error': str(e)
             }
 
+    def delete_ocr_results(self, ids=None, email=None, start_date=None, end_date=None):
+        """
+        Delete every OCR result matching the given filters in one request
+        
+        Args:
+            ids (list, optional): IDs of the results to delete
+            email (str, optional): Only delete results for this email
+            start_date (str, optional): Only delete results created on or after this date (YYYY-MM-DD)
+            end_date (str, optional): Only delete results created on or before this date (YYYY-MM-DD)
+            
+        Returns:
+            dict: Result of the operation with the deleted count and IDs
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+        
+        try:
+            if not has_row_filter(ids, email, start_date, end_date):
+                return {
+                    'success': False,
+                    'error': 'At least one of ids, email, start_date or end_date is required'
+                }
+            
+            query = apply_row_filters(self.client.table('information').delete(),
+                                      ids, email, start_date, end_date)
+            # Only send back the IDs of the deleted rows
+            query.params = query.params.add('select', 'id')
+            result = self._execute('delete_ocr_results', query.execute)
+            
+            deleted_ids = [row['id'] for row in result.data or []]
+            logging.info(f"Deleted {len(deleted_ids)} OCR results")
+            self._update_medication_index(self.medication_index.remove, deleted_ids)
+            return {
+                'success': True,
+                'deleted': len(deleted_ids),
+                'ids': deleted_ids,
+                'message': f'Deleted {len(deleted_ids)} OCR results'
+            }
+                
+        except Exception as e:
+            logging.error(f"Error bulk deleting OCR results: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def update_ocr_results(self, updates=None, info_patch=None, ids=None, email=None,
+                           start_date=None, end_date=None):
+        """
+        Patch the info of many OCR results in one request
+        
+        Either pass per-row patches in updates ([{'id': 1, 'info': {...}}, ...]),
+        or a single info_patch applied to every row matching the filters.
+        Patches follow JSON merge patch rules: nested objects are merged and
+        a null value removes the key. The merge runs in Postgres, in the
+        patch_ocr_info function (sql/patch_ocr_info.sql), as one UPDATE, so
+        concurrent patches to a row are applied one after the other instead
+        of overwriting each other.
+        
+        Args:
+            updates (list, optional): Per-row patches with 'id' and 'info'
+            info_patch (dict, optional): Patch applied to all filtered rows
+            ids, email, start_date, end_date: Row filters for info_patch
+            
+        Returns:
+            dict: Result of the operation with the updated count and IDs, and
+                  the IDs in updates that were not found
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+        
+        try:
+            params = patch_rpc_params(updates, info_patch, ids, email, start_date, end_date)
+            if params is None:
+                return {
+                    'success': False,
+                    'error': 'Provide updates, or info together with ids, email, start_date or end_date'
+                }
+            
+            query = self.client.rpc('patch_ocr_info', params)
+            query.params = query.params.add('select', 'id,email,created_at,info')
+            rows = self._execute('update_ocr_results', query.execute).data or []
+            
+            updated_ids = [row['id'] for row in rows]
+            for row in rows:
+                self._update_medication_index(self.medication_index.put, row)
+            missing_ids = sorted({patch['id'] for patch in params['patches']} - set(updated_ids)) if updates else []
+            logging.info(f"Updated {len(updated_ids)} OCR results")
+            return {
+                'success': True,
+                'updated': len(updated_ids),
+                'ids': updated_ids,
+                'missing_ids': missing_ids,
+                'message': f'Updated {len(updated_ids)} OCR results'
+            }
+                
+        except Exception as e:
+            logging.error(f"Error bulk updating OCR results: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
     # User Authentication Methods
     def authenticate_user(self, email, password):
         """
@@ -185,7 +495,8 @@ class SupabaseService:
         
         try:
             # Get user by email
-            result = self.client.table('users').select('*').eq('email', email).execute()
+            query = self.client.table('users').select('*').eq('email', email)
+            result = self._execute('authenticate_user', query.execute, read=True)
             
             if not result.data:
                 return {
@@ -239,7 +550,8 @@ class SupabaseService:
             }
         
         try:
-            result = self.client.table('users').select('*').eq('id', user_id).execute()
+            query = self.client.table('users').select('*').eq('id', user_id)
+            result = self._execute('get_user_by_id', query.execute, read=True)
             
             if not result.data:
                 return {
@@ -269,6 +581,90 @@ class SupabaseService:
                 'error': str(e)
             }
     
+    def issue_calendar_feed_token(self, user_id):
+        """
+        Create a new random calendar feed token for a user, replacing (and so
+        revoking) the previous one. Only its SHA-256 is stored, in
+        users.calendar_feed_token_hash.
+        
+        Args:
+            user_id (str): User's ID
+            
+        Returns:
+            dict: Result of the operation; token is only returned here
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+        
+        try:
+            token = secrets.token_urlsafe(32)
+            query = self.client.table('users').update(
+                {'calendar_feed_token_hash': calendar_token_hash(token)}
+            ).eq('id', user_id)
+            query.params = query.params.add('select', 'id')
+            result = self._execute('issue_calendar_feed_token', query.execute)
+            
+            if not result.data:
+                return {
+                    'success': False,
+                    'error': 'User not found'
+                }
+            
+            return {
+                'success': True,
+                'token': token
+            }
+                
+        except Exception as e:
+            logging.error(f"Error issuing calendar feed token: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def get_user_by_calendar_token(self, token):
+        """
+        Get the user a calendar feed token was issued to
+        
+        Args:
+            token (str): Token from issue_calendar_feed_token
+            
+        Returns:
+            dict: Result of the operation
+        """
+        if not self.client:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+        
+        try:
+            query = self.client.table('users').select('id', 'email').eq(
+                'calendar_feed_token_hash', calendar_token_hash(token)
+            )
+            result = self._execute('get_user_by_calendar_token', query.execute, read=True)
+            
+            if not result.data:
+                return {
+                    'success': False,
+                    'error': 'Unknown calendar feed'
+                }
+            
+            return {
+                'success': True,
+                'data': result.data[0]
+            }
+                
+        except Exception as e:
+            logging.error(f"Error getting user by calendar feed token: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
     def verify_password(self, password, hashed_password):
         """
         Verify password against hashed password
@@ -280,16 +676,74 @@ class SupabaseService:
         Returns:
             bool: True if password matches
         """
-        try:
-            # Split the hash to get salt and hash
-            if '$' in hashed_password:
-                salt, hash_value = hashed_password.split('$', 1)
-                # Recreate hash with salt
-                import hashlib
-                hash_obj = hashlib.sha256((password + salt).encode())
-                return hash_obj.hexdigest() == hash_value
-            else:
-                # Fallback for different hash format
-                return False
-        except:
+        return verify_password_hash(password, hashed_password)
+
+
+def verify_password_hash(password, hashed_password):
+    """
+    Check a plain text password against a stored "salt$sha256" hash.
+    Shared by the sync and async Supabase services.
+    """
+    try:
+        # Split the hash to get salt and hash
+        if '$' in hashed_password:
+            salt, hash_value = hashed_password.split('$', 1)
+            # Recreate hash with salt
+            hash_obj = hashlib.sha256((password + salt).encode())
+            return hash_obj.hexdigest() == hash_value
+        else:
+            # Fallback for different hash format
             return False
+    except:
+        return False
+
+
+def calendar_token_hash(token):
+    """
+    SHA-256 of a calendar feed token, the form it is stored and looked up in
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def has_row_filter(ids=None, email=None, start_date=None, end_date=None):
+    """
+    Bulk operations must be scoped; an empty filter would touch the whole table
+    """
+    return bool(ids) or bool(email) or bool(start_date) or bool(end_date)
+
+
+def apply_row_filters(query, ids=None, email=None, start_date=None, end_date=None):
+    """
+    Narrow an information table query by ID list, email and created_at date range.
+    Dates are YYYY-MM-DD and both ends are inclusive.
+    """
+    if ids:
+        query = query.in_('id', ids)
+    if email:
+        query = query.eq('email', email)
+    if start_date:
+        query = query.gte('created_at', datetime.strptime(start_date, '%Y-%m-%d').strftime('%Y-%m-%d'))
+    if end_date:
+        day_after = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+        query = query.lt('created_at', day_after.strftime('%Y-%m-%d'))
+    return query
+
+
+def patch_rpc_params(updates=None, info_patch=None, ids=None, email=None, start_date=None, end_date=None):
+    """
+    Arguments of the patch_ocr_info function for a bulk info patch, or None
+    if the request has neither per-row patches nor a scoped info_patch.
+    A row listed twice in updates gets its last patch.
+    """
+    if updates:
+        patches = {update['id']: update.get('info') or {} for update in updates}
+        return {'patches': [{'id': row_id, 'info': patch} for row_id, patch in patches.items()]}
+    if not info_patch or not has_row_filter(ids, email, start_date, end_date):
+        return None
+    return {
+        'info_patch': info_patch,
+        'ids': ids or None,
+        'filter_email': email or None,
+        'start_date': datetime.strptime(start_date, '%Y-%m-%d').strftime('%Y-%m-%d') if start_date else None,
+        'end_date': datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y-%m-%d') if end_date else None
+    }
@@ -0,0 +1,138 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate units per second, holding at
+    most capacity units. The level itself is kept by the caller (see
+    RateLimiter), so it can live in memory shared by several processes.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+
+    def refill(self, level, elapsed):
+        return min(self.capacity, level + max(0.0, elapsed) * self.rate)
+
+    def delay_for(self, level, amount):
+        """
+        Seconds until amount units are available at level (amounts above
+        capacity wait for a full bucket)
+        """
+        missing = min(amount, self.capacity) - level
+        return max(0.0, missing / self.rate)
+
+    def take(self, level, amount):
+        return level - min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Request and token quotas (per minute) as two token buckets, plus a pause
+    shared by every caller after the API answers 429.
+
+        if limiter.acquire(tokens=estimated_tokens, timeout=60):
+            call_api()
+
+    Both buckets start full, so a burst up to the per-minute quota goes out
+    at once and later calls are paced at the quota rate.
+
+    With a SharedCache the bucket levels and the pause live in it under key,
+    and are updated atomically, so every worker on the host draws from one
+    quota. Without one they are kept in this process; give each worker its
+    share of the quota then.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, cache=None, key='rate-limiter'):
+        self.requests = TokenBucket(requests_per_minute / 60.0, requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self.cache = cache
+        self.key = key
+        self.counters = {'acquired': 0, 'waited_seconds': 0.0, 'timeouts': 0, 'pauses': 0}
+        self._state = None
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Wait until one request and `tokens` tokens fit the quotas and take
+        them; returns False if that takes longer than timeout seconds
+        """
+        started = time.time()
+        deadline = None if timeout is None else started + timeout
+        while True:
+            wait = None
+
+            def take(state):
+                nonlocal wait
+                now = state['updated']
+                wait = max(state['paused_until'] - now,
+                           self.requests.delay_for(state['requests'], 1),
+                           self.tokens.delay_for(state['tokens'], tokens))
+                if wait <= 0:
+                    state['requests'] = self.requests.take(state['requests'], 1)
+                    state['tokens'] = self.tokens.take(state['tokens'], tokens)
+                return state
+
+            now = self._transact(take)['updated']
+            with self._lock:
+                if wait <= 0:
+                    self.counters['acquired'] += 1
+                    self.counters['waited_seconds'] += now - started
+                    return True
+                if deadline is not None and now + wait > deadline:
+                    self.counters['timeouts'] += 1
+                    return False
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Hold back every caller for seconds, e.g. after a 429
+        """
+        def extend(state):
+            state['paused_until'] = max(state['paused_until'], state['updated'] + seconds)
+            return state
+
+        self._transact(extend)
+        with self._lock:
+            self.counters['pauses'] += 1
+
+    def stats(self):
+        """
+        This worker's counters, and the shared availability and pause
+        """
+        state = self._transact(lambda state: state)
+        with self._lock:
+            return dict(
+                self.counters,
+                waited_seconds=round(self.counters['waited_seconds'], 3),
+                requests_available=int(state['requests']),
+                tokens_available=int(state['tokens']),
+                paused_for=round(max(0.0, state['paused_until'] - state['updated']), 3),
+                shared=self.cache is not None
+            )
+
+    def _transact(self, function):
+        """
+        Refill the buckets to now, apply function to the state and store it,
+        atomically across threads (and workers, with a cache)
+        """
+        def step(state):
+            now = time.time()
+            if state is None:
+                state = {'requests': self.requests.capacity, 'tokens': self.tokens.capacity,
+                         'updated': now, 'paused_until': 0.0}
+            elapsed = now - state['updated']
+            state['requests'] = self.requests.refill(state['requests'], elapsed)
+            state['tokens'] = self.tokens.refill(state['tokens'], elapsed)
+            state['updated'] = now
+            return function(state)
+
+        if self.cache is not None:
+            state = self.cache.update(self.key, step, ttl=0)
+            if state is not None:
+                return state
+        with self._lock:
+            self._state = step(self._state)
+            return dict(self._state)
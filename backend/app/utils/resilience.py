@@ -0,0 +1,323 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import httpx
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the backend while the circuit breaker is open"""
+
+
+class OperationTimeout(Exception):
+    """Raised when an operation does not finish within its deadline"""
+
+
+class OperationRejected(Exception):
+    """Raised without calling the backend while an operation has too many attempts in flight"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls go through. After failure_threshold consecutive failures the
+    breaker opens and calls fail fast for reset_timeout seconds. Then it goes
+    half_open and lets a single probe through; success closes it, failure
+    re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.open_count = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = 'half_open'
+                self._probe_in_flight = False
+            if self.state == 'half_open':
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != 'open':
+                return 0
+            return max(0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def release(self):
+        """
+        Give back an allowed call that never reached the backend, so a
+        half-open breaker can send another probe
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == 'half_open' or self.consecutive_failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.open_count += 1
+                    logging.warning(f"Circuit breaker opened after {self.consecutive_failures} consecutive failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class LatencyWindow:
+    """
+    Rolling window of recent latencies (seconds) for percentile estimates
+    """
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct, min_samples=1):
+        with self._lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+def is_transient(error):
+    """
+    Failures that say nothing about the request itself: timeouts and
+    connection-level errors. API errors (bad filter, RLS, ...) are answers
+    from a healthy backend and are neither retried nor counted by the breaker.
+    """
+    return isinstance(error, (OperationTimeout, httpx.TransportError, TimeoutError, ConnectionError))
+
+
+class ResilientExecutor:
+    """
+    Runs backend calls with per-operation timeouts, jittered retries and
+    hedging for idempotent reads, and a shared circuit breaker.
+
+        executor.call('get_ocr_results', query.execute, idempotent=True)
+
+    Calls run on a bounded worker pool so the caller can stop waiting at the
+    deadline. A timed-out or losing hedged attempt cannot be interrupted; its
+    result is discarded and the HTTP client's own timeout ends it. Until then
+    it still counts against its operation's max_in_flight attempts: when
+    those are taken, a call fails fast with OperationRejected (and a hedge is
+    skipped) instead of queueing on a pool full of abandoned attempts.
+    """
+
+    def __init__(self, name, timeouts=None, default_timeout=5.0, max_retries=2,
+                 backoff_base=0.1, backoff_cap=1.0, hedge_percentile=95,
+                 hedge_min_delay=0.05, max_hedge_ratio=0.1, hedge_min_samples=20,
+                 breaker=None, max_workers=32, max_in_flight=8):
+        self.name = name
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.max_in_flight = max_in_flight
+        self.in_flight = {}
+        self.latencies = {}
+        self.counters = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'timeouts': 0,
+            'retries': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'short_circuited': 0,
+            'rejected': 0
+        }
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-call")
+        self._lock = threading.Lock()
+
+    def call(self, operation, fn, idempotent=False, timeout=None):
+        """
+        Run fn() under the policy for operation and return its result.
+        Only idempotent calls are retried and hedged.
+        """
+        timeout = timeout or self.timeouts.get(operation, self.default_timeout)
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        self._count('calls')
+        last_error = None
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self._count('short_circuited')
+                raise CircuitOpenError(
+                    f"{self.name} unavailable (circuit open), retry in {self.breaker.retry_after():.0f}s"
+                )
+            if attempt:
+                self._count('retries')
+
+            started = time.monotonic()
+            try:
+                result = self._attempt(operation, fn, timeout, hedge=idempotent)
+            except OperationRejected:
+                # Not an answer from the backend: neither retried nor counted by the breaker
+                self.breaker.release()
+                self._count('rejected')
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.record_success()
+                    raise
+                last_error = e
+                self.breaker.record_failure()
+                self._count('timeouts' if isinstance(e, OperationTimeout) else 'failures')
+                if attempt + 1 < attempts:
+                    # Full jitter keeps retrying workers from synchronizing
+                    time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+                continue
+
+            self._latency(operation).record(time.monotonic() - started)
+            self.breaker.record_success()
+            self._count('successes')
+            return result
+
+        raise last_error
+
+    def _attempt(self, operation, fn, timeout, hedge):
+        deadline = time.monotonic() + timeout
+        futures = [self._submit(operation, fn)]
+
+        if hedge:
+            delay = self.hedge_delay(operation)
+            if delay is not None and delay < timeout:
+                done, _ = wait(futures, timeout=delay)
+                if not done and self._may_hedge():
+                    duplicate = self._submit(operation, fn, required=False)
+                    if duplicate is not None:
+                        self._count('hedges')
+                        futures.append(duplicate)
+
+        pending = set(futures)
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._count('hedge_wins')
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+
+        for future in pending:
+            future.cancel()
+        if error is not None and not pending:
+            raise error
+        raise OperationTimeout(f"{self.name} {operation} timed out after {timeout}s")
+
+    def _submit(self, operation, fn, required=True):
+        """
+        Start an attempt on the pool, holding one of the operation's in-flight
+        slots until it actually finishes (abandoned or not). When none is free
+        raise OperationRejected, or return None if not required.
+        """
+        with self._lock:
+            if self.in_flight.get(operation, 0) >= self.max_in_flight:
+                if not required:
+                    return None
+                raise OperationRejected(
+                    f"{self.name} {operation} has {self.max_in_flight} attempts in flight, rejecting"
+                )
+            self.in_flight[operation] = self.in_flight.get(operation, 0) + 1
+        try:
+            future = self._pool.submit(fn)
+        except Exception:
+            self._release(operation)
+            raise
+        future.add_done_callback(lambda _: self._release(operation))
+        return future
+
+    def _release(self, operation):
+        with self._lock:
+            self.in_flight[operation] -= 1
+
+    def hedge_delay(self, operation):
+        """
+        Delay before a duplicate read: the operation's recent p95 latency, or
+        None until enough samples exist
+        """
+        observed = self._latency(operation).percentile(self.hedge_percentile, self.hedge_min_samples)
+        if observed is None:
+            return None
+        return max(self.hedge_min_delay, observed)
+
+    def _may_hedge(self):
+        with self._lock:
+            return self.counters['hedges'] < self.max_hedge_ratio * max(1, self.counters['calls'])
+
+    def _latency(self, operation):
+        with self._lock:
+            if operation not in self.latencies:
+                self.latencies[operation] = LatencyWindow()
+            return self.latencies[operation]
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def metrics(self):
+        """
+        Counters, breaker state and per-operation latency percentiles (ms)
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            in_flight = {operation: count for operation, count in self.in_flight.items() if count}
+            operations = dict(self.latencies)
+        latency = {}
+        for operation, window in operations.items():
+            latency[operation] = {
+                f"p{pct}_ms": round(value * 1000, 1) if value is not None else None
+                for pct in (50, 95, 99)
+                for value in [window.percentile(pct)]
+            }
+        return {
+            'name': self.name,
+            'counters': counters,
+            'in_flight': in_flight,
+            'breaker': {
+                'state': self.breaker.state,
+                'consecutive_failures': self.breaker.consecutive_failures,
+                'open_count': self.breaker.open_count,
+                'retry_after_seconds': round(self.breaker.retry_after(), 1)
+            },
+            'latency': latency
+        }
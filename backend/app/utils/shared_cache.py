@@ -0,0 +1,421 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+# Tags of the binary encoding used for cached values
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _LIST, _DICT, _BYTES = range(9)
+_DOUBLE = struct.Struct('<d')
+
+
+def pack(value):
+    """
+    Encode JSON-like data (dict, list, str, int, float, bool, None, bytes) into
+    a compact tagged binary form: one tag byte, varint lengths and integers.
+    """
+    out = bytearray()
+    _pack_into(value, out)
+    return bytes(out)
+
+
+def _pack_varint(number, out):
+    while number >= 0x80:
+        out.append((number & 0x7F) | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def _pack_into(value, out):
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        out.append(_INT)
+        # Zigzag so small negative numbers stay short
+        _pack_varint((value << 1) if value >= 0 else ((-value << 1) - 1), out)
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        out.append(_STR)
+        _pack_varint(len(data), out)
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        out.append(_BYTES)
+        _pack_varint(len(value), out)
+        out += value
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        _pack_varint(len(value), out)
+        for item in value:
+            _pack_into(item, out)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        _pack_varint(len(value), out)
+        for key, item in value.items():
+            _pack_into(key, out)
+            _pack_into(item, out)
+    else:
+        raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+
+def unpack(data):
+    """
+    Decode bytes produced by pack()
+    """
+    value, _ = _unpack_from(memoryview(data), 0)
+    return value
+
+
+def _unpack_varint(data, pos):
+    number, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        number |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return number, pos
+        shift += 7
+
+
+def _unpack_from(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _INT:
+        number, pos = _unpack_varint(data, pos)
+        return (number >> 1) if not number & 1 else -((number + 1) >> 1), pos
+    if tag == _FLOAT:
+        return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+    if tag in (_STR, _BYTES):
+        length, pos = _unpack_varint(data, pos)
+        raw = bytes(data[pos:pos + length])
+        return (raw.decode('utf-8') if tag == _STR else raw), pos + length
+    if tag == _LIST:
+        length, pos = _unpack_varint(data, pos)
+        items = []
+        for _ in range(length):
+            item, pos = _unpack_from(data, pos)
+            items.append(item)
+        return items, pos
+    if tag == _DICT:
+        length, pos = _unpack_varint(data, pos)
+        result = {}
+        for _ in range(length):
+            key, pos = _unpack_from(data, pos)
+            result[key], pos = _unpack_from(data, pos)
+        return result, pos
+    raise ValueError(f"Corrupt cache entry (tag {tag})")
+
+
+class SharedCache:
+    """
+    Host-wide cache in a memory-mapped file, shared by every worker process.
+
+    The file is a fixed-size, set-associative table: a key hashes to one bucket
+    of `ways` fixed-size slots, so total size never grows. Inserting into a full
+    bucket evicts an expired entry first, otherwise the least recently used
+    one. Entries carry an absolute expiry time. Buckets are guarded by fcntl
+    byte-range locks (across processes) plus a striped thread lock (within one
+    process, where fcntl locks do not exclude each other).
+
+    Values are pack()ed and zlib-compressed when that saves space; values that
+    still do not fit in a slot are not cached.
+    """
+
+    MAGIC = b'HSC1'
+    # magic, slot_count, slot_size, ways, then shared hits/misses/sets/evictions counters
+    HEADER = struct.Struct('<4sIII4Q')
+    HEADER_SIZE = 64
+    # key hash, expires_at, last_access, value length, key length, flags
+    SLOT_HEADER = struct.Struct('<QddIHBx')
+    FLAGS_OFFSET = 30
+    LAST_ACCESS_OFFSET = 16
+    FLAG_USED = 1
+    FLAG_COMPRESSED = 2
+
+    def __init__(self, path, slot_count=4096, slot_size=4096, ways=8, default_ttl=3600):
+        self.path = path
+        self.default_ttl = default_ttl
+        self._thread_locks = [threading.Lock() for _ in range(64)]
+        self._header_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self.HEADER_SIZE, 0)
+        try:
+            if os.fstat(self._fd).st_size < self.HEADER_SIZE:
+                slot_count -= slot_count % ways
+                os.ftruncate(self._fd, self.HEADER_SIZE + slot_count * slot_size)
+                os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, slot_count, slot_size, ways, 0, 0, 0, 0), 0)
+            magic, slot_count, slot_size, ways = self.HEADER.unpack(os.pread(self._fd, self.HEADER.size, 0))[:4]
+            if magic != self.MAGIC:
+                raise ValueError(f"{path} is not a shared cache file")
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self.HEADER_SIZE, 0)
+
+        # Geometry comes from the file so every worker agrees on it
+        self.slot_count, self.slot_size, self.ways = slot_count, slot_size, ways
+        self.bucket_count = slot_count // ways
+        self._map = mmap.mmap(self._fd, self.HEADER_SIZE + slot_count * slot_size)
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss or expired entry.
+        An entry that does not decode (e.g. torn by a crashed writer) is
+        cleared and counted as a miss.
+        """
+        key_bytes, key_hash = self._key(key)
+        bucket = key_hash % self.bucket_count
+        with self._bucket_locked(bucket):
+            found, value = self._read(bucket, key_hash, key_bytes, key, time.time())
+        self._bump(hits=int(found), misses=int(not found))
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store value under key for ttl seconds (default_ttl if None, 0 = no expiry).
+        Returns False when the encoded value does not fit in a slot.
+        """
+        key_bytes, key_hash = self._key(key)
+        payload, flags = self._encode(key, key_bytes, value)
+        if payload is None:
+            return False
+        bucket = key_hash % self.bucket_count
+        with self._bucket_locked(bucket):
+            evicted = self._write(bucket, key_hash, key_bytes, payload, flags, ttl, time.time())
+        self._bump(sets=1, evictions=evicted)
+        return True
+
+    def update(self, key, function, ttl=None):
+        """
+        Atomically replace the value under key with function(current value,
+        or None if missing), for read-modify-write state shared by workers
+        (e.g. a rate limiter's buckets). function runs under the bucket lock,
+        so keep it short. Returns the new value, or None if it does not fit.
+        """
+        key_bytes, key_hash = self._key(key)
+        bucket = key_hash % self.bucket_count
+        with self._bucket_locked(bucket):
+            now = time.time()
+            value = function(self._read(bucket, key_hash, key_bytes, key, now)[1])
+            payload, flags = self._encode(key, key_bytes, value)
+            if payload is None:
+                return None
+            evicted = self._write(bucket, key_hash, key_bytes, payload, flags, ttl, now)
+        self._bump(sets=1, evictions=evicted)
+        return value
+
+    def delete(self, key):
+        """
+        Remove key; returns True if it was present
+        """
+        key_bytes, key_hash = self._key(key)
+        bucket = key_hash % self.bucket_count
+        with self._bucket_locked(bucket):
+            slot = self._find(bucket, key_hash, key_bytes)
+            if slot is None:
+                return False
+            self._clear(self._slot_offset(bucket, slot))
+            return True
+
+    def clear(self):
+        """
+        Drop every entry (counters are kept)
+        """
+        for bucket in range(self.bucket_count):
+            with self._bucket_locked(bucket):
+                for slot in range(self.ways):
+                    self._clear(self._slot_offset(bucket, slot))
+
+    def stats(self):
+        """
+        Host-wide hit/miss/set/eviction counters and current occupancy
+        """
+        hits, misses, sets, evictions = self.HEADER.unpack_from(self._map, 0)[4:]
+        used = sum(
+            1 for slot in range(self.slot_count)
+            if self._map[self.HEADER_SIZE + slot * self.slot_size + self.FLAGS_OFFSET] & self.FLAG_USED
+        )
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else None,
+            'sets': sets,
+            'evictions': evictions,
+            'entries': used,
+            'capacity': self.slot_count,
+            'slot_size': self.slot_size,
+            'bytes': self.HEADER_SIZE + self.slot_count * self.slot_size
+        }
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def _read(self, bucket, key_hash, key_bytes, key, now):
+        """
+        (found, value) of key, called with the bucket lock held; expired and
+        undecodable entries are cleared
+        """
+        slot = self._find(bucket, key_hash, key_bytes)
+        if slot is None:
+            return False, None
+        offset = self._slot_offset(bucket, slot)
+        _, expires_at, _, value_len, key_len, flags = self.SLOT_HEADER.unpack_from(self._map, offset)
+        if expires_at and expires_at <= now:
+            self._clear(offset)
+            return False, None
+        start = offset + self.SLOT_HEADER.size + key_len
+        payload = self._map[start:start + value_len]
+        try:
+            if flags & self.FLAG_COMPRESSED:
+                payload = zlib.decompress(payload)
+            value = unpack(payload)
+        except (zlib.error, ValueError, IndexError, struct.error) as e:
+            logging.error(f"Dropping corrupt shared cache entry for {key!r}: {e}")
+            self._clear(offset)
+            return False, None
+        _DOUBLE.pack_into(self._map, offset + self.LAST_ACCESS_OFFSET, now)
+        return True, value
+
+    def _encode(self, key, key_bytes, value):
+        """
+        (payload, flags) for value, or (None, None) if it does not fit in a slot
+        """
+        payload, flags = pack(value), self.FLAG_USED
+        compressed = zlib.compress(payload, 1)
+        if len(compressed) < len(payload):
+            payload, flags = compressed, flags | self.FLAG_COMPRESSED
+        if self.SLOT_HEADER.size + len(key_bytes) + len(payload) > self.slot_size:
+            logging.debug(f"Shared cache value for {key!r} too large ({len(payload)} bytes)")
+            return None, None
+        return payload, flags
+
+    def _write(self, bucket, key_hash, key_bytes, payload, flags, ttl, now):
+        """
+        Store an encoded entry, called with the bucket lock held; returns the
+        number of live entries evicted for it (0 or 1)
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        evicted = 0
+        slot = self._find(bucket, key_hash, key_bytes)
+        if slot is None:
+            slot, evicted = self._victim(bucket, now)
+        offset = self._slot_offset(bucket, slot)
+        self.SLOT_HEADER.pack_into(self._map, offset, key_hash, now + ttl if ttl else 0.0, now,
+                                   len(payload), len(key_bytes), flags)
+        start = offset + self.SLOT_HEADER.size
+        self._map[start:start + len(key_bytes)] = key_bytes
+        self._map[start + len(key_bytes):start + len(key_bytes) + len(payload)] = payload
+        return evicted
+
+    def _key(self, key):
+        key_bytes = key.encode('utf-8')
+        return key_bytes, int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), 'little')
+
+    def _slot_offset(self, bucket, slot):
+        return self.HEADER_SIZE + (bucket * self.ways + slot) * self.slot_size
+
+    def _find(self, bucket, key_hash, key_bytes):
+        for slot in range(self.ways):
+            offset = self._slot_offset(bucket, slot)
+            slot_hash, _, _, _, key_len, flags = self.SLOT_HEADER.unpack_from(self._map, offset)
+            if flags & self.FLAG_USED and slot_hash == key_hash:
+                start = offset + self.SLOT_HEADER.size
+                if self._map[start:start + key_len] == key_bytes:
+                    return slot
+        return None
+
+    def _victim(self, bucket, now):
+        """
+        Pick the slot to overwrite: free, else expired, else least recently used
+        """
+        oldest_slot, oldest_access = 0, None
+        for slot in range(self.ways):
+            _, expires_at, last_access, _, _, flags = self.SLOT_HEADER.unpack_from(
+                self._map, self._slot_offset(bucket, slot))
+            if not flags & self.FLAG_USED or (expires_at and expires_at <= now):
+                return slot, 0
+            if oldest_access is None or last_access < oldest_access:
+                oldest_slot, oldest_access = slot, last_access
+        return oldest_slot, 1
+
+    def _clear(self, offset):
+        self._map[offset + self.FLAGS_OFFSET] = 0
+
+    def _bump(self, hits=0, misses=0, sets=0, evictions=0):
+        with self._header_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.HEADER_SIZE, 0)
+            try:
+                header = list(self.HEADER.unpack_from(self._map, 0))
+                header[4] += hits
+                header[5] += misses
+                header[6] += sets
+                header[7] += evictions
+                self.HEADER.pack_into(self._map, 0, *header)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.HEADER_SIZE, 0)
+
+    def _bucket_locked(self, bucket):
+        return _BucketLock(self, bucket)
+
+
+class _BucketLock:
+    def __init__(self, cache, bucket):
+        self.cache = cache
+        self.thread_lock = cache._thread_locks[bucket % len(cache._thread_locks)]
+        self.length = cache.ways * cache.slot_size
+        self.start = cache._slot_offset(bucket, 0)
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        fcntl.lockf(self.cache._fd, fcntl.LOCK_EX, self.length, self.start)
+
+    def __exit__(self, exc_type, exc, tb):
+        fcntl.lockf(self.cache._fd, fcntl.LOCK_UN, self.length, self.start)
+        self.thread_lock.release()
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """
+    Process-wide SharedCache configured from the environment, or None if it is
+    disabled (SHARED_CACHE_ENABLED=false) or cannot be opened
+    """
+    global _shared_cache
+    if _shared_cache is None and os.getenv('SHARED_CACHE_ENABLED', 'true').lower() != 'false':
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                path = os.getenv('SHARED_CACHE_PATH',
+                                 os.path.join(tempfile.gettempdir(), 'healthsync_shared_cache.bin'))
+                try:
+                    _shared_cache = SharedCache(
+                        path,
+                        slot_count=int(os.getenv('SHARED_CACHE_SLOTS', 4096)),
+                        slot_size=int(os.getenv('SHARED_CACHE_SLOT_SIZE', 4096)),
+                        default_ttl=int(os.getenv('SHARED_CACHE_TTL_SECONDS', 3600))
+                    )
+                    logging.info(f"Shared cache opened at {path}")
+                except (OSError, ValueError) as e:
+                    logging.error(f"Failed to open shared cache at {path}: {e}")
+    return _shared_cache
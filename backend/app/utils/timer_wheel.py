@@ -0,0 +1,76 @@
+class TimerWheel:
+    """
+    Hierarchical timer wheel over integer ticks.
+
+    Level 0 has one slot per tick; each slot of level i spans all of level
+    i - 1. A timer goes into the lowest level whose range reaches its tick, and
+    moves down a level whenever the wheel enters the slot holding it. Adding a
+    timer is O(1), and advancing by one tick touches one level-0 slot plus an
+    occasional cascade, independent of how many timers are pending.
+    """
+
+    def __init__(self, current_tick, levels=(256, 64, 64, 64)):
+        self.current = current_tick
+        self.sizes = list(levels)
+        self.spans = []
+        span = 1
+        for size in self.sizes:
+            self.spans.append(span)
+            span *= size
+        self.wheels = [[[] for _ in range(size)] for size in self.sizes]
+        self.ready = []
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, tick, item):
+        """
+        Schedule item for tick; ticks already reached are returned by the next
+        advance(). A tick beyond the top level's range is parked at the end of
+        that range and re-added from there.
+        """
+        self.count += 1
+        if tick <= self.current:
+            self.ready.append(item)
+            return
+        top_span, top_size = self.spans[-1], self.sizes[-1]
+        slot_tick = min(tick, (self.current // top_span + top_size) * top_span - 1)
+        for level, (span, size) in enumerate(zip(self.spans, self.sizes)):
+            if slot_tick // span - self.current // span < size:
+                self.wheels[level][(slot_tick // span) % size].append((tick, item))
+                return
+
+    def advance(self, to_tick):
+        """
+        Move the wheel to to_tick and return the items due on the way, in tick order
+        """
+        due = self.ready
+        self.ready = []
+        while self.current < to_tick:
+            self.current += 1
+            # Entering a new slot of level i (highest first) moves its timers down
+            top = 0
+            for level in range(1, len(self.sizes)):
+                if self.current % self.spans[level]:
+                    break
+                top = level
+            for level in range(top, 0, -1):
+                slot = (self.current // self.spans[level]) % self.sizes[level]
+                timers, self.wheels[level][slot] = self.wheels[level][slot], []
+                self.count -= len(timers)
+                for tick, item in timers:
+                    self.add(tick, item)
+            due.extend(self.ready)
+            self.ready = []
+            slot = self.current % self.sizes[0]
+            timers, self.wheels[0][slot] = self.wheels[0][slot], []
+            for tick, item in timers:
+                if tick > self.current:
+                    # Parked beyond the top level's range
+                    self.count -= 1
+                    self.add(tick, item)
+                else:
+                    due.append(item)
+        self.count -= len(due)
+        return due
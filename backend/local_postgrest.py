@@ -0,0 +1,299 @@
+import json
+import operator
+import re
+from datetime import datetime, timezone
+from urllib.parse import unquote
+import httpx
+from postgrest import SyncPostgrestClient, AsyncPostgrestClient
+from postgrest.utils import SyncClient
+
+LOCAL_BASE_URL = 'http://local-postgrest/rest/v1'
+
+# A filter value like "neq.[]" or "not.is.null"; operator names follow PostgREST
+FILTER_RE = re.compile(r'^(not\.)?(eq|neq|gt|gte|lt|lte|in|is|like|ilike)\.(.*)$', re.DOTALL)
+
+COMPARISONS = {'eq': operator.eq, 'neq': operator.ne, 'gt': operator.gt,
+               'gte': operator.ge, 'lt': operator.lt, 'lte': operator.le}
+
+class LocalPostgrest:
+    """
+    In-memory stand-in for the Supabase REST (PostgREST) endpoint, used by
+    the test_*.py scripts; not part of the app.
+
+    It is plugged in as an httpx transport, so SupabaseService and
+    AsyncSupabaseService run their real query builders and the stand-in answers
+    the same HTTP requests Supabase would receive. Supports the subset of
+    PostgREST used by the services: column/JSON-path selects with aliases,
+    eq/neq/gt/gte/lt/lte/in/is/like filters (optionally negated), or=(...),
+    order, limit/offset, insert, upsert on id, update, delete (with select
+    on the returned rows), count=exact and the SQL functions in sql/ that
+    the services call through rpc (patch_ocr_info).
+
+        local = LocalPostgrest()
+        service = SupabaseService(client=local.client())
+    """
+
+    def __init__(self, tables=None):
+        self.tables = {name: list(rows) for name, rows in (tables or {}).items()}
+        self.next_ids = {}
+        self.request_count = 0
+
+    def client(self):
+        """
+        Return a SyncPostgrestClient served by this stand-in
+        """
+        client = SyncPostgrestClient(LOCAL_BASE_URL)
+        client.session = SyncClient(base_url=LOCAL_BASE_URL, headers=client.session.headers,
+                                    transport=httpx.MockTransport(self.handle))
+        return client
+
+    def async_client(self):
+        """
+        Return an AsyncPostgrestClient served by this stand-in
+        """
+        client = AsyncPostgrestClient(LOCAL_BASE_URL)
+        client.session = httpx.AsyncClient(base_url=LOCAL_BASE_URL, headers=client.session.headers,
+                                           transport=httpx.MockTransport(self.handle))
+        return client
+
+    def handle(self, request):
+        """
+        Answer one PostgREST HTTP request against the in-memory tables
+        """
+        self.request_count += 1
+        if '/rpc/' in request.url.path:
+            return self._rpc(request)
+        table = request.url.path.rsplit('/', 1)[-1]
+        rows = self.tables.setdefault(table, [])
+        params = request.url.params
+        prefer = request.headers.get('Prefer', '')
+
+        if request.method == 'POST':
+            body = json.loads(request.content or b'[]')
+            upsert = 'resolution=merge-duplicates' in prefer
+            affected = [self._insert(table, row, upsert) for row in (body if isinstance(body, list) else [body])]
+            return self._respond(self._project_all(affected, params), prefer, status=201)
+
+        matched = [row for row in rows if self._matches(row, params)]
+
+        if request.method == 'PATCH':
+            changes = json.loads(request.content or b'{}')
+            for row in matched:
+                row.update(changes)
+            return self._respond(self._project_all(matched, params), prefer)
+
+        if request.method == 'DELETE':
+            matched_ids = {id(row) for row in matched}
+            self.tables[table] = [row for row in rows if id(row) not in matched_ids]
+            return self._respond(self._project_all(matched, params), prefer)
+
+        # GET / HEAD
+        total = len(matched)
+        for order in reversed(params.get('order', '').split(',') if params.get('order') else []):
+            column, _, direction = order.partition('.')
+            matched.sort(key=lambda row: _sort_key(_resolve(row, column)),
+                         reverse=direction.startswith('desc'))
+        offset = int(params.get('offset', 0))
+        limit = params.get('limit')
+        matched = matched[offset:offset + int(limit) if limit is not None else None]
+        return self._respond(self._project_all(matched, params), prefer, total=total)
+
+    def _rpc(self, request):
+        function = request.url.path.rsplit('/', 1)[-1]
+        args = json.loads(request.content or b'{}')
+        rows = getattr(self, f"_function_{function}")(**args)
+        rows = [row for row in rows if self._matches(row, request.url.params)]
+        return self._respond(self._project_all(rows, request.url.params), request.headers.get('Prefer', ''))
+
+    def _function_patch_ocr_info(self, patches=None, info_patch=None, ids=None, filter_email=None,
+                                 start_date=None, end_date=None):
+        """
+        sql/patch_ocr_info.sql over the information table
+        """
+        rows = self.tables.setdefault('information', [])
+        if patches is not None:
+            by_id = {patch['id']: patch.get('info') or {} for patch in patches}
+            matched = [(row, by_id[row['id']]) for row in rows if row['id'] in by_id]
+        elif info_patch is not None and (ids or filter_email or start_date or end_date):
+            matched = [(row, info_patch) for row in rows
+                       if (ids is None or row['id'] in ids)
+                       and (filter_email is None or row.get('email') == filter_email)
+                       and (start_date is None or row['created_at'][:10] >= start_date)
+                       and (end_date is None or row['created_at'][:10] <= end_date)]
+        else:
+            matched = []
+        for row, patch in matched:
+            row['info'] = merge_patch(row.get('info'), patch)
+        return [row for row, _ in matched]
+
+    def _insert(self, table, row, upsert=False):
+        row = dict(row)
+        if upsert and 'id' in row:
+            for existing in self.tables[table]:
+                if existing.get('id') == row['id']:
+                    existing.update(row)
+                    return existing
+        if 'id' not in row:
+            next_id = self.next_ids.get(table) or max([r.get('id', 0) for r in self.tables[table]] + [0]) + 1
+            row['id'] = next_id
+            self.next_ids[table] = next_id + 1
+        row.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+        self.tables[table].append(row)
+        return row
+
+    def _respond(self, data, prefer, status=200, total=None):
+        headers = {'Content-Type': 'application/json'}
+        if 'count=' in prefer:
+            total = len(data) if total is None else total
+            headers['Content-Range'] = f"0-{max(len(data) - 1, 0)}/{total}"
+        if 'return=minimal' in prefer:
+            return httpx.Response(status, headers=headers, content=b'')
+        return httpx.Response(status, headers=headers, content=json.dumps(data).encode())
+
+    def _project_all(self, rows, params):
+        return [self._project(row, params.get('select', '*')) for row in rows]
+
+    def _project(self, row, select):
+        if select == '*':
+            return dict(row)
+        projected = {}
+        for item in select.split(','):
+            item = item.strip()
+            if item == '*':
+                projected.update(row)
+                continue
+            alias, _, column = item.rpartition(':')
+            projected[alias or re.split(r'->>?', column)[-1]] = _resolve(row, column)
+        return projected
+
+    def _matches(self, row, params):
+        for key, value in params.multi_items():
+            if key in ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns'):
+                continue
+            if key in ('or', 'and', 'not.or', 'not.and'):
+                result = self._match_group(row, key.rsplit('.', 1)[-1], value.strip()[1:-1])
+                if key.startswith('not.'):
+                    result = not result
+            else:
+                result = _compare(_resolve(row, unquote(key).strip('"')), value)
+            if not result:
+                return False
+        return True
+
+    def _match_group(self, row, kind, body):
+        results = []
+        for condition in _split_top_level(body):
+            if condition.startswith(('or(', 'and(', 'not.or(', 'not.and(')):
+                negate = condition.startswith('not.')
+                nested = condition[4:] if negate else condition
+                group, _, rest = nested.partition('(')
+                result = self._match_group(row, group, rest[:-1])
+                results.append(not result if negate else result)
+                continue
+            column, value = _split_condition(condition)
+            results.append(_compare(_resolve(row, column), value))
+        return any(results) if kind == 'or' else all(results)
+
+
+def merge_patch(target, patch):
+    """
+    JSON merge patch (RFC 7396), as jsonb_merge_patch in sql/patch_ocr_info.sql
+    """
+    if not isinstance(patch, dict):
+        return patch
+    merged = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = merge_patch(merged.get(key), value)
+    return merged
+
+def _split_top_level(body):
+    """
+    Split "a.eq.1,b.in.(1,2)" on commas that are not inside parentheses
+    """
+    parts, depth, current = [], 0, ''
+    for char in body:
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        depth += char == '('
+        depth -= char == ')'
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+def _split_condition(condition):
+    """
+    Split "info->a->>b.neq.[]" into the column path and "neq.[]"
+    """
+    match = re.search(r'\.(not\.)?(eq|neq|gt|gte|lt|lte|in|is|like|ilike)\.', condition)
+    return condition[:match.start()], condition[match.start() + 1:]
+
+def _resolve(row, column):
+    """
+    Evaluate a column or JSON path (col->key->>key) against a row. '->' yields
+    the JSON value, '->>' yields its text form, as in PostgreSQL.
+    """
+    tokens = re.split(r'(->>?)', column)
+    value = row.get(tokens[0])
+    for arrow, key in zip(tokens[1::2], tokens[2::2]):
+        if isinstance(value, dict):
+            value = value.get(key)
+        elif isinstance(value, list) and key.lstrip('-').isdigit():
+            index = int(key)
+            value = value[index] if -len(value) <= index < len(value) else None
+        else:
+            value = None
+        if arrow == '->>' and value is not None and not isinstance(value, str):
+            value = json.dumps(value) if isinstance(value, (dict, list)) else str(value).lower() if isinstance(value, bool) else str(value)
+    return value
+
+def _compare(actual, expression):
+    match = FILTER_RE.match(expression)
+    if not match:
+        return False
+    negate, operator, expected = match.groups()
+    if operator == 'is':
+        result = actual is ({'null': None, 'true': True, 'false': False}[expected.lower()])
+    elif actual is None:
+        # SQL comparisons with NULL are never true, negated or not
+        return False
+    elif operator == 'in':
+        candidates = [item.strip('"') for item in _split_top_level(expected.strip('()'))]
+        result = _as_text(actual) in candidates
+    elif operator in ('like', 'ilike'):
+        pattern = '^' + re.escape(expected).replace(r'\*', '.*').replace('%', '.*') + '$'
+        result = re.match(pattern, _as_text(actual), re.IGNORECASE if operator == 'ilike' else 0) is not None
+    else:
+        left, right = _coerce(actual, expected)
+        result = COMPARISONS[operator](left, right)
+    return not result if negate else result
+
+def _as_text(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+def _coerce(actual, expected):
+    if isinstance(actual, bool):
+        return actual, expected.lower() == 'true'
+    if isinstance(actual, (int, float)):
+        try:
+            return actual, float(expected)
+        except ValueError:
+            return str(actual), expected
+    if isinstance(actual, (dict, list)):
+        try:
+            return actual, json.loads(expected)
+        except ValueError:
+            return _as_text(actual), expected
+    return str(actual), expected
+
+def _sort_key(value):
+    return (value is None, value if isinstance(value, (int, float)) else str(value))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Runner shared by the offline test scripts (the ones that need no server,
+Supabase project or OpenAI key)
+
+Each script ends with:
+
+    if __name__ == "__main__":
+        run_tests("Testing something", globals())
+
+Run this file to run every such script:
+
+    python run_tests.py
+"""
+
+import glob
+import os
+import subprocess
+import sys
+
+
+def run_tests(title, namespace):
+    """
+    Run the test_* functions defined in namespace (a script's globals()) in
+    the order they are defined, print ✓/✗ per test and exit 1 if any failed
+    """
+    tests = [value for name, value in namespace.items()
+             if name.startswith('test_') and callable(value)
+             and getattr(value, '__module__', None) == namespace['__name__']]
+
+    print(title)
+    print("=" * 50)
+
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__doc__}")
+        except Exception as e:
+            failures += 1
+            detail = str(e) if isinstance(e, AssertionError) else f"{type(e).__name__}: {e}"
+            print(f"✗ {test.__doc__}: {detail}")
+
+    print("=" * 50)
+    print(f"{failures} failed" if failures else "All tests passed")
+    sys.exit(1 if failures else 0)
+
+
+def _offline_scripts():
+    here = os.path.dirname(os.path.abspath(__file__))
+    for path in sorted(glob.glob(os.path.join(here, 'test_*.py'))):
+        with open(path) as script:
+            if 'run_tests(' in script.read():
+                yield path
+
+
+if __name__ == "__main__":
+    failed = []
+    for path in _offline_scripts():
+        result = subprocess.run([sys.executable, path], cwd=os.path.dirname(path),
+                                capture_output=True, text=True)
+        name = os.path.basename(path)
+        print(f"{'✓' if result.returncode == 0 else '✗'} {name}")
+        if result.returncode != 0:
+            failed.append(name)
+            print(result.stdout[-4000:] + result.stderr[-4000:])
+
+    print("=" * 50)
+    print(f"{len(failed)} scripts failed: {', '.join(failed)}" if failed else "All test scripts passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,67 @@
+-- Bulk JSON merge patch of information.info, used by
+-- SupabaseService.update_ocr_results (PATCH /api/upload/ocr-results).
+-- Run once in the Supabase SQL editor.
+
+-- RFC 7396 merge patch: nested objects are merged, a null value removes the key
+CREATE OR REPLACE FUNCTION jsonb_merge_patch(target JSONB, patch JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    merged JSONB;
+    item RECORD;
+BEGIN
+    IF patch IS NULL OR jsonb_typeof(patch) <> 'object' THEN
+        RETURN patch;
+    END IF;
+    merged := CASE WHEN jsonb_typeof(target) = 'object' THEN target ELSE '{}'::JSONB END;
+    FOR item IN SELECT key, value FROM jsonb_each(patch) LOOP
+        IF jsonb_typeof(item.value) = 'null' THEN
+            merged := merged - item.key;
+        ELSE
+            merged := jsonb_set(merged, ARRAY[item.key], jsonb_merge_patch(merged -> item.key, item.value));
+        END IF;
+    END LOOP;
+    RETURN merged;
+END;
+$$;
+
+-- Patch many rows in one statement. Either per-row patches
+-- (patches = [{"id": 1, "info": {...}}, ...]) or one info_patch for every row
+-- matching ids / filter_email / start_date..end_date (inclusive). Each row is
+-- merged against its current info under the row lock, so concurrent patches
+-- to one row both apply. Returns the updated rows.
+CREATE OR REPLACE FUNCTION patch_ocr_info(
+    patches JSONB DEFAULT NULL,
+    info_patch JSONB DEFAULT NULL,
+    ids BIGINT[] DEFAULT NULL,
+    filter_email TEXT DEFAULT NULL,
+    start_date DATE DEFAULT NULL,
+    end_date DATE DEFAULT NULL
+)
+RETURNS SETOF information
+LANGUAGE sql AS $$
+    WITH per_row AS (
+        UPDATE information AS stored
+        SET info = jsonb_merge_patch(stored.info, patch.info)
+        FROM (
+            SELECT (entry ->> 'id')::BIGINT AS id, COALESCE(entry -> 'info', '{}'::JSONB) AS info
+            FROM jsonb_array_elements(patches) AS entry
+        ) AS patch
+        WHERE patches IS NOT NULL AND stored.id = patch.id
+        RETURNING stored.*
+    ), filtered AS (
+        UPDATE information AS stored
+        SET info = jsonb_merge_patch(stored.info, info_patch)
+        WHERE patches IS NULL AND info_patch IS NOT NULL
+          -- never patch the whole table
+          AND (ids IS NOT NULL OR filter_email IS NOT NULL OR start_date IS NOT NULL OR end_date IS NOT NULL)
+          AND (ids IS NULL OR stored.id = ANY(ids))
+          AND (filter_email IS NULL OR stored.email = filter_email)
+          AND (start_date IS NULL OR stored.created_at >= start_date)
+          AND (end_date IS NULL OR stored.created_at < end_date + 1)
+        RETURNING stored.*
+    )
+    SELECT * FROM per_row
+    UNION ALL
+    SELECT * FROM filtered;
+$$;
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test script for the drug vocabulary matcher (no server needed)
+"""
+
+import random
+from app.services.drug_matcher import DrugMatcher, get_drug_matcher, normalize_drug_text
+from app.services.medications_service import MedicationsService
+from run_tests import run_tests
+
+SCHEDULES = {
+    'insulin': ['morning', 'evening'],
+    'insulin glargine': ['bedtime'],
+    'glargine': ['evening'],
+    'vitamin': ['morning'],
+    'multivitamin': ['morning'],
+    'amoxicillin': ['morning', 'afternoon', 'evening'],
+    'amoxicillin clavulanate': ['morning', 'evening'],
+    'clavulanate potassium': ['morning'],
+    'aspirin': ['morning']
+}
+
+
+def naive_find_all(schedules, text):
+    """
+    At each word start, the longest whole-word vocabulary name there; the
+    scan resumes after it
+    """
+    words = normalize_drug_text(text).split()
+    names = [normalize_drug_text(name).split() for name in schedules]
+    found = []
+    position = 0
+    while position < len(words):
+        matches = [name for name in names if words[position:position + len(name)] == name]
+        if matches:
+            longest = max(matches, key=len)
+            found.append(' '.join(longest))
+            position += len(longest)
+        else:
+            position += 1
+    return found
+
+
+def test_matches_a_naive_scan():
+    """Random texts give the same names as a word-by-word longest-match scan"""
+    rng = random.Random(11)
+    matcher = DrugMatcher(SCHEDULES)
+    fragments = ['insulin', 'glargine', 'vitamin', 'multivitamin', 'amoxicillin', 'clavulanate', 'potassium',
+                 'aspirin', 'aspirins', 'xinsulin', '500 mg', 'tab', 'po', 'bid', '-', '/', ',']
+    for _ in range(2000):
+        text = ' '.join(rng.choice(fragments) for _ in range(rng.randint(0, 8)))
+        assert matcher.find_all(text) == naive_find_all(SCHEDULES, text), text
+
+
+def test_overlapping_names_take_the_longest():
+    """Overlapping names keep the longest, and the scan goes on after it"""
+    matcher = DrugMatcher(SCHEDULES)
+    assert matcher.find_all('Insulin Glargine 10 units qhs') == ['insulin glargine']
+    assert matcher.find_all('Amoxicillin clavulanate potassium 875 mg') == ['amoxicillin clavulanate']
+    assert matcher.find_all('Amoxicillin-Clavulanate 875mg, Aspirin 81 mg') == ['amoxicillin clavulanate', 'aspirin']
+
+
+def test_whole_words_only():
+    """A name inside a longer word is not found"""
+    matcher = DrugMatcher(SCHEDULES)
+    assert matcher.find_all('Multivitamin daily') == ['multivitamin']
+    assert matcher.find_all('Aspirins') == [] and matcher.find_all('') == []
+
+
+def test_schedule_for_counts_substrings():
+    """schedule_for takes the longest name occurring anywhere, even inside a word"""
+    matcher = DrugMatcher(SCHEDULES)
+    assert matcher.schedule_for('Multivitamin with iron') == ('morning',)
+    assert matcher.schedule_for('Insulin Glargine 10 units') == ('bedtime',)
+    assert matcher.schedule_for('AMOXICILLIN/clavulanate 875') == ('morning', 'evening')
+    assert matcher.schedule_for('Xinsulin') == ('morning', 'evening')
+    assert matcher.schedule_for('Atorvastatin 20 mg') is None
+
+
+def test_bundled_vocabulary():
+    """The bundled vocabulary compiles and knows common drugs"""
+    matcher = get_drug_matcher()
+    assert matcher.schedule_for('Metformin 500 mg') == ('morning', 'evening')
+    assert matcher.find_all('Lisinopril/HCTZ 20/12.5 mg') == ['lisinopril']
+
+
+def test_medication_key_uses_the_vocabulary():
+    """Names of one drug share a key; other words still tell drugs apart"""
+    key = MedicationsService().medication_key
+    assert key('Metformin ER 500 mg tablet') == key('metformin') == 'metformin'
+    assert key('HCTZ/Lisinopril') == key('Lisinopril-HCTZ 20/12.5') == 'lisinopril hctz'
+    assert key('Vitamin D3 1000 IU') != key('Vitamin B12')
+    assert key('Albuterol 90 mcg') == 'albuterol'
+
+
+if __name__ == "__main__":
+    run_tests("Testing drug matcher", globals())
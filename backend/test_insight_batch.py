@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test script for background insight batches (no OpenAI key needed)
+"""
+
+import os
+import tempfile
+import uuid
+import httpx
+import openai
+from app.services.insight_batch import InsightBatchJob, get_batch_snapshot
+from app.utils.rate_limiter import RateLimiter
+from app.utils.shared_cache import SharedCache
+from run_tests import run_tests
+
+
+def rate_limit_error(retry_after='0.05'):
+    response = httpx.Response(429, headers={'retry-after': retry_after},
+                              request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions'))
+    return openai.RateLimitError('Rate limit reached', response=response, body=None)
+
+
+def batch(documents, generate, cache=None, lookup=None):
+    limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=10 ** 6)
+    job = InsightBatchJob(documents, lookup or (lambda document: None), generate, lambda document: 100, limiter,
+                          concurrency=2, backoff_base=0.01, cache=cache)
+    job.start()
+    job.wait(10)
+    return job, limiter
+
+
+def test_cached_documents_make_no_call():
+    """Documents found by lookup are answered without generating"""
+    calls = []
+
+    def generate(document):
+        calls.append(document['n'])
+        return {'data': {'insights': [document['n']]}}, True
+
+    job, _ = batch([{'n': 1}, {'n': 2}], generate,
+                   lookup=lambda document: {'data': {'insights': ['cached']}} if document['n'] == 1 else None)
+    snapshot = job.snapshot()
+    assert calls == [2], calls
+    assert [result['status'] for result in snapshot['results']] == ['cached', 'generated']
+    assert snapshot['status'] == 'done' and snapshot['completed'] == 2
+
+
+def test_rate_limited_call_pauses_and_retries():
+    """A 429 pauses the shared limiter and the document is retried"""
+    failures = [rate_limit_error()]
+
+    def generate(document):
+        if failures:
+            raise failures.pop()
+        return {'data': {'insights': ['ok']}}, True
+
+    job, limiter = batch([{'n': 1}], generate)
+    result = job.snapshot()['results'][0]
+    assert (result['status'], result['attempts']) == ('generated', 2), result
+    assert job.counters['rate_limited'] == 1 and limiter.stats()['pauses'] == 1
+
+
+def test_other_workers_read_progress_from_the_shared_cache():
+    """A worker that did not run the job answers its status from the shared cache"""
+    cache = SharedCache(os.path.join(tempfile.mkdtemp(), 'shared_cache.bin'), slot_count=64, slot_size=512)
+
+    def generate(document):
+        if document['n'] == 3:
+            raise ValueError('bad document')
+        return {'data': {'insights': [''.join(uuid.uuid4().hex for _ in range(50)) if document['n'] == 2 else 'x']}}, True
+
+    job, _ = batch([{'n': 1}, {'n': 2}, {'n': 3}], generate, cache=cache)
+    # The job was never submitted in this process, so only the cache knows it
+    snapshot = get_batch_snapshot(job.id, cache=cache)
+    assert snapshot['status'] == 'done' and snapshot['completed'] == 3, snapshot
+    results = snapshot['results']
+    assert results[0] == {'index': 0, 'status': 'generated', 'attempts': 1, 'data': {'insights': ['x']}}, results[0]
+    assert results[1]['status'] == 'generated' and results[1].get('data_omitted') is True, results[1]
+    assert results[2]['status'] == 'failed' and results[2]['error'] == 'bad document', results[2]
+    assert get_batch_snapshot(job.id, include_results=False, cache=cache).get('results') is None
+    assert get_batch_snapshot('unknown', cache=cache) is None
+
+
+if __name__ == "__main__":
+    run_tests("Testing insight batches", globals())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test script for the health insight fallbacks (no server or OpenAI key needed)
+"""
+
+import json
+import os
+
+os.environ['SHARED_CACHE_ENABLED'] = 'false'
+
+import httpx
+from flask import Flask
+from app.routes.health_insights import health_insights_bp, _parse_insights
+from app.services import llm_client
+from app.services.llm_client import LLMClient
+from run_tests import run_tests
+
+RULES_DOCUMENT = {'chief_complaint': 'Headache', 'vitals': {'blood_pressure': '150/95'}}
+PLAIN_DOCUMENT = {'chief_complaint': 'Follow-up'}
+
+
+def completion(content):
+    return {'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-3.5-turbo',
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': 100, 'completion_tokens': 20, 'total_tokens': 120}}
+
+
+def client_for(handler):
+    """
+    Test client for the insight routes with OpenAI answered by handler(prompt)
+    """
+    def handle(request):
+        return handler(json.loads(request.content)['messages'][-1]['content'])
+
+    llm_client._llm_client = LLMClient(api_key='test', transport=httpx.MockTransport(handle))
+    app = Flask(__name__)
+    app.register_blueprint(health_insights_bp, url_prefix='/api/health-insights')
+    return app.test_client()
+
+
+def rate_limited(prompt):
+    return httpx.Response(429, json={'error': {'message': 'Rate limit reached', 'type': 'requests'}})
+
+
+def test_model_answer():
+    """A well-formed model answer is labeled as the model's"""
+    insights_data, source = _parse_insights('{"insights": [{"title": "A", "description": "B"}]}', PLAIN_DOCUMENT)
+    assert source == 'model' and insights_data['insights'][0]['title'] == 'A', (insights_data, source)
+
+
+def test_invalid_answer_uses_rules():
+    """An invalid model answer falls back to the document rules"""
+    insights_data, source = _parse_insights('not json', RULES_DOCUMENT)
+    assert source == 'rules', source
+    assert insights_data['insights'][0]['title'] == 'High Blood Pressure', insights_data
+
+
+def test_invalid_answer_without_rules_is_placeholder():
+    """With no rule to apply, the fallback is labeled a placeholder, not rules"""
+    for answer in ('not json', '{"summary": "no insights key"}'):
+        insights_data, source = _parse_insights(answer, PLAIN_DOCUMENT)
+        assert source == 'placeholder', (answer, source)
+        assert insights_data['insights'][0]['title'] == 'Document Analysis Complete', insights_data
+
+
+def test_summary_rate_limited_uses_rules():
+    """A rate-limited summary is answered from the rules and the placeholder"""
+    response = client_for(rate_limited).post('/api/health-insights/get-health-summary', json=RULES_DOCUMENT)
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert body['data']['insights'][0]['title'] == 'High Blood Pressure', body
+    assert body['data']['recommendations'][0]['title'] == 'Follow Up', body
+    assert body['fallback_reason'] == {'insights': 'rate_limited', 'recommendations': 'rate_limited'}, body
+
+
+def test_summary_keeps_the_half_that_succeeded():
+    """Only the half that timed out is answered without the model"""
+    def handler(prompt):
+        if 'actionable health recommendations' in prompt:
+            raise httpx.ReadTimeout('timed out')
+        return httpx.Response(200, json=completion('{"insights": [{"title": "Model", "description": "M"}]}'))
+
+    body = client_for(handler).post('/api/health-insights/get-health-summary', json=RULES_DOCUMENT).get_json()
+    assert [insight['title'] for insight in body['data']['insights']] == ['Model'], body
+    assert body['data']['recommendations'][0]['title'] == 'Follow Up', body
+    assert body['fallback_reason'] == {'recommendations': 'timeout'}, body
+
+
+def test_summary_without_rules_reports_the_error():
+    """With no rule to apply, a rate-limited summary still returns 429"""
+    response = client_for(rate_limited).post('/api/health-insights/get-health-summary', json=PLAIN_DOCUMENT)
+    assert response.status_code == 429, response.get_json()
+
+
+def test_stream_rate_limited_uses_rules():
+    """A rate-limited stream replays the rule insights"""
+    response = client_for(rate_limited).post('/api/health-insights/get-health-insights/stream', json=RULES_DOCUMENT)
+    text = response.get_data(as_text=True)
+    assert response.status_code == 200 and '"fallback_reason": "rate_limited"' in text, text
+
+
+if __name__ == "__main__":
+    run_tests("Testing health insight fallbacks", globals())
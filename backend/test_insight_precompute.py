@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script for precomputing insights at upload time and reading them back
+(no server, Supabase project or OpenAI key needed)
+"""
+
+import json
+import os
+import tempfile
+
+os.environ['SHARED_CACHE_ENABLED'] = 'false'
+os.environ.setdefault('MEDICATION_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'medication_index.jsonl'))
+
+import httpx
+from flask import Flask
+from local_postgrest import LocalPostgrest
+from app.routes import health_insights
+from app.services import llm_client
+from app.services.llm_client import LLMClient
+from app.services.medication_index import MedicationIndex
+from app.services.supabase_service import SupabaseService
+from run_tests import run_tests
+
+DOCUMENT = {'chief_complaint': 'Headache', 'vitals': {'blood_pressure': '150/95'}}
+
+app = Flask(__name__)
+app.register_blueprint(health_insights.health_insights_bp, url_prefix='/api/health-insights')
+
+
+def completion(content):
+    return {'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-3.5-turbo',
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': 100, 'completion_tokens': 20, 'total_tokens': 120}}
+
+
+def model_answers(prompt):
+    if 'actionable health recommendations' in prompt:
+        content = {'recommendations': [{'title': 'Check blood pressure', 'description': 'Weekly'}]}
+    else:
+        content = {'insights': [{'title': 'Blood pressure', 'description': 'Above the normal range'}]}
+    return httpx.Response(200, json=completion(json.dumps(content)))
+
+
+def setup(handler=model_answers):
+    """
+    One stored OCR result without insights, and OpenAI answered by handler(prompt)
+    """
+    local = LocalPostgrest({'information': [{'id': 1, 'email': 'a@example.com', 'info': DOCUMENT, 'insights': None}]})
+    index = MedicationIndex(os.path.join(tempfile.mkdtemp(), 'medication_index.jsonl'))
+    health_insights.supabase_service = SupabaseService(client=local.client(), medication_index=index)
+
+    def handle(request):
+        return handler(json.loads(request.content)['messages'][-1]['content'])
+    llm_client._llm_client = LLMClient(api_key='test', transport=httpx.MockTransport(handle))
+    return app.test_client()
+
+
+def counter(outcome):
+    return health_insights._precompute_counters[outcome]
+
+
+def test_precomputed_insights_are_served():
+    """Insights are pending until precomputed, then ready"""
+    client = setup()
+    response = client.get('/api/health-insights/stored/1')
+    assert response.status_code == 200 and response.get_json()['status'] == 'pending', response.get_json()
+
+    stored = counter('stored')
+    assert health_insights.precompute_health_summary(1, DOCUMENT).result(timeout=10) is True
+    assert counter('stored') == stored + 1
+
+    body = client.get('/api/health-insights/stored/1').get_json()
+    assert body['status'] == 'ready' and body['generated_at'], body
+    assert body['data']['insights'][0]['title'] == 'Blood pressure', body
+    assert body['data']['recommendations'][0]['title'] == 'Check blood pressure', body
+
+
+def test_changed_document_is_stale():
+    """Insights generated from another version of the document are reported stale"""
+    client = setup()
+    assert health_insights.precompute_health_summary(1, DOCUMENT).result(timeout=10) is True
+    health_insights.supabase_service.client.table('information').update(
+        {'info': dict(DOCUMENT, chief_complaint='Dizziness')}
+    ).eq('id', 1).execute()
+    body = client.get('/api/health-insights/stored/1').get_json()
+    assert body['status'] == 'stale' and body['data']['insights'], body
+
+
+def test_placeholder_answers_are_not_stored():
+    """An answer the model did not produce (invalid JSON) is skipped, not stored"""
+    client = setup(lambda prompt: httpx.Response(200, json=completion('not json')))
+    skipped = counter('skipped')
+    assert health_insights.precompute_health_summary(1, DOCUMENT).result(timeout=10) is False
+    assert counter('skipped') == skipped + 1
+    assert client.get('/api/health-insights/stored/1').get_json()['status'] == 'pending'
+
+
+def test_model_errors_are_counted():
+    """A rate-limited model fails the precompute without storing anything"""
+    def rate_limited(prompt):
+        return httpx.Response(429, json={'error': {'message': 'Rate limit reached', 'type': 'requests'}})
+
+    client = setup(rate_limited)
+    failed = counter('failed')
+    assert health_insights.precompute_health_summary(1, DOCUMENT).result(timeout=30) is False
+    assert counter('failed') == failed + 1
+    assert client.get('/api/health-insights/stored/1').get_json()['status'] == 'pending'
+
+
+def test_unknown_result_is_not_found():
+    """Stored insights of a result that does not exist are a 404"""
+    client = setup()
+    assert client.get('/api/health-insights/stored/99').status_code == 404
+
+
+if __name__ == "__main__":
+    run_tests("Testing insight precompute", globals())
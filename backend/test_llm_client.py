@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared OpenAI client and its hedged calls (no OpenAI key needed)
+"""
+
+import json
+import threading
+import time
+import httpx
+from app.services.llm_client import LLMClient
+from app.services.model_router import ModelRouter
+from run_tests import run_tests
+
+MESSAGES = [{'role': 'user', 'content': 'Summarize this visit'}]
+
+
+def sse(*chunks):
+    return b''.join(f"data: {json.dumps(chunk)}\n\n".encode() for chunk in chunks)
+
+
+def chunk(content=None, usage=None):
+    return {'id': 'chatcmpl-test', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'gpt-3.5-turbo',
+            'choices': [] if usage else [{'index': 0, 'delta': {'content': content}, 'finish_reason': 'stop'}],
+            **({'usage': usage} if usage else {})}
+
+
+USAGE = {'prompt_tokens': 120, 'completion_tokens': 30, 'total_tokens': 150}
+
+
+class SlowStream(httpx.SyncByteStream):
+    """
+    Streamed answer that stalls after its first chunk; closing it (as a
+    cancelled attempt does) ends the stall like a dropped connection
+    """
+
+    def __init__(self, seconds, send_usage=True):
+        self.seconds = seconds
+        self.send_usage = send_usage
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        yield sse(chunk('from the first '))
+        if self.closed.wait(self.seconds):
+            raise httpx.ReadError('connection closed')
+        yield sse(chunk('request'), *([chunk(usage=USAGE)] if self.send_usage else [])) + b"data: [DONE]\n\n"
+
+    def close(self):
+        self.closed.set()
+
+
+def hedging_client(first_request_seconds, send_usage=True, **kwargs):
+    """
+    Hedging client whose requests stream at once, except the first request
+    after warm-up, which stalls for first_request_seconds; returns the
+    client, the stalled stream and the request bodies
+    """
+    bodies = []
+    slow = SlowStream(first_request_seconds, send_usage)
+
+    def handle(request):
+        body = json.loads(request.content)
+        bodies.append(body)
+        if len(bodies) == 4:
+            return httpx.Response(200, headers={'content-type': 'text/event-stream'}, stream=slow)
+        wants_usage = send_usage and body.get('stream_options', {}).get('include_usage')
+        content = sse(chunk('from the hedge' if len(bodies) > 4 else 'warm-up'),
+                      *([chunk(usage=USAGE)] if wants_usage else [])) + b"data: [DONE]\n\n"
+        return httpx.Response(200, headers={'content-type': 'text/event-stream'}, content=content)
+
+    client = LLMClient(api_key='test', transport=httpx.MockTransport(handle), hedge=True, hedge_percentile=50,
+                       hedge_min_delay=0.05, max_hedge_ratio=0.5, hedge_min_samples=3, **kwargs)
+    for _ in range(3):
+        client.chat(model='gpt-3.5-turbo', messages=MESSAGES)
+    return client, slow, bodies
+
+
+def test_first_request_reports_real_usage():
+    """A call answered by its first request returns the usage the API streamed"""
+    client, _, bodies = hedging_client(0)
+    response = client.chat(model='gpt-3.5-turbo', messages=MESSAGES)
+    assert response.choices[0].message.content == 'from the first request', response
+    assert response.usage.prompt_tokens == 120 and response.usage_estimated is False, response
+    assert bodies[-1]['stream'] is True and bodies[-1]['stream_options'] == {'include_usage': True}, bodies[-1]
+    assert client.stats()['hedges'] == 0 and client.stats()['in_flight'] == 0, client.stats()
+
+
+def test_hedge_win_cancels_the_first_request():
+    """When the hedge wins, the first request's stream is closed and its slot freed"""
+    client, slow, _ = hedging_client(5)
+    started = time.monotonic()
+    response = client.chat(model='gpt-3.5-turbo', messages=MESSAGES)
+    assert time.monotonic() - started < 1, 'the hedge answer was not returned at once'
+    assert response.choices[0].message.content == 'from the hedge', response
+    assert response.usage.prompt_tokens == 120 and response.usage_estimated is False, response
+    assert slow.closed.wait(1), 'the first request was not cancelled'
+    time.sleep(0.1)
+    stats = client.stats()
+    assert (stats['hedges'], stats['hedge_wins'], stats['in_flight']) == (1, 1, 0), stats
+
+
+def test_usage_estimated_without_stream_usage():
+    """Without usage in the stream, tokens are estimated and marked so"""
+    client, _, _ = hedging_client(0, send_usage=False)
+    response = client.chat(model='gpt-3.5-turbo', messages=MESSAGES)
+    assert response.usage_estimated is True and response.usage.completion_tokens > 0, response
+
+
+def test_router_counts_estimated_calls():
+    """Calls with estimated usage are counted per tier"""
+    router = ModelRouter([{'name': 'simple', 'model': 'gpt-3.5-turbo', 'max_tokens': 400, 'max_score': None}])
+    tier = router.route({})
+    router.record(tier, 0.5, prompt_tokens=100, completion_tokens=20)
+    router.record(tier, 0.5, prompt_tokens=100, completion_tokens=20, estimated=True)
+    simple = router.stats()['tiers'][0]
+    assert (simple['calls'], simple['estimated_calls'], simple['prompt_tokens']) == (2, 1, 200), simple
+
+
+if __name__ == "__main__":
+    run_tests("Testing OpenAI client hedging", globals())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Test script for the medication index journal (no server needed)
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from app.services.medication_index import MedicationIndex, INDEX_VERSION
+from run_tests import run_tests
+
+ROWS = [
+    {'id': 1, 'email': 'a@example.com', 'created_at': '2026-01-01T09:00:00+00:00',
+     'medications': {'added_or_changed': ['Lisinopril 10 mg daily'], 'deleted': []}},
+    {'id': 2, 'email': 'b@example.com', 'created_at': '2026-01-02T09:00:00+00:00',
+     'medications': {'added_or_changed': ['Metformin 500 mg bid'], 'deleted': []}}
+]
+
+
+def journal_path():
+    return os.path.join(tempfile.mkdtemp(), 'medication_index.jsonl')
+
+
+def test_workers_share_the_journal():
+    """A change appended by one worker is replayed by another"""
+    path = journal_path()
+    first, second = MedicationIndex(path), MedicationIndex(path)
+    first.rebuild(ROWS)
+    assert second.is_built()
+    assert [med['name'] for med in second.medications(email='b@example.com')] == ['Metformin 500 mg']
+
+    first.put({'id': 3, 'email': 'a@example.com', 'created_at': '2026-01-03T09:00:00+00:00',
+               'info': {'medications': {'added_or_changed': ['Albuterol 90 mcg'], 'deleted': []}}})
+    second_fingerprint = second.fingerprint('a@example.com')
+    assert [record['id'] for record in second.records_for('a@example.com')] == [1, 3]
+
+    first.remove([3])
+    assert second.fingerprint('a@example.com') != second_fingerprint
+    assert [record['id'] for record in second.records_for()] == [1, 2]
+
+
+def test_rows_without_medications_leave_the_index():
+    """Re-putting a row whose medications were cleared drops it"""
+    index = MedicationIndex(journal_path())
+    index.rebuild(ROWS)
+    index.put({'id': 1, 'email': 'a@example.com', 'created_at': ROWS[0]['created_at'],
+               'info': {'medications': {'added_or_changed': [], 'deleted': []}}})
+    assert [record['id'] for record in index.records_for()] == [2]
+
+
+def test_put_keeps_email_and_created_at():
+    """A row put with its full columns is found by per-user lookups"""
+    index = MedicationIndex(journal_path())
+    index.rebuild([])
+    index.put({'id': 7, 'email': 'c@example.com', 'created_at': '2026-02-01T09:00:00+00:00',
+               'info': {'medications': {'added_or_changed': ['Lisinopril'], 'deleted': []}}})
+    records = index.records_for('c@example.com')
+    assert [(record['id'], record['created_at']) for record in records] == [(7, '2026-02-01T09:00:00+00:00')]
+
+
+def test_compaction_keeps_version_and_rows():
+    """A compacted journal replays to the same rows and version"""
+    path = journal_path()
+    index = MedicationIndex(path)
+    index.rebuild(ROWS)
+    for _ in range(3):
+        index.put(dict(ROWS[1], info={'medications': ROWS[1]['medications']}))
+    index._compact()
+    with open(path) as journal:
+        assert json.loads(journal.readline()) == {'op': 'version', 'version': INDEX_VERSION}
+    fresh = MedicationIndex(path)
+    assert fresh.is_built() and not fresh.is_stale()
+    assert [record['id'] for record in fresh.records_for()] == [1, 2]
+
+
+def test_old_journal_is_stale():
+    """A journal without the current version is reported stale and unbuilt"""
+    path = journal_path()
+    with open(path, 'w') as journal:
+        journal.write(json.dumps({'op': 'put', 'id': 1, 'email': 'a@example.com', 'created_at': None,
+                                  'medications': []}) + '\n')
+        journal.write(json.dumps({'op': 'built'}) + '\n')
+    index = MedicationIndex(path)
+    assert index.is_stale() and not index.is_built()
+    index.rebuild(ROWS)
+    assert not index.is_stale() and index.is_built()
+    assert not MedicationIndex(journal_path()).is_stale()
+
+
+def test_partial_line_is_read_later():
+    """A line still being appended is not replayed until it is complete"""
+    path = journal_path()
+    index = MedicationIndex(path)
+    index.rebuild(ROWS)
+    line = json.dumps({'op': 'del', 'ids': [1]}) + '\n'
+    with open(path, 'a') as journal:
+        journal.write(line[:10])
+    assert [record['id'] for record in index.records_for()] == [1, 2]
+    with open(path, 'a') as journal:
+        journal.write(line[10:])
+    assert [record['id'] for record in index.records_for()] == [2]
+
+
+def test_changes_during_rebuild_are_kept():
+    """Puts and dels journaled while a rebuild loads its rows are replayed on top"""
+    path = journal_path()
+    rebuilding, other = MedicationIndex(path), MedicationIndex(path)
+    other.rebuild(ROWS)
+
+    def load_rows():
+        # Another worker writes while the rows are being paged in
+        other.put({'id': 3, 'email': 'a@example.com', 'created_at': '2026-01-03T09:00:00+00:00',
+                   'info': {'medications': {'added_or_changed': ['Albuterol 90 mcg'], 'deleted': []}}})
+        other.remove([1])
+        return ROWS
+
+    assert rebuilding.rebuild(load_rows) == 2
+    for index in (rebuilding, other, MedicationIndex(path)):
+        assert [record['id'] for record in index.records_for()] == [2, 3], index.records_for()
+        assert index.is_built()
+
+
+def test_one_worker_rebuilds():
+    """Workers rebuilding an unbuilt index at once load the rows only once"""
+    path = journal_path()
+    loads = []
+
+    def load_rows():
+        loads.append(1)
+        time.sleep(0.1)
+        return ROWS
+
+    workers = [threading.Thread(target=MedicationIndex(path).rebuild, args=(load_rows,), kwargs={'if_unbuilt': True})
+               for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert len(loads) == 1, loads
+    assert [record['id'] for record in MedicationIndex(path).records_for()] == [1, 2]
+
+
+if __name__ == "__main__":
+    run_tests("Testing medication index journal", globals())
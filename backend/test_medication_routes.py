@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test script for the medication routes against the in-memory PostgREST
+stand-in (no Supabase project or server needed)
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('SHARED_CACHE_PATH', os.path.join(tempfile.mkdtemp(), 'shared_cache.bin'))
+os.environ.setdefault('MEDICATION_INDEX_PATH', os.path.join(tempfile.mkdtemp(), 'medication_index.jsonl'))
+
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from local_postgrest import LocalPostgrest
+from app.routes import medications
+from app.services.medication_index import MedicationIndex
+from app.services.supabase_service import SupabaseService
+from run_tests import run_tests
+
+LONG_NAME = 'Hydrochlorothiazide and lisinopril combination tablet 12.5 mg / 20 mg by mouth once daily'
+
+app = Flask(__name__)
+app.config['JWT_SECRET_KEY'] = 'test-secret-key-for-the-medication-routes'
+JWTManager(app)
+app.register_blueprint(medications.medications_bp, url_prefix='/api/medications')
+
+
+def setup():
+    """
+    Point the medication routes at a fresh in-memory Supabase with two users
+    """
+    local = LocalPostgrest({
+        'users': [
+            {'id': 'user-a', 'email': 'a@example.com', 'username': 'a', 'password_hash': 'x'},
+            {'id': 'user-b', 'email': 'b@example.com', 'username': 'b', 'password_hash': 'x'}
+        ],
+        'information': [
+            {'id': 1, 'email': 'a@example.com', 'created_at': '2026-01-01T09:00:00+00:00',
+             'info': {'medications': {'added_or_changed': [LONG_NAME], 'deleted': []}}},
+            {'id': 2, 'email': 'b@example.com', 'created_at': '2026-01-02T09:00:00+00:00',
+             'info': {'medications': {'added_or_changed': ['Metformin 500 mg bid'], 'deleted': []}}}
+        ]
+    })
+    index = MedicationIndex(os.path.join(tempfile.mkdtemp(), 'medication_index.jsonl'))
+    medications.supabase_service = SupabaseService(client=local.client(), medication_index=index)
+    return app.test_client()
+
+
+def auth_headers(user_id):
+    with app.app_context():
+        return {'Authorization': f"Bearer {create_access_token(identity=user_id)}"}
+
+
+def feed_url(client, user_id):
+    response = client.post('/api/medications/calendar-feed', headers=auth_headers(user_id))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['url']
+
+
+def test_feed_url_needs_login():
+    """A feed URL is only issued to a logged-in user"""
+    client = setup()
+    assert client.post('/api/medications/calendar-feed').status_code == 401
+
+
+def test_feed_is_found_by_token_only():
+    """The feed is served by its token, never by email"""
+    client = setup()
+    url = feed_url(client, 'user-b')
+    response = client.get(url)
+    assert response.status_code == 200, response.get_json()
+    assert 'Metformin' in response.get_data(as_text=True)
+    assert LONG_NAME.split()[0] not in response.get_data(as_text=True)
+
+    assert client.get('/api/medications/calendar.ics?email=b@example.com').status_code == 400
+    assert client.get('/api/medications/calendar.ics?token=guessed').status_code == 404
+
+
+def test_new_feed_url_revokes_the_old_one():
+    """Issuing a new URL stops the previous token from working"""
+    client = setup()
+    old_url = feed_url(client, 'user-a')
+    new_url = feed_url(client, 'user-a')
+    assert old_url != new_url
+    assert client.get(old_url).status_code == 404
+    assert client.get(new_url).status_code == 200
+
+
+def test_unchanged_feed_is_not_modified():
+    """Polling with the ETag gets a 304 until the user's rows change"""
+    client = setup()
+    url = feed_url(client, 'user-a')
+    first = client.get(url)
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag
+
+    again = client.get(url, headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.get_data() == b''
+
+    medications.supabase_service.store_ocr_result(
+        {'medications': {'added_or_changed': ['Atorvastatin 20 mg qhs'], 'deleted': []}}, email='a@example.com'
+    )
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert 'Atorvastatin' in changed.get_data(as_text=True)
+
+
+def test_feed_lines_are_folded():
+    """Long lines are folded at 75 octets and unfold to the original text"""
+    client = setup()
+    body = client.get(feed_url(client, 'user-a')).get_data(as_text=True)
+    lines = body.split('\r\n')
+    assert lines[-1] == '', 'feed does not end with CRLF'
+    assert all(len(line.encode('utf-8')) <= 75 for line in lines), max(lines, key=len)
+    assert any(line.startswith(' ') for line in lines), 'no line was folded'
+    assert LONG_NAME.split(' by mouth')[0] in body.replace('\r\n ', '')
+
+
+def test_history_is_the_logged_in_users():
+    """History needs a login and only covers the logged-in user's documents"""
+    client = setup()
+    assert client.get('/api/medications/history?email=b@example.com').status_code == 401
+
+    response = client.get('/api/medications/history?email=a@example.com', headers=auth_headers('user-b'))
+    assert response.status_code == 200, response.get_json()
+    names = [medication['name'] for medication in response.get_json()['medications']]
+    assert names and all('Metformin' in name for name in names), names
+
+
+if __name__ == "__main__":
+    run_tests("Testing medication routes", globals())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for the medication history timeline (no server needed)
+"""
+
+from datetime import datetime, timezone
+from app.services.medications_service import MedicationsService
+from app.services.medication_timeline import MedicationTimeline
+from run_tests import run_tests
+
+medications_service = MedicationsService()
+
+
+def record(record_id, created_at, added=(), deleted=()):
+    """An indexed row as MedicationIndex.records_for returns it"""
+    medications = medications_service.extract_medications_from_ocr(
+        {'medications': {'added_or_changed': list(added), 'deleted': list(deleted)}}
+    )
+    return {'id': record_id, 'email': 'patient@example.com', 'created_at': created_at, 'medications': medications}
+
+
+def test_dose_change_stays_active():
+    """A dose change ends the old strength and keeps the new one active"""
+    timeline = MedicationTimeline([
+        record(1, '2026-01-01T09:00:00+00:00', added=['Lisinopril 10 mg daily']),
+        record(2, '2026-02-01T09:00:00+00:00', added=['Lisinopril 20 mg daily'], deleted=['Lisinopril 10 mg daily'])
+    ], medications_service)
+    active = timeline.active_on('2026-03-01')
+    assert [interval['name'] for interval in active] == ['Lisinopril 20 mg'], active
+    assert active[0]['start'] == '2026-02-01T09:00:00+00:00', active[0]
+    history = timeline.history()
+    assert [(interval['name'], interval['status']) for interval in history] == [
+        ('Lisinopril 10 mg', 'discontinued'), ('Lisinopril 20 mg', 'active')
+    ], history
+    assert history[0]['end'] == '2026-02-01T09:00:00+00:00', history[0]
+
+
+def test_dose_change_in_first_document():
+    """A dose change in the first document still leaves the drug active"""
+    timeline = MedicationTimeline([
+        record(1, '2026-02-01T09:00:00+00:00', added=['Lisinopril 20 mg daily'], deleted=['Lisinopril 10 mg daily'])
+    ], medications_service)
+    assert [interval['name'] for interval in timeline.active_on('2026-03-01')] == ['Lisinopril 20 mg']
+
+
+def test_deletion_closes_interval():
+    """A later deletion closes the interval at that document's time"""
+    timeline = MedicationTimeline([
+        record(1, '2026-01-01', added=['Metformin 500 mg bid']),
+        record(2, '2026-01-15', deleted=['Metformin'])
+    ], medications_service)
+    assert len(timeline.active_on('2026-01-10')) == 1
+    assert timeline.active_on('2026-01-20') == []
+    assert len(timeline.active_between(datetime(2025, 12, 1, tzinfo=timezone.utc),
+                                       datetime(2026, 1, 2, tzinfo=timezone.utc))) == 1
+
+
+def test_repeated_mentions_extend_one_interval():
+    """Listing an active drug again does not open a second interval"""
+    timeline = MedicationTimeline([
+        record(1, '2026-01-01', added=['Albuterol 90 mcg']),
+        record(2, '2026-02-01', added=['Albuterol'])
+    ], medications_service)
+    history = timeline.history()
+    assert len(history) == 1, history
+    assert history[0]['source_ids'] == [1, 2], history[0]
+
+
+if __name__ == "__main__":
+    run_tests("Testing medication timeline", globals())
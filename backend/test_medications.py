@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test script for merging and scheduling medications across documents (no server needed)
+"""
+
+from datetime import datetime
+from app.services.dose_timeline import DoseTimeline
+from app.services.medications_service import MedicationsService
+from run_tests import run_tests
+
+medications_service = MedicationsService()
+
+
+def document_medications(medications, source_date, source_ocr_id):
+    """Medication entries of one document, tagged like the index tags them"""
+    entries = medications_service.extract_medications_from_ocr({'medications': medications})
+    for entry in entries:
+        entry.update(source_date=source_date, source_ocr_id=source_ocr_id)
+    return entries
+
+
+def test_dose_change_keeps_medication_active():
+    """A document adding a new strength and deleting the old one keeps the drug active"""
+    entries = document_medications(
+        {'added_or_changed': ['Lisinopril 20 mg daily'], 'deleted': ['Lisinopril 10 mg daily']},
+        '2026-03-01', 1
+    )
+    merged = medications_service.merge_medications(entries)
+    assert len(merged) == 1, merged
+    assert merged[0]['status'] == 'active', merged[0]
+    assert merged[0]['sig']['strength'] == '20 mg', merged[0]['sig']
+
+
+def test_later_document_wins():
+    """A deletion in a later document discontinues a drug added earlier"""
+    entries = (document_medications({'added_or_changed': ['Metformin 500 mg bid']}, '2026-01-10', 1)
+               + document_medications({'deleted': ['metformin']}, '2026-02-10', 2))
+    merged = medications_service.merge_medications(entries)
+    assert [entry['status'] for entry in merged] == ['discontinued'], merged
+    assert merged[0]['source_ids'] == [1, 2], merged[0]
+
+
+def test_same_document_order_does_not_matter():
+    """Deleted-before-added within one document merges the same way"""
+    entries = document_medications(
+        {'deleted': ['Lisinopril 10 mg daily'], 'added_or_changed': ['Lisinopril 20 mg daily']},
+        '2026-03-01', 1
+    )
+    merged = medications_service.merge_medications(list(reversed(entries)))
+    assert merged[0]['status'] == 'active', merged[0]
+
+
+def test_names_collapse_across_strengths():
+    """Strength tokens do not split one medication into several"""
+    entries = (document_medications({'added_or_changed': ['Albuterol 90 mcg']}, '2026-01-01', 1)
+               + document_medications({'added_or_changed': ['albuterol']}, '2026-01-02', 2))
+    merged = medications_service.merge_medications(entries)
+    assert len(merged) == 1, merged
+    assert merged[0]['source_ids'] == [1, 2], merged[0]
+
+
+
+def test_weekday_medications_are_scheduled_on_their_days():
+    """A Mon/Wed/Fri medication has doses on those days only, in every calendar form"""
+    warfarin = document_medications({'added_or_changed': ['Warfarin 5 mg on Mon Wed Fri']}, '2026-03-01', 1)
+    assert warfarin[0]['weekdays'] == [0, 2, 4] and warfarin[0]['frequency'].endswith('on Mon, Wed, Fri'), warfarin
+
+    # 2026-03-01 is a Sunday
+    events = medications_service.create_calendar_events(warfarin, '2026-03-01', 7)
+    days = [event['start']['dateTime'][:10] for event in events]
+    assert days == ['2026-03-02', '2026-03-04', '2026-03-06'], days
+
+    recurring = medications_service.create_calendar_events(warfarin, '2026-03-01', 7, recurring=True)
+    assert [(event['start']['dateTime'][:10], event['recurrence']) for event in recurring] == [
+        ('2026-03-02', ['RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR;COUNT=3'])
+    ], recurring
+
+    feed = ''.join(medications_service.iter_ical_feed(warfarin))
+    assert 'RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR' in feed and 'DTSTART;TZID=America/New_York:20260302' in feed
+
+    doses = DoseTimeline(warfarin).next_doses(now=datetime(2026, 3, 2, 23, 0), n=2)
+    assert [dose['date'] for dose in doses] == ['2026-03-04', '2026-03-06'], doses
+
+
+if __name__ == "__main__":
+    run_tests("Testing medication merging", globals())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test script for prompt compaction and streamed insight parsing (no server needed)
+"""
+
+import json
+from app.services.health_insights_service import compact_document, document_fingerprint, JsonArrayStream
+from run_tests import run_tests
+
+
+def compact(data, max_tokens=None):
+    return json.loads(compact_document(data, max_tokens=max_tokens)['text'])
+
+
+def test_uniform_review_of_systems_keeps_fields():
+    """An unremarkable review of systems is written once, with the systems it covers"""
+    document = compact({'review_of_systems': {'chest': 'unremarkable', 'ent': 'unremarkable',
+                                              'eyes': 'unremarkable'}})
+    assert document['review_of_systems'] == {'all': 'unremarkable', 'fields': ['chest', 'ent', 'eyes']}, document
+
+
+def test_other_sections_keep_identical_values():
+    """Identical values outside the review of systems keep their own keys"""
+    vitals = {'blood_pressure': '120/80', 'left_arm': '120/80', 'right_arm': '120/80'}
+    allergies = {'food': 'yes', 'drug': 'yes', 'environmental': 'yes'}
+    document = compact({'vitals': vitals, 'allergies': allergies})
+    assert document['vitals'] == vitals and document['allergies'] == allergies, document
+
+
+def test_value_wrappers_and_empty_fields():
+    """Value wrappers are unwrapped; empty and non-clinical fields are dropped"""
+    document = compact({'vitals': {'temperature': {'value': 98.6, 'raw': '98.6F'}, 'pulse_rate': 'N/A'},
+                        'source_quality_notes': 'Parsed', 'chief_complaint': '  Cough '})
+    assert document == {'vitals': {'temperature': 98.6}, 'chief_complaint': 'Cough'}, document
+
+
+def test_budget_drops_low_value_sections_first():
+    """Over budget, the review of systems goes before core sections"""
+    result = compact_document({'chief_complaint': 'Cough', 'review_of_systems': {'general': 'fatigue ' * 40}},
+                              max_tokens=20)
+    assert result['dropped'] == ['review_of_systems'], result
+    assert json.loads(result['text']) == {'chief_complaint': 'Cough'}, result
+
+
+def test_fingerprint_ignores_order_and_case():
+    """Fingerprints ignore list order, case and non-clinical fields"""
+    first = {'medications': {'added_or_changed': ['Albuterol', 'Lisinopril']}, 'email': 'a@example.com'}
+    second = {'medications': {'added_or_changed': ['lisinopril', 'ALBUTEROL']}}
+    assert document_fingerprint(first) == document_fingerprint(second)
+
+
+def test_stream_yields_each_insight_when_complete():
+    """Each insight is returned as soon as its closing brace arrives"""
+    text = '{"insights": [{"title": "A {x}", "description": "say \\"hi\\""}, {"title": "B", "description": "C"}]}'
+    reader = JsonArrayStream('insights')
+    items = [reader.feed(text[:40]), reader.feed(text[40:70]), reader.feed(text[70:])]
+    assert [[item['title'] for item in chunk] for chunk in items] == [[], ['A {x}'], ['B']], items
+
+
+if __name__ == "__main__":
+    run_tests("Testing prompt compaction", globals())
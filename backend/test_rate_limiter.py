@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test script for the request / token rate limiter (no server needed)
+"""
+
+import os
+import tempfile
+import time
+from multiprocessing import Process
+from app.utils.rate_limiter import RateLimiter
+from app.utils.shared_cache import SharedCache
+from run_tests import run_tests
+
+
+def cache_path():
+    return os.path.join(tempfile.mkdtemp(), 'shared_cache.bin')
+
+
+def test_burst_then_paced():
+    """A full bucket allows a burst of the per-minute quota, then calls wait for refill"""
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=100000)
+    assert all(limiter.acquire(timeout=0) for _ in range(60))
+    assert limiter.acquire(timeout=0.1) is False
+    started = time.time()
+    assert limiter.acquire(timeout=2)
+    assert 0.5 < time.time() - started < 1.5
+    assert limiter.stats()['timeouts'] == 1 and limiter.stats()['acquired'] == 61
+
+
+def test_token_quota_limits_large_calls():
+    """Calls are held back by the token quota as well as the request quota"""
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=600)
+    assert limiter.acquire(tokens=500, timeout=0)
+    assert limiter.acquire(tokens=500, timeout=0.5) is False
+    assert limiter.stats()['tokens_available'] < 200
+
+
+def take_all(path):
+    limiter = RateLimiter(requests_per_minute=5, tokens_per_minute=100000, cache=SharedCache(path))
+    for _ in range(5):
+        limiter.acquire(timeout=0)
+
+
+def test_workers_share_one_quota():
+    """Limiters on one shared cache draw from the same buckets, across processes"""
+    path = cache_path()
+    worker = Process(target=take_all, args=(path,))
+    worker.start()
+    worker.join()
+    limiter = RateLimiter(requests_per_minute=5, tokens_per_minute=100000, cache=SharedCache(path))
+    assert limiter.acquire(timeout=0.05) is False
+    assert limiter.stats()['shared'] is True and limiter.stats()['requests_available'] == 0
+
+
+def test_pause_holds_back_other_workers():
+    """A pause after a 429 in one worker delays the others"""
+    path = cache_path()
+    first = RateLimiter(requests_per_minute=100, tokens_per_minute=100000, cache=SharedCache(path))
+    second = RateLimiter(requests_per_minute=100, tokens_per_minute=100000, cache=SharedCache(path))
+    first.pause(0.3)
+    assert second.acquire(timeout=0.1) is False
+    started = time.time()
+    assert second.acquire(timeout=1)
+    assert time.time() - started > 0.1
+
+
+if __name__ == "__main__":
+    run_tests("Testing rate limiter", globals())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test script for the dose reminder scheduler (no server needed)
+"""
+
+import os
+import tempfile
+from datetime import datetime, timezone
+from app.services.medication_index import MedicationIndex
+from app.services.reminder_scheduler import ReminderScheduler, LocalReminderSink
+from run_tests import run_tests
+
+PLAN = [('Metformin 500 mg', '08:00')]
+
+
+def at(hour, minute=0, day=1):
+    return datetime(2026, 3, day, hour, minute, tzinfo=timezone.utc).timestamp()
+
+
+def scheduler(state_dir, sink=None):
+    return ReminderScheduler(
+        os.path.join(state_dir, 'reminders.json'),
+        sink or LocalReminderSink(os.path.join(state_dir, 'outbox.jsonl')),
+        medication_index=MedicationIndex(os.path.join(state_dir, 'medication_index.jsonl')),
+        timezone='UTC'
+    )
+
+
+class FailingSink:
+    def deliver(self, reminder):
+        raise RuntimeError('push service down')
+
+
+class CrashAfterDeliverySink(LocalReminderSink):
+    """Delivers, then the worker dies before recording it"""
+
+    def deliver(self, reminder):
+        super().deliver(reminder)
+        raise KeyboardInterrupt
+
+
+def test_reminder_fires_lead_minutes_before_the_dose():
+    """A dose reminder fires 15 minutes early, then the next day's is queued"""
+    reminders = scheduler(tempfile.mkdtemp())
+    reminders.set_plan('a@example.com', PLAN, now=at(7))
+    assert reminders.tick(now=at(7, 44)) == []
+    fired = reminders.tick(now=at(7, 45))
+    assert [reminder['dose_time'] for reminder in fired] == ['2026-03-01T08:00:00+00:00'], fired
+    assert reminders.stats()['pending'] == 1 and reminders.stats()['delivered'] == 1
+
+
+def test_restart_retries_failed_reminders():
+    """A reminder whose delivery failed is delivered by the next process"""
+    state_dir = tempfile.mkdtemp()
+    first = scheduler(state_dir, FailingSink())
+    first.set_plan('a@example.com', PLAN, now=at(7))
+    assert first.tick(now=at(7, 45)) == [] and first.stats()['inflight'] == 1
+
+    second = scheduler(state_dir)
+    second.load(now=at(7, 46))
+    fired = second.tick(now=at(7, 46))
+    assert [reminder['medication'] for reminder in fired] == ['Metformin 500 mg'], fired
+    assert second.stats()['inflight'] == 0
+
+
+def test_restart_does_not_repeat_delivered_reminders():
+    """An in-flight reminder the sink already has is counted as a duplicate, not delivered"""
+    state_dir = tempfile.mkdtemp()
+    first = scheduler(state_dir, CrashAfterDeliverySink(os.path.join(state_dir, 'outbox.jsonl')))
+    first.set_plan('a@example.com', PLAN, now=at(7))
+    try:
+        first.tick(now=at(7, 45))
+    except KeyboardInterrupt:
+        pass
+
+    second = scheduler(state_dir)
+    second.load(now=at(7, 46))
+    assert second.tick(now=at(7, 46)) == []
+    stats = second.stats()
+    assert (stats['delivered'], stats['duplicates'], stats['inflight']) == (0, 1, 0), stats
+    with open(os.path.join(state_dir, 'outbox.jsonl')) as outbox:
+        assert len(outbox.readlines()) == 1
+
+
+def test_restart_resumes_after_the_watermark():
+    """Reminders due while the process was down are sent once it is back"""
+    state_dir = tempfile.mkdtemp()
+    first = scheduler(state_dir)
+    first.set_plan('a@example.com', PLAN, now=at(7))
+    first.tick(now=at(7, 30))
+
+    second = scheduler(state_dir)
+    second.load(now=at(7, 50))
+    fired = second.tick(now=at(7, 50))
+    assert [reminder['dose_time'] for reminder in fired] == ['2026-03-01T08:00:00+00:00'], fired
+
+
+def test_stale_reminders_are_skipped():
+    """After a long outage, reminders older than max_catch_up are skipped, not sent late"""
+    state_dir = tempfile.mkdtemp()
+    first = scheduler(state_dir)
+    first.set_plan('a@example.com', PLAN, now=at(7))
+    first.tick(now=at(7, 30))
+
+    second = scheduler(state_dir)
+    second.load(now=at(12))
+    assert second.tick(now=at(12)) == []
+    stats = second.stats()
+    assert (stats['stale'], stats['delivered'], stats['pending']) == (1, 0, 1), stats
+    fired = second.tick(now=at(7, 45, day=2))
+    assert [reminder['dose_time'] for reminder in fired] == ['2026-03-02T08:00:00+00:00'], fired
+
+
+def test_replaced_plan_cancels_old_reminders():
+    """Changing a user's plan drops reminders of the old plan"""
+    reminders = scheduler(tempfile.mkdtemp())
+    reminders.set_plan('a@example.com', PLAN, now=at(7))
+    reminders.set_plan('a@example.com', [('Metformin 500 mg', '09:00')], now=at(7, 10))
+    assert reminders.tick(now=at(7, 45)) == []
+    assert [reminder['dose_time'] for reminder in reminders.tick(now=at(8, 45))] == ['2026-03-01T09:00:00+00:00']
+
+
+
+def test_weekday_doses_skip_other_days():
+    """A dose taken on certain weekdays is only reminded on those days"""
+    reminders = scheduler(tempfile.mkdtemp())
+    # 2026-03-01 is a Sunday; Mon/Wed only
+    reminders.set_plan('a@example.com', [('Warfarin 5 mg', '08:00', [0, 2])], now=at(7))
+    fired = [reminder['dose_time'][:10] for day in range(1, 8)
+             for reminder in reminders.tick(now=at(7, 45, day=day))]
+    assert fired == ['2026-03-02', '2026-03-04'], fired
+
+
+if __name__ == "__main__":
+    run_tests("Testing reminder scheduler", globals())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Test script for backend call timeouts, retries, hedging and the circuit breaker (no server needed)
+"""
+
+import threading
+import time
+from app.utils.resilience import (CircuitBreaker, CircuitOpenError, OperationRejected, OperationTimeout,
+                                  ResilientExecutor)
+from run_tests import run_tests
+
+
+def executor(**kwargs):
+    return ResilientExecutor('test', backoff_base=0.001, backoff_cap=0.001, **kwargs)
+
+
+def flaky(failures, result='ok'):
+    """fn that raises ConnectionError `failures` times, then returns result"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ConnectionError('reset')
+        return result
+    return fn, calls
+
+
+def test_reads_are_retried():
+    """Transient failures of an idempotent read are retried"""
+    fn, calls = flaky(2)
+    run = executor(max_retries=2)
+    assert run.call('read', fn, idempotent=True) == 'ok' and len(calls) == 3
+    assert run.counters['retries'] == 2, run.counters
+
+
+def test_writes_are_not_retried():
+    """A failing write is raised after one attempt"""
+    fn, calls = flaky(1)
+    try:
+        executor(max_retries=2).call('write', fn)
+        assert False, 'expected ConnectionError'
+    except ConnectionError:
+        pass
+    assert len(calls) == 1
+
+
+def test_api_errors_are_not_retried():
+    """Errors that are answers (not transient) are raised at once and do not trip the breaker"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise ValueError('bad filter')
+    run = executor(max_retries=2, breaker=CircuitBreaker(failure_threshold=1))
+    for _ in range(2):
+        try:
+            run.call('read', fn, idempotent=True)
+        except ValueError:
+            pass
+    assert len(calls) == 2 and run.breaker.state == 'closed'
+
+
+def test_timeout():
+    """A call past its operation timeout raises OperationTimeout"""
+    run = executor(timeouts={'slow': 0.05}, max_retries=0)
+    started = time.monotonic()
+    try:
+        run.call('slow', lambda: time.sleep(0.3))
+        assert False, 'expected OperationTimeout'
+    except OperationTimeout:
+        pass
+    assert time.monotonic() - started < 0.2
+    assert run.counters['timeouts'] == 1
+
+
+def test_breaker_opens_and_probes():
+    """After repeated failures calls fail fast, then one probe closes the breaker"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    run = executor(max_retries=0, breaker=breaker)
+    fn, calls = flaky(2)
+    for _ in range(2):
+        try:
+            run.call('read', fn)
+        except ConnectionError:
+            pass
+    try:
+        run.call('read', fn)
+        assert False, 'expected CircuitOpenError'
+    except CircuitOpenError:
+        pass
+    assert len(calls) == 2 and breaker.state == 'open'
+    time.sleep(0.06)
+    assert run.call('read', fn) == 'ok' and breaker.state == 'closed'
+
+
+def test_slow_read_is_hedged():
+    """A read slower than the recent p95 sends a duplicate that can win"""
+    run = executor(hedge_min_samples=3, hedge_min_delay=0.01, max_hedge_ratio=1.0)
+    for _ in range(3):
+        run.call('read', lambda: 'fast', idempotent=True)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.3)
+            return 'slow'
+        return 'hedge'
+    started = time.monotonic()
+    assert run.call('read', fn, idempotent=True) == 'hedge'
+    assert time.monotonic() - started < 0.2
+    assert (run.counters['hedges'], run.counters['hedge_wins']) == (1, 1), run.counters
+
+
+
+def test_abandoned_attempts_bound_the_operation():
+    """Timed-out attempts still running hold their slots; further calls are rejected at once"""
+    release = threading.Event()
+    calls = []
+
+    def stuck():
+        calls.append(1)
+        release.wait(5)
+        return 'late'
+
+    run = executor(timeouts={'slow': 0.02}, max_retries=0, max_in_flight=2)
+    for _ in range(2):
+        try:
+            run.call('slow', stuck)
+            assert False, 'expected OperationTimeout'
+        except OperationTimeout:
+            pass
+    started = time.monotonic()
+    try:
+        run.call('slow', stuck)
+        assert False, 'expected OperationRejected'
+    except OperationRejected:
+        pass
+    assert time.monotonic() - started < 0.01 and len(calls) == 2
+    assert run.call('other', lambda: 'ok') == 'ok'
+    assert run.metrics()['in_flight'].get('slow') == 2 and run.counters['rejected'] == 1, run.metrics()
+    assert run.breaker.state == 'closed'
+
+    release.set()
+    deadline = time.monotonic() + 1
+    while run.metrics()['in_flight'].get('slow') and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert run.call('slow', lambda: 'ok') == 'ok'
+
+
+def test_hedge_is_skipped_when_no_slot_is_free():
+    """A slow read at its in-flight limit waits for its own attempt instead of hedging"""
+    run = executor(hedge_min_samples=3, hedge_min_delay=0.01, max_hedge_ratio=1.0, max_in_flight=1)
+    for _ in range(3):
+        run.call('read', lambda: 'fast', idempotent=True)
+
+    def slow():
+        time.sleep(0.05)
+        return 'slow'
+    assert run.call('read', slow, idempotent=True) == 'slow'
+    assert run.counters['hedges'] == 0, run.counters
+
+
+if __name__ == "__main__":
+    run_tests("Testing backend call resilience", globals())
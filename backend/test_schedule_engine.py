@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test script for the vectorized dose schedule engine (no server needed)
+"""
+
+import random
+from app.services.medications_service import MedicationsService
+from app.services.schedule_engine import build_dose_schedule
+from run_tests import run_tests
+
+medications_service = MedicationsService()
+
+LINES = [
+    'Metformin 500 mg bid', 'Lisinopril 10 mg daily', 'Albuterol 2 puffs q4h prn', 'Tylenol 500 mg q6h',
+    'Warfarin 5 mg on Mon Wed Fri', 'Methotrexate 2.5 mg every Sunday', 'Insulin glargine 10 units qhs',
+    'Atorvastatin 20 mg', 'Amoxicillin 875 mg tid x 10 days', 'Alendronate 70 mg daily on Mondays'
+]
+
+
+def random_plan(rng):
+    lines = rng.sample(LINES, rng.randint(0, 5))
+    deleted = [line for line in LINES if line not in lines][:rng.randint(0, 2)]
+    return medications_service.extract_medications_from_ocr(
+        {'medications': {'added_or_changed': lines, 'deleted': deleted}}
+    )
+
+
+def test_matches_the_per_event_loop():
+    """Random plans, start days and horizons give exactly the per-event loop's events"""
+    rng = random.Random(5)
+    for _ in range(200):
+        medications = random_plan(rng)
+        start_date = f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        days = rng.randint(0, 30)
+        expected = list(medications_service.iter_calendar_events(medications, start_date, days))
+        assert medications_service.create_calendar_events(medications, start_date, days) == expected, \
+            (start_date, days, [medication['name'] for medication in medications])
+
+
+def test_patients_are_sliced_apart():
+    """Each patient's slice of a population schedule is that patient's own calendar"""
+    rng = random.Random(9)
+    plans = {f'patient{i}@example.com': random_plan(rng) for i in range(40)}
+    schedule = build_dose_schedule(plans, '2026-03-01', 14, medications_service)
+    for patient, medications in plans.items():
+        expected = list(medications_service.iter_calendar_events(medications, '2026-03-01', 14))
+        assert list(schedule.iter_events(patient)) == expected, patient
+    assert int(schedule.doses_per_patient().sum()) == len(schedule)
+
+
+def test_weekdays_are_masked():
+    """A Mon/Wed/Fri medication has three doses a week"""
+    warfarin = medications_service.extract_medications_from_ocr(
+        {'medications': {'added_or_changed': ['Warfarin 5 mg on Mon Wed Fri']}}
+    )
+    schedule = build_dose_schedule({'a': warfarin}, '2026-03-01', 14, medications_service)
+    # 2026-03-01 is a Sunday, so the first dose is on Monday the 2nd
+    assert str(schedule.at[0])[:10] == '2026-03-02', schedule.at
+    assert schedule.doses_per_day().tolist() == [1, 0, 1, 0, 1, 0, 0, 1, 0, 1, 0, 1], schedule.doses_per_day()
+
+
+if __name__ == "__main__":
+    run_tests("Testing dose schedule engine", globals())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test script for the host-wide shared cache (no server needed)
+"""
+
+import os
+import tempfile
+import time
+from multiprocessing import Process
+from app.utils.shared_cache import SharedCache, pack, unpack
+from run_tests import run_tests
+
+
+def cache_path():
+    return os.path.join(tempfile.mkdtemp(), 'shared_cache.bin')
+
+
+def test_pack_round_trip():
+    """Packed values unpack to the same data"""
+    value = {'insights': [{'title': 'Fever', 'score': -3, 'ratio': 0.25}], 'ok': True, 'none': None,
+             'raw': b'\x00\x01', 'big': 2 ** 40}
+    assert unpack(pack(value)) == value
+    assert len(pack(1)) == 2 and len(pack(-1)) == 2
+
+
+def set_in_child(path):
+    SharedCache(path).set('from-child', [1, 2, 3])
+
+
+def test_workers_share_entries():
+    """An entry set by one opened cache (or process) is read by another"""
+    path = cache_path()
+    first, second = SharedCache(path, slot_count=64, slot_size=512), SharedCache(path, slot_count=8, slot_size=64)
+    assert (second.slot_count, second.slot_size) == (64, 512), 'geometry comes from the file'
+    first.set('insights:abc', {'insights': ['A']})
+    assert second.get('insights:abc') == {'insights': ['A']}
+
+    writer = Process(target=set_in_child, args=(path,))
+    writer.start()
+    writer.join()
+    assert first.get('from-child') == [1, 2, 3]
+    assert first.delete('from-child') and second.get('from-child') is None
+
+
+def test_expired_entries_are_misses():
+    """An entry past its ttl is a miss; ttl 0 never expires"""
+    cache = SharedCache(cache_path(), slot_count=16, slot_size=256)
+    cache.set('short', 'value', ttl=0.05)
+    cache.set('forever', 'value', ttl=0)
+    time.sleep(0.1)
+    assert cache.get('short') is None and cache.get('forever') == 'value'
+
+
+def test_full_bucket_evicts_least_recently_used():
+    """A full bucket evicts its least recently used entry"""
+    cache = SharedCache(cache_path(), slot_count=4, slot_size=256, ways=4)
+    for key in 'abcd':
+        cache.set(key, key)
+    cache.get('a')
+    cache.set('e', 'e')
+    assert [key for key in 'abcde' if cache.get(key) is not None] == ['a', 'c', 'd', 'e']
+    assert cache.stats()['evictions'] == 1 and cache.stats()['entries'] == 4
+
+
+def test_large_values_are_compressed_or_skipped():
+    """Compressible values fit after compression; values that still do not fit are not cached"""
+    cache = SharedCache(cache_path(), slot_count=8, slot_size=256)
+    assert cache.set('repetitive', 'unremarkable ' * 100) and cache.get('repetitive') == 'unremarkable ' * 100
+    assert cache.set('random', os.urandom(1024)) is False and cache.get('random') is None
+
+
+def corrupt(cache, key):
+    """
+    Overwrite the stored payload of key with bytes that do not decode
+    """
+    key_bytes, key_hash = cache._key(key)
+    bucket = key_hash % cache.bucket_count
+    offset = cache._slot_offset(bucket, cache._find(bucket, key_hash, key_bytes))
+    value_len, key_len = cache.SLOT_HEADER.unpack_from(cache._map, offset)[3:5]
+    start = offset + cache.SLOT_HEADER.size + key_len
+    cache._map[start:start + value_len] = b'\xff' * value_len
+
+
+def test_corrupt_entries_are_cleared_misses():
+    """An entry that fails to decompress or decode is a miss and its slot is freed"""
+    cache = SharedCache(cache_path(), slot_count=16, slot_size=512)
+    cache.set('compressed', 'unremarkable ' * 20)
+    cache.set('plain', 'x')
+    corrupt(cache, 'compressed')
+    corrupt(cache, 'plain')
+    misses, entries = cache.stats()['misses'], cache.stats()['entries']
+
+    assert cache.get('compressed') is None and cache.get('plain') is None
+    assert cache.stats()['misses'] == misses + 2 and cache.stats()['entries'] == entries - 2, cache.stats()
+    cache.set('plain', 'x')
+    assert cache.get('plain') == 'x'
+
+
+if __name__ == "__main__":
+    run_tests("Testing shared cache", globals())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test script for parsing dose, route and frequency from medication lines (no server needed)
+"""
+
+from app.services.sig_parser import parse_sig, describe_frequency
+from run_tests import run_tests
+
+
+def fields(line, *keys):
+    sig = parse_sig(line)
+    return {key: sig[key] for key in keys}
+
+
+def test_strength_dose_route_frequency():
+    """Strength, countable dose, route, interval and prn are all read"""
+    sig = parse_sig("Albuterol 90 mcg 2 puffs inh q4h prn")
+    assert sig['name'] == 'Albuterol 90 mcg', sig
+    assert (sig['strength'], sig['dose'], sig['unit'], sig['route']) == ('90 mcg', 2, 'puff', 'inhaled'), sig
+    assert (sig['frequency'], sig['interval_hours'], sig['prn']) == ('q4h', 4, True), sig
+    assert sig['times'] == [] and describe_frequency(sig) == 'every 4 hours as needed', sig
+
+
+def test_duration_is_not_a_dose():
+    """A course length ("x 10 days", "for 2 weeks") is the duration, not the dose"""
+    assert fields("Amoxicillin 875 mg tid x 10 days", 'strength', 'dose', 'unit', 'frequency', 'duration') == {
+        'strength': '875 mg', 'dose': None, 'unit': None, 'frequency': 'tid', 'duration': '10 days'
+    }
+    assert fields("Prednisone 10 mg daily for 2 weeks", 'dose', 'duration') == {'dose': None, 'duration': '2 weeks'}
+    assert fields("Azithromycin 250 mg 1 tab po daily x5d", 'dose', 'unit', 'duration') == {
+        'dose': 1, 'unit': 'tablet', 'duration': '5 days'
+    }
+
+
+def test_quantity_after_frequency_is_not_a_dose():
+    """A bare number after the frequency (dispense quantity) is not taken as the dose"""
+    assert fields("Metformin 500 mg bid #60", 'dose', 'frequency') == {'dose': None, 'frequency': 'bid'}
+
+
+def test_fixed_slot_frequencies():
+    """Fixed-slot frequencies map to dose slots"""
+    assert parse_sig("Lisinopril 10 mg po daily")['timing'] == ['morning']
+    assert parse_sig("Metformin 500 mg twice a day")['timing'] == ['morning', 'evening']
+    assert parse_sig("Ibuprofen 400 mg 3 times a day")['frequency'] == 'tid'
+    assert parse_sig("Melatonin 3 mg at bedtime")['timing'] == ['bedtime']
+
+
+def test_number_in_name():
+    """A bare number right after the name stays part of it"""
+    sig = parse_sig("Vitamin B 12 1 tab daily")
+    assert sig['name'] == 'Vitamin B 12', sig
+    assert (sig['dose'], sig['unit']) == (1, 'tablet'), sig
+
+
+def test_plain_name():
+    """A line with no sig is only a name"""
+    sig = parse_sig("Lisinopril")
+    assert sig['name'] == 'Lisinopril' and sig['frequency'] is None and sig['times'] is None, sig
+    assert describe_frequency(sig) is None
+
+
+
+def test_leading_directions_are_not_the_name():
+    """Directions and a dose before the name are skipped, and kept in the instructions"""
+    sig = parse_sig("Take 1 tablet of Metformin twice daily")
+    assert sig['name'] == 'Metformin', sig
+    assert (sig['dose'], sig['unit'], sig['frequency']) == (1, 'tablet', 'bid'), sig
+    assert sig['instructions'] == 'Take 1 tablet twice daily', sig
+    assert parse_sig("Inhale 2 puffs of Albuterol q4h prn")['name'] == 'Albuterol'
+
+
+def test_weekday_lists():
+    """Weekday lists restrict the schedule and stay out of the name"""
+    sig = parse_sig("Warfarin 5 mg on Mon Wed Fri")
+    assert (sig['name'], sig['weekdays']) == ('Warfarin 5 mg', [0, 2, 4]), sig
+    assert describe_frequency(sig) == 'on Mon, Wed, Fri'
+    sig = parse_sig("Methotrexate 2.5 mg po every Sunday")
+    assert (sig['name'], sig['weekdays']) == ('Methotrexate 2.5 mg', [6]), sig
+    assert fields("Alendronate 70 mg daily on Mondays and Thursdays", 'frequency', 'weekdays') == {
+        'frequency': 'qd', 'weekdays': [0, 3]
+    }
+    assert parse_sig("Lisinopril 10 mg daily")['weekdays'] is None
+
+
+def test_insulin_units_are_the_dose():
+    """u / units / IU are a countable dose, not part of the name"""
+    for line in ("Insulin glargine 10 u sc qhs", "Insulin glargine 10 units sc qhs", "Insulin glargine 10IU sc qhs"):
+        assert fields(line, 'name', 'dose', 'unit', 'frequency') == {
+            'name': 'Insulin glargine', 'dose': 10, 'unit': 'unit', 'frequency': 'qhs'
+        }, line
+
+
+def test_overnight_interval_doses_are_marked():
+    """Interval doses after bedtime or before 06:00 are listed as overnight"""
+    assert parse_sig("Tylenol 500 mg q4h")['overnight'] == ['00:00', '04:00']
+    assert parse_sig("Tylenol 500 mg q6h")['overnight'] == ['02:00']
+    assert parse_sig("Amoxicillin 500 mg q12h")['overnight'] == []
+    assert parse_sig("Albuterol 2 puffs q4h prn")['overnight'] == []
+
+
+if __name__ == "__main__":
+    run_tests("Testing medication sig parsing", globals())
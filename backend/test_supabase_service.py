@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Test script for the Supabase services against the in-memory PostgREST
+stand-in (no Supabase project or server needed)
+"""
+
+import asyncio
+import os
+import tempfile
+from local_postgrest import LocalPostgrest
+from app.services.medication_index import MedicationIndex
+from app.services.supabase_service import SupabaseService
+from app.services.async_supabase_service import AsyncSupabaseService
+from run_tests import run_tests
+
+
+def information_rows():
+    return [
+        {'id': 1, 'email': 'a@example.com', 'created_at': '2026-01-01T09:00:00+00:00',
+         'info': {'chief_complaint': 'Cough',
+                  'medications': {'added_or_changed': ['Albuterol 90 mcg'], 'deleted': []}}},
+        {'id': 2, 'email': 'a@example.com', 'created_at': '2026-01-02T09:00:00+00:00',
+         'info': {'chief_complaint': 'Follow-up', 'medications': {'added_or_changed': [], 'deleted': []}}},
+        {'id': 3, 'email': 'b@example.com', 'created_at': '2026-01-03T09:00:00+00:00',
+         'info': {'chief_complaint': 'Diabetes', 'medications': {'added_or_changed': [], 'deleted': ['Metformin']}}},
+        {'id': 4, 'email': 'b@example.com', 'created_at': '2026-01-04T09:00:00+00:00',
+         'info': {'chief_complaint': 'Rash'}}
+    ]
+
+
+def services():
+    local = LocalPostgrest({'information': information_rows()})
+    index = MedicationIndex(os.path.join(tempfile.mkdtemp(), 'medication_index.jsonl'))
+    return local, index, SupabaseService(client=local.client(), medication_index=index)
+
+
+def test_medication_records_filtered_in_postgres():
+    """Only rows listing medications come back, projected to their medications"""
+    _, _, service = services()
+    result = service.get_medication_records()
+    assert result['success'], result
+    assert [row['id'] for row in result['data']] == [3, 1], result['data']
+    assert set(result['data'][0]) == {'id', 'email', 'created_at', 'medications'}, result['data'][0]
+    assert [row['id'] for row in service.get_medication_records(email='a@example.com')['data']] == [1]
+
+
+def test_medication_records_keyset_paging():
+    """before_id pages by id, so a row inserted meanwhile does not shift later pages"""
+    local, _, service = services()
+    first = service.get_medication_records(limit=1)['data']
+    service.store_ocr_result({'medications': {'added_or_changed': ['Aspirin'], 'deleted': []}})
+    second = service.get_medication_records(limit=1, before_id=first[-1]['id'])['data']
+    assert [row['id'] for row in first + second] == [3, 1], first + second
+
+
+def test_async_medication_records_match():
+    """The async service returns the same rows"""
+    local = LocalPostgrest({'information': information_rows()})
+    index = MedicationIndex(os.path.join(tempfile.mkdtemp(), 'medication_index.jsonl'))
+
+    async def records():
+        async with AsyncSupabaseService(client=local.async_client(), medication_index=index) as service:
+            return await service.get_medication_records()
+
+    result = asyncio.run(records())
+    assert [row['id'] for row in result['data']] == [3, 1], result
+
+
+def test_async_service_mirrors_the_sync_one():
+    """Every public SupabaseService method has an async counterpart"""
+    public = {name for name in dir(SupabaseService) if not name.startswith('_')}
+    missing = sorted(name for name in public if not hasattr(AsyncSupabaseService, name))
+    assert not missing, missing
+
+
+def test_async_insights_and_index_updates():
+    """The async service stores and reads insights, and keeps the index in step"""
+    local = LocalPostgrest({'information': information_rows()})
+    index = MedicationIndex(os.path.join(tempfile.mkdtemp(), 'medication_index.jsonl'))
+    index.rebuild([])
+
+    async def run():
+        async with AsyncSupabaseService(client=local.async_client(), medication_index=index) as service:
+            stored = await service.store_insights(1, {'insights': ['Cough'], 'fingerprint': 'abc'})
+            missing = await service.store_insights(99, {'insights': []})
+            read = await service.get_insights(1)
+            added = await service.store_ocr_result(
+                {'medications': {'added_or_changed': ['Aspirin 81 mg'], 'deleted': []}}, email='c@example.com')
+            return stored, missing, read, added
+
+    stored, missing, read, added = asyncio.run(run())
+    assert stored['success'] and not missing['success'], (stored, missing)
+    assert read['data']['insights'] == {'insights': ['Cough'], 'fingerprint': 'abc'}, read
+    assert [record['id'] for record in index.records_for('c@example.com')] == [added['data']['id']]
+
+
+def test_patch_indexes_row_with_email():
+    """A row that first gains medications through a patch is indexed under its email"""
+    local, index, service = services()
+    index.rebuild(service.get_medication_records()['data'])
+    result = service.update_ocr_results(updates=[
+        {'id': 2, 'info': {'medications': {'added_or_changed': ['Lisinopril 10 mg daily']}}}
+    ])
+    assert result['success'] and result['ids'] == [2], result
+    row = next(row for row in local.tables['information'] if row['id'] == 2)
+    assert row['info']['chief_complaint'] == 'Follow-up', row
+    records = index.records_for('a@example.com')
+    assert [(record['id'], record['created_at']) for record in records] == [
+        (1, '2026-01-01T09:00:00+00:00'), (2, '2026-01-02T09:00:00+00:00')
+    ], records
+
+
+def test_patch_null_removes_key():
+    """A null in the patch removes the key; clearing medications drops the row from the index"""
+    local, index, service = services()
+    index.rebuild(service.get_medication_records()['data'])
+    service.update_ocr_results(info_patch={'medications': None}, ids=[1])
+    row = next(row for row in local.tables['information'] if row['id'] == 1)
+    assert 'medications' not in row['info'], row
+    assert [record['id'] for record in index.records_for()] == [3]
+
+
+def test_patch_is_one_request():
+    """Patching many rows is a single rpc call, including rows whose info is null"""
+    local, index, service = services()
+    local.tables['information'].append({'id': 5, 'email': 'c@example.com',
+                                        'created_at': '2026-01-05T09:00:00+00:00', 'info': None})
+    before = local.request_count
+    result = service.update_ocr_results(updates=[
+        {'id': 1, 'info': {'medications': {'deleted': ['Albuterol']}}},
+        {'id': 5, 'info': {'chief_complaint': 'Back pain'}},
+        {'id': 9, 'info': {'chief_complaint': 'Nobody'}}
+    ])
+    assert local.request_count - before == 1, local.request_count - before
+    assert sorted(result['ids']) == [1, 5] and result['missing_ids'] == [9], result
+    rows = {row['id']: row for row in local.tables['information']}
+    assert rows[1]['info']['medications'] == {'added_or_changed': ['Albuterol 90 mcg'], 'deleted': ['Albuterol']}, rows[1]
+    assert rows[5]['info'] == {'chief_complaint': 'Back pain'}, rows[5]
+
+
+def test_filtered_patch_by_email_and_date():
+    """One info patch applies to every row matching the email and date range"""
+    local, _, service = services()
+    result = service.update_ocr_results(info_patch={'reviewed': True}, email='b@example.com',
+                                        start_date='2026-01-04', end_date='2026-01-04')
+    assert result['ids'] == [4], result
+    assert [row['id'] for row in local.tables['information'] if row['info'].get('reviewed')] == [4]
+    assert not service.update_ocr_results(info_patch={'reviewed': True})['success']
+
+
+def test_async_patch_is_one_request():
+    """The async service patches through the same single rpc call"""
+    local = LocalPostgrest({'information': information_rows()})
+    index = MedicationIndex(os.path.join(tempfile.mkdtemp(), 'medication_index.jsonl'))
+
+    async def patch():
+        async with AsyncSupabaseService(client=local.async_client(), medication_index=index) as service:
+            return await service.update_ocr_results(info_patch={'chief_complaint': 'Type 2 diabetes'}, ids=[3])
+
+    before = local.request_count
+    result = asyncio.run(patch())
+    assert result['ids'] == [3] and local.request_count - before == 1, result
+    row = next(row for row in local.tables['information'] if row['id'] == 3)
+    assert row['info']['chief_complaint'] == 'Type 2 diabetes' and row['info']['medications'], row
+
+
+def test_bulk_delete_updates_index():
+    """Deleted rows leave the table and the index"""
+    local, index, service = services()
+    index.rebuild(service.get_medication_records()['data'])
+    result = service.delete_ocr_results(email='b@example.com')
+    assert result['success'] and sorted(result['ids']) == [3, 4], result
+    assert [row['id'] for row in local.tables['information']] == [1, 2]
+    assert [record['id'] for record in index.records_for()] == [1]
+
+
+if __name__ == "__main__":
+    run_tests("Testing Supabase services", globals())
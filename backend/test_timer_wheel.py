@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test script for the hierarchical timer wheel (no server needed)
+"""
+
+import random
+from app.utils.timer_wheel import TimerWheel
+from run_tests import run_tests
+
+
+def test_timers_cascade_to_their_tick():
+    """Timers in higher levels move down and fire exactly on their tick"""
+    wheel = TimerWheel(0, levels=(4, 4, 4))
+    for tick in (1, 3, 4, 5, 15, 16, 17, 50, 63):
+        wheel.add(tick, tick)
+    fired = {}
+    for tick in range(1, 64):
+        for item in wheel.advance(tick):
+            fired[item] = tick
+    assert fired == {tick: tick for tick in (1, 3, 4, 5, 15, 16, 17, 50, 63)}, fired
+    assert len(wheel) == 0
+
+
+def test_matches_a_sorted_list():
+    """Random adds and advances return the same items, in tick order, as a naive scan"""
+    rng = random.Random(7)
+    wheel = TimerWheel(1000, levels=(8, 8, 8))
+    pending = []
+    current = 1000
+    for _ in range(300):
+        for _ in range(rng.randint(0, 5)):
+            tick = current + rng.randint(-2, 500)
+            wheel.add(tick, (tick, rng.random()))
+            pending.append((tick, len(pending)))
+        current += rng.randint(0, 40)
+        due = wheel.advance(current)
+        expected = sorted(timer for timer in pending if timer[0] <= current)
+        pending = [timer for timer in pending if timer[0] > current]
+        assert [item[0] for item in due] == [tick for tick, _ in expected], (current, due)
+        assert len(wheel) == len(pending)
+
+
+def test_past_ticks_fire_on_next_advance():
+    """A timer added for a tick already reached is returned by the next advance"""
+    wheel = TimerWheel(10)
+    wheel.add(7, 'late')
+    wheel.add(10, 'now')
+    assert wheel.advance(10) == ['late', 'now']
+    assert wheel.advance(11) == []
+
+
+def test_far_timers_wait_beyond_the_top_level():
+    """A tick beyond the top level's range still fires on that tick"""
+    wheel = TimerWheel(0, levels=(4, 4))
+    wheel.add(100, 'far')
+    fired = [tick for tick in range(1, 120) if wheel.advance(tick)]
+    assert fired == [100] and len(wheel) == 0, fired
+
+
+if __name__ == "__main__":
+    run_tests("Testing timer wheel", globals())
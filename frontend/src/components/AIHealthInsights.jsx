@@ -39,12 +39,31 @@ const AIHealthInsights = ({ analysisResults, onInsightsGenerated }) => {
     setInsightsError(null);
     setHealthInsights(null);
 
+    // Recommendations are generated alongside the streamed insights
+    generateHealthRecommendations();
+
     try {
       // Use the first analysis result's data for insights
       const documentData = analysisResults[0].data;
 
-      const result =
-        await healthInsightsService.generateHealthInsights(documentData);
+      // Rule-based insights paint instantly; the model's insights replace
+      // them one by one as soon as each is written
+      const result = await healthInsightsService.streamHealthInsights(
+        documentData,
+        insight =>
+          setHealthInsights(current => ({
+            insights: [
+              ...(current && !current.preview ? current.insights : []),
+              insight,
+            ],
+          })),
+        insights =>
+          setHealthInsights(current =>
+            current || insights.length === 0
+              ? current
+              : { insights, preview: true }
+          )
+      );
 
       if (result.success && result.data) {
         setHealthInsights(result.data);
@@ -91,7 +91,8 @@ const MedicationsToCalendar = () => {
         },
         body: JSON.stringify({
           start_date: new Date().toISOString().split('T')[0], // Today
-          duration_days: 7 // 7 days of events
+          duration_days: 7, // 7 days of events
+          recurring: true // One repeating event per dose time
         })
       });
 
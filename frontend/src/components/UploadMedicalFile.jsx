@@ -16,6 +16,7 @@ import {
   CheckCircle,
   Send,
 } from 'lucide-react';
+import AuthService from '../services/authService';
 
 const UploadMedicalFile = () => {
   const [dragActive, setDragActive] = useState(false);
@@ -109,6 +110,10 @@ const UploadMedicalFile = () => {
         'http://localhost:5005/api/upload/upload-pdf',
         {
           method: 'POST',
+          // Logged-in uploads are stored under the user's email
+          headers: AuthService.getToken()
+            ? { Authorization: `Bearer ${AuthService.getToken()}` }
+            : {},
           body: formData,
         }
       );
@@ -29,6 +29,7 @@ import {
 import UploadMedicalFile from '../components/UploadMedicalFile';
 import AIHealthInsights from '../components/AIHealthInsights';
 import MedicationsToCalendar from '../components/MedicationsToCalendar';
+import AuthService from '../services/authService';
 import {
   Accordion,
   AccordionContent,
@@ -159,6 +160,10 @@ const Dashboard = () => {
             `${API_BASE_URL}/api/upload/upload-pdf`,
             {
               method: 'POST',
+              // Logged-in uploads are stored under the user's email
+              headers: AuthService.getToken()
+                ? { Authorization: `Bearer ${AuthService.getToken()}` }
+                : {},
               body: formData,
             }
           );
@@ -69,6 +69,104 @@ export const healthInsightsService = {
     }
   },
 
+  /**
+   * Stream health insights as server-sent events; onPreview is called first
+   * with rule-based insights, then onInsight with each insight as soon as the
+   * model has written it
+   * @param {Object} documentData - The parsed document data from OCR
+   * @param {Function} onInsight - Called with each insight object
+   * @param {Function} onPreview - Called with the list of rule-based insights
+   * @returns {Promise<Object>} - The complete response, as from generateHealthInsights
+   */
+  async streamHealthInsights(documentData, onInsight, onPreview) {
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/health-insights/get-health-insights/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(documentData),
+      });
+
+      if (!response.ok) {
+        let errorMessage = 'Failed to generate health insights';
+        try {
+          const errorData = await response.json();
+          errorMessage = errorData.error || errorMessage;
+        } catch (parseError) {
+          console.error('Could not parse error response:', parseError);
+        }
+        throw new Error(errorMessage);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const rawEvent = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          let event = 'message';
+          let data = '';
+          for (const line of rawEvent.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+          }
+          const payload = JSON.parse(data);
+          if (event === 'preview') onPreview?.(payload.insights);
+          else if (event === 'insight') onInsight(payload);
+          else if (event === 'done') return payload;
+          else if (event === 'error') throw new Error(payload.error);
+        }
+      }
+      throw new Error('Health insights stream ended unexpectedly');
+    } catch (error) {
+      console.error('Health insights stream error:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Generate health insights and recommendations together; the backend runs
+   * both generations concurrently
+   * @param {Object} documentData - The parsed document data from OCR
+   * @returns {Promise<Object>} - data.insights and data.recommendations
+   */
+  async generateHealthSummary(documentData) {
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/health-insights/get-health-summary`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(documentData),
+      });
+
+      if (!response.ok) {
+        let errorMessage = 'Failed to generate health summary';
+        try {
+          const errorData = await response.json();
+          errorMessage = errorData.error || errorMessage;
+        } catch (parseError) {
+          console.error('Could not parse error response:', parseError);
+        }
+        throw new Error(errorMessage);
+      }
+
+      const result = await response.json();
+      return result;
+    } catch (error) {
+      console.error('Health summary service error:', error);
+      throw error;
+    }
+  },
+
   /**
    * Check health insights service status
    * @returns {Promise<Object>} - Service health status